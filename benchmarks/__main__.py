@@ -0,0 +1,67 @@
+import argparse
+import sys
+
+from . import runner
+
+
+# python -m benchmarks run [-k word] [-o results.json]
+# python -m benchmarks compare baseline.json current.json [-t 0.1]
+#
+# compare exits with status 1 when any benchmark regressed by more than the
+# threshold, so it can gate CI.
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run = commands.add_parser('run', help='run the benchmarks')
+    run.add_argument('-k', dest='select', action='append', default=[],
+                     help='only run benchmarks whose name contains this '
+                          '(repeatable)')
+    run.add_argument('-r', '--repeat', type=int, default=5)
+    run.add_argument('--min-time', type=float, default=0.05,
+                     help='seconds per repeat')
+    run.add_argument('-o', '--output', default=None,
+                     help='write results as JSON to this file')
+
+    compare = commands.add_parser('compare', help='compare two result files')
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('-t', '--threshold', type=float, default=0.1,
+                         help='allowed slowdown, as a fraction')
+    return parser.parse_args(argv)
+
+
+def _log(line):
+    sys.stderr.write(line + '\n')
+    sys.stderr.flush()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'run':
+        data = runner.run(select=args.select, repeat=args.repeat,
+                          min_time=args.min_time, log=_log)
+        if args.output is not None:
+            runner.save(data, args.output)
+        return 0
+
+    rows = runner.compare(runner.load(args.baseline),
+                          runner.load(args.current), args.threshold)
+    regressions = 0
+    for name, old, new, ratio, status in rows:
+        if status == 'regression':
+            regressions += 1
+        print('%-48s %10.1f %10.1f ns/op %6.2fx %s'
+              % (name, old * 1e9, new * 1e9, ratio, status))
+    if regressions:
+        print('%d of %d benchmarks regressed by more than %d%%'
+              % (regressions, len(rows), round(args.threshold * 100)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
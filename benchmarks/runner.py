@@ -0,0 +1,101 @@
+import json
+import platform
+import sys
+import time
+import timeit
+
+from clandestined import murmur3
+
+from .suite import BENCHMARKS
+
+
+# Results are written as
+#
+#   {"meta": {...}, "results": {name: {"seconds_per_op": ..., ...}}}
+#
+# where seconds_per_op is the best of several repeats, which is the least
+# noisy estimate on a shared machine.
+
+FORMAT_VERSION = 1
+
+
+def _time(function, repeat, min_time):
+    # grow the loop count until one repeat takes at least min_time
+    timer = timeit.Timer(function)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+    return number, [elapsed] + timer.repeat(max(0, repeat - 1), number)
+
+
+def run(select=None, repeat=5, min_time=0.05, log=None):
+    results = {}
+    for benchmark in BENCHMARKS:
+        for name, function, ops in benchmark():
+            if select and not any(word in name for word in select):
+                continue
+            number, times = _time(function, repeat, min_time)
+            per_op = min(times) / (number * ops)
+            results[name] = {
+                'seconds_per_op': per_op,
+                'ops': number * ops,
+                'repeat': len(times),
+            }
+            if log is not None:
+                log('%-48s %12.1f ns/op' % (name, per_op * 1e9))
+    return {
+        'version': FORMAT_VERSION,
+        'meta': {
+            'python': sys.version.split()[0],
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'native_murmur3': murmur3._native is not None,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        },
+        'results': results,
+    }
+
+
+def load(path):
+    handle = open(path)
+    try:
+        data = json.load(handle)
+    finally:
+        handle.close()
+    if data.get('version') != FORMAT_VERSION:
+        raise ValueError("%s is not a version %d benchmark result"
+                         % (path, FORMAT_VERSION))
+    return data
+
+
+def save(data, path):
+    handle = open(path, 'w')
+    try:
+        json.dump(data, handle, indent=2, sort_keys=True)
+        handle.write('\n')
+    finally:
+        handle.close()
+
+
+def compare(baseline, current, threshold=0.1):
+    # returns (name, old, new, ratio, status) rows for benchmarks present in
+    # both runs, status is 'regression' when new is slower than old by more
+    # than threshold, 'improvement' when faster by more than threshold.
+    rows = []
+    old_results = baseline['results']
+    new_results = current['results']
+    for name in sorted(set(old_results) & set(new_results)):
+        old = old_results[name]['seconds_per_op']
+        new = new_results[name]['seconds_per_op']
+        ratio = new / old if old else float('inf')
+        if ratio > 1 + threshold:
+            status = 'regression'
+        elif ratio < 1 / (1 + threshold):
+            status = 'improvement'
+        else:
+            status = ''
+        rows.append((name, old, new, ratio, status))
+    return rows
@@ -0,0 +1,151 @@
+from clandestined import Cluster
+from clandestined import MaglevHash
+from clandestined import RendezvousHash
+from clandestined import murmur3
+
+
+# Each benchmark is a generator of (name, function, ops) cases, where one
+# call of function performs ops operations. Names are stable across runs,
+# they are what two result files are compared by.
+
+BENCHMARKS = []
+
+KEY_LENGTHS = (4, 16, 64, 256, 4096)
+NODE_COUNTS = (3, 10, 100, 1000, 10000)
+LAYOUTS = ((1, 1), (3, 2), (3, 3), (5, 3))  # (zones, replicas)
+NODES_PER_ZONE = 10
+KEYS = ['key-%d' % (i,) for i in range(1000)]
+
+
+def benchmark(func):
+    BENCHMARKS.append(func)
+    return func
+
+
+def _hash_functions():
+    functions = [('pure', murmur3.pure_murmur3_32)]
+    if murmur3._native is not None:
+        functions.append(('c', murmur3._native.murmur3_32))
+    return functions
+
+
+def _cluster(zones, replicas):
+    config = {}
+    for zone in range(zones):
+        for node in range(NODES_PER_ZONE):
+            node_id = '%d' % (zone * NODES_PER_ZONE + node,)
+            config[node_id] = {'name': 'node%s.example.com' % (node_id,),
+                               'zone': 'zone%d' % (zone,)}
+    return Cluster(config, replicas=replicas)
+
+
+def _node_ids(count):
+    return ['node%d.example.com' % (i,) for i in range(count)]
+
+
+@benchmark
+def murmur3_32():
+    for name, hash_function in _hash_functions():
+        for length in KEY_LENGTHS:
+            key = 'x' * length
+
+            def run(hash_function=hash_function, key=key):
+                for i in range(100):
+                    hash_function(key)
+            yield 'murmur3_32[%s,len=%d]' % (name, length), run, 100
+
+
+@benchmark
+def find_node():
+    for count in NODE_COUNTS:
+        ring = RendezvousHash(_node_ids(count))
+        keys = KEYS[:max(10, 10000 // count)]
+
+        def run(find_node=ring.find_node, keys=keys):
+            for key in keys:
+                find_node(key)
+        yield 'find_node[nodes=%d]' % (count,), run, len(keys)
+
+
+@benchmark
+def engines():
+    for engine in ('murmur3_32', 'murmur3_128', 'mix64'):
+        for count in (10, 1000):
+            ring = RendezvousHash(_node_ids(count), engine=engine)
+            keys = KEYS[:max(10, 10000 // count)]
+
+            def run(find_node_many=ring.find_node_many, keys=keys):
+                find_node_many(keys)
+            yield ('find_node_many[engine=%s,nodes=%d]' % (engine, count),
+                   run, len(keys))
+
+
+@benchmark
+def maglev():
+    for count in (10, 1000):
+        ring = MaglevHash(_node_ids(count))
+
+        def run(find_node=ring.find_node):
+            for key in KEYS:
+                find_node(key)
+        yield 'maglev_find_node[nodes=%d]' % (count,), run, len(KEYS)
+
+        def build(nodes=_node_ids(count)):
+            # the table is filled on the first lookup
+            MaglevHash(nodes).find_node('key')
+        yield 'maglev_build[nodes=%d]' % (count,), build, 1
+
+
+@benchmark
+def find_nodes():
+    for zones, replicas in LAYOUTS:
+        cluster = _cluster(zones, replicas)
+
+        def run(find_nodes=cluster.find_nodes):
+            for key in KEYS:
+                find_nodes(key)
+        yield ('find_nodes[zones=%d,replicas=%d]' % (zones, replicas),
+               run, len(KEYS))
+
+
+@benchmark
+def find_nodes_by_index():
+    for zones, replicas in LAYOUTS:
+        cluster = _cluster(zones, replicas)
+
+        def run(find_nodes_by_index=cluster.find_nodes_by_index):
+            for partition_id in range(10):
+                for key_index in range(100):
+                    find_nodes_by_index(partition_id, key_index)
+        yield ('find_nodes_by_index[zones=%d,replicas=%d]' % (zones, replicas),
+               run, 1000)
+
+
+@benchmark
+def ring_churn():
+    for count in NODE_COUNTS:
+        ring = RendezvousHash(_node_ids(count))
+        # churn in the middle of the ring, not just at the end
+        nodes = _node_ids(count)[count // 2:count // 2 + 10]
+
+        def run(ring=ring, nodes=nodes):
+            for node in nodes:
+                ring.remove_node(node)
+            for node in nodes:
+                ring.add_node(node)
+        yield 'ring_churn[nodes=%d]' % (count,), run, 2 * len(nodes)
+
+
+@benchmark
+def cluster_churn():
+    for zones, replicas in LAYOUTS:
+        cluster = _cluster(zones, replicas)
+        members = [(node_id, zone) for zone in cluster.zones
+                   for node_id in cluster.zone_members[zone][:1]]
+
+        def run(cluster=cluster, members=members):
+            for node_id, zone in members:
+                cluster.remove_node(node_id, node_zone=zone)
+                cluster.add_node(node_id, node_zone=zone)
+        yield ('cluster_churn[zones=%d,replicas=%d]' % (zones, replicas),
+               run, 2 * len(members))
@@ -1,4 +1,7 @@
 from .clandestined import (
     Cluster,
+    ClusterSnapshot,
     RendezvousHash,
 )
+from .hierarchical import HierarchicalRendezvousHash
+from .maglev import MaglevHash
@@ -0,0 +1,242 @@
+import argparse
+import json
+import mmap
+import multiprocessing
+import struct
+import sys
+from collections import deque
+from itertools import islice
+
+from .clandestined import Cluster
+
+
+# Assign replicas to a stream of keys, one key per line:
+#
+#   python -m clandestined cluster.json keys.txt > assignments.txt
+#
+# Text output is a "key<TAB>replica1,replica2" line per key. Binary output
+# starts with a header of
+#
+#   "CLND" magic, uint32 format version, uint32 replicas, uint32 node count
+#   and, per node, a uint32 length followed by the UTF-8 node id,
+#
+# then holds one record of `replicas` uint32 node indexes per key, in input
+# order. Indexes refer to the header's node table, 0xffffffff means none.
+# All integers are little-endian.
+
+BINARY_MAGIC = b'CLND'
+BINARY_VERSION = 1
+BINARY_NONE = 0xffffffff
+
+# chunks waiting on the pool, per worker process, bounding memory use
+_PENDING_PER_PROCESS = 4
+
+# set in each worker process by _init_worker
+_worker = {}
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m clandestined',
+        description='assign replicas to keys read one per line')
+    parser.add_argument('config',
+                        help='cluster config JSON, node id to '
+                             '{"name", "zone", "weight"}')
+    parser.add_argument('keys', nargs='?', default=None,
+                        help='file of keys, read through mmap '
+                             '(default: stdin)')
+    parser.add_argument('-r', '--replicas', type=int, default=2)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('-p', '--processes', type=int, default=None,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('-c', '--chunk-size', type=int, default=10000,
+                        help='keys routed per task')
+    parser.add_argument('-b', '--binary', action='store_true',
+                        help='write compact binary records')
+    parser.add_argument('-o', '--output', default=None,
+                        help='output file (default: stdout)')
+    return parser.parse_args(argv)
+
+
+def _decode(line):
+    if line.endswith(b'\n'):
+        line = line[:-1]
+    if line.endswith(b'\r'):
+        line = line[:-1]
+    return line.decode('utf-8')
+
+
+def node_table(cluster):
+    return sorted(cluster.nodes, key=str)
+
+
+def binary_header(cluster, nodes):
+    header = [BINARY_MAGIC,
+              struct.pack('<III', BINARY_VERSION, cluster.replicas, len(nodes))]
+    for node in nodes:
+        node = str(node).encode('utf-8')
+        header.append(struct.pack('<I', len(node)))
+        header.append(node)
+    return b''.join(header)
+
+
+def format_text(keys, assignments):
+    return u''.join(
+        u'%s\t%s\n' % (key, u','.join(u'' if node is None else u'%s' % (node,)
+                                      for node in nodes))
+        for key, nodes in zip(keys, assignments)).encode('utf-8')
+
+
+def format_binary(assignments, indexes):
+    values = [BINARY_NONE if node is None else indexes[node]
+              for nodes in assignments for node in nodes]
+    return struct.pack('<%dI' % (len(values),), *values)
+
+
+def route(cluster, keys, binary, indexes=None):
+    assignments = cluster.find_nodes_many(keys)
+    if binary:
+        return format_binary(assignments, indexes)
+    return format_text(keys, assignments)
+
+
+def _init_worker(cluster, binary, path):
+    _worker['cluster'] = cluster
+    _worker['binary'] = binary
+    _worker['indexes'] = dict((node, index) for index, node
+                              in enumerate(node_table(cluster)))
+    if path is not None:
+        # each worker maps the key file itself, so tasks are only offsets
+        _worker['keys'] = _open_keys(path)
+
+
+def _route_keys(keys):
+    return route(_worker['cluster'], keys, _worker['binary'],
+                 _worker['indexes'])
+
+
+def _route_span(span):
+    start, end = span
+    return _route_keys(_split_keys(_worker['keys'][start:end]))
+
+
+def _split_keys(data):
+    lines = data.split(b'\n')
+    if lines[-1] == b'':
+        lines.pop()
+    return [_decode(line) for line in lines]
+
+
+def _spans(data, chunk_bytes):
+    # (start, end) byte ranges of data, each ending on a line boundary
+    start = 0
+    size = len(data)
+    while start < size:
+        end = data.find(b'\n', min(start + chunk_bytes, size) - 1)
+        if end == -1:
+            end = size
+        else:
+            end += 1
+        yield start, end
+        start = end
+
+
+def _key_chunks(stream, chunk_size):
+    lines = iter(stream.readline, b'')
+    while True:
+        chunk = [_decode(line) for line in islice(lines, chunk_size)]
+        if not chunk:
+            break
+        yield chunk
+
+
+def _open_keys(path):
+    handle = open(path, 'rb')
+    try:
+        return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        # empty files can't be mapped
+        return b''
+    finally:
+        handle.close()
+
+
+def run(cluster, keys_path, stdin, output, processes=None, chunk_size=10000,
+        binary=False):
+    nodes = node_table(cluster)
+    indexes = dict((node, index) for index, node in enumerate(nodes))
+    if binary:
+        output.write(binary_header(cluster, nodes))
+
+    if keys_path is not None:
+        data = _open_keys(keys_path)
+        # ~16 bytes a key is a fair guess for spans of chunk_size keys
+        tasks = _spans(data, chunk_size * 16)
+    else:
+        tasks = _key_chunks(stdin, chunk_size)
+
+    if processes == 1:
+        for task in tasks:
+            if keys_path is not None:
+                start, end = task
+                task = _split_keys(data[start:end])
+            output.write(route(cluster, task, binary, indexes))
+        return
+
+    work = _route_span if keys_path is not None else _route_keys
+    pool = multiprocessing.Pool(processes, _init_worker,
+                                (cluster, binary, keys_path))
+    try:
+        # results are written in input order, with a bounded number of
+        # chunks in flight so multi-GB inputs stream through.
+        limit = _PENDING_PER_PROCESS * (processes or
+                                        multiprocessing.cpu_count())
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.apply_async(work, (task,)))
+            if len(pending) >= limit:
+                output.write(pending.popleft().get())
+        while pending:
+            output.write(pending.popleft().get())
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def load_config(path):
+    handle = open(path)
+    try:
+        return json.load(handle)
+    finally:
+        handle.close()
+
+
+def main(argv=None, stdin=None, stdout=None):
+    args = parse_args(argv)
+    if args.processes is not None and args.processes < 1:
+        raise SystemExit("--processes must be at least 1")
+    if args.chunk_size < 1:
+        raise SystemExit("--chunk-size must be at least 1")
+    cluster = Cluster(load_config(args.config), replicas=args.replicas,
+                      seed=args.seed)
+    if stdin is None:
+        stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+    if args.output is not None:
+        output = open(args.output, 'wb')
+    elif stdout is not None:
+        output = stdout
+    else:
+        output = getattr(sys.stdout, 'buffer', sys.stdout)
+    try:
+        run(cluster, args.keys, stdin, output, processes=args.processes,
+            chunk_size=args.chunk_size, binary=args.binary)
+    finally:
+        if args.output is not None:
+            output.close()
+        else:
+            output.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import math
+
+
+class BoundedLoad(object):
+
+    # Consistent hashing with bounded loads over rendezvous rings. loads is a
+    # live count per node that callers keep up to date with add and release
+    # as they assign and drop work. find_node walks a key's preference order
+    # and takes the first node under its bound, so the result only depends
+    # on the key, the ring and the loads at the time of the lookup.
+    #
+    # A node's bound is its capacity when one is given for it, otherwise
+    # ceil(load_factor * (ring load + 1) * weight / ring weight): the average
+    # share of the ring's load, counting the key being placed, scaled by the
+    # node's weight and by load_factor, which is 1 + epsilon.
+    #
+    # Lookups that name the ring's zone and version, as Cluster's do, use a
+    # running total of the zone's load that add, release and set_load keep
+    # up to date, rebuilt when the version changes. Other lookups sum the
+    # ring's loads each time, so loads should only be changed through those
+    # methods.
+
+    def __init__(self, load_factor=1.25, capacity=None):
+        if load_factor < 1:
+            raise ValueError("load_factor must be at least 1, not %s"
+                             % (load_factor))
+        self.load_factor = load_factor
+        # None, one capacity for every node, or a dict of per node capacities
+        # where missing nodes fall back to the load factor bound
+        self.capacity = capacity
+        self.loads = {}
+        # [version, load, weights, total weight, nodes] of each zone looked
+        # up by version, and the zone each of those nodes is counted in
+        self._zones = {}
+        self._node_zones = {}
+
+    def load(self, node):
+        return self.loads.get(node, 0)
+
+    def _set(self, node, load):
+        previous = self.loads.get(node, 0)
+        if load:
+            self.loads[node] = load
+        else:
+            self.loads.pop(node, None)
+        if node in self._node_zones:
+            self._zones[self._node_zones[node]][1] += load - previous
+
+    def add(self, node, amount=1):
+        self._set(node, self.loads.get(node, 0) + amount)
+
+    def release(self, node, amount=1):
+        self._set(node, max(self.loads.get(node, 0) - amount, 0))
+
+    def set_load(self, node, load):
+        self._set(node, load)
+
+    def reset(self):
+        self.loads = {}
+        self._zones = {}
+        self._node_zones = {}
+
+    def _capacity(self, node):
+        capacity = self.capacity
+        if isinstance(capacity, dict):
+            return capacity.get(node)
+        return capacity
+
+    def _ring_load(self, ring, zone=None, version=None):
+        # (load, weights, total weight) of the ring, which every load factor
+        # bound on it shares
+        if self.capacity is not None and not isinstance(self.capacity, dict):
+            return None
+        if version is not None:
+            tracked = self._zones.get(zone)
+            if tracked is None or tracked[0] != version:
+                tracked = self._track(ring, zone, version)
+            return tracked[1], tracked[2], tracked[3]
+        loads = self.loads
+        total = 0
+        if loads:
+            total = sum(loads.get(node, 0) for node in ring.nodes)
+        weights = getattr(ring, 'weights', None)
+        if weights:
+            return total, weights, sum(weights.get(node, 1.0)
+                                       for node in ring.nodes)
+        return total, None, float(len(ring.nodes))
+
+    def _track(self, ring, zone, version):
+        # starts a running total for the zone's ring at this version
+        previous = self._zones.get(zone)
+        if previous is not None:
+            for node in previous[4]:
+                if self._node_zones.get(node) == zone:
+                    del self._node_zones[node]
+        nodes = list(ring.nodes)
+        total, weights, weight_total = self._ring_load(ring)
+        tracked = [version, total, weights, weight_total, nodes]
+        self._zones[zone] = tracked
+        for node in nodes:
+            self._node_zones[node] = zone
+        return tracked
+
+    def _bound(self, node, ring_load):
+        capacity = self._capacity(node)
+        if capacity is not None:
+            return capacity
+        total, weights, weight_total = ring_load
+        weight = weights.get(node, 1.0) if weights else 1.0
+        return int(math.ceil(
+            self.load_factor * (total + 1) * weight / weight_total))
+
+    def bound(self, ring, node):
+        return self._bound(node, self._ring_load(ring))
+
+    def find_node(self, ring, key, down=None, zone=None, version=None):
+        # nodes in down are passed over, unless every node is down. zone and
+        # version name the ring and its current nodes and weights, see above.
+        if not ring.nodes:
+            return None
+        ring_load = self._ring_load(ring, zone, version)
+        # the unbounded winner is nearly always under its bound, so it is
+        # checked with the ring's fast lookup before ranking every node.
+        if not down:
+            winner = ring.find_node(key)
+            if self.load(winner) < self._bound(winner, ring_load):
+                return winner
+        # when every node is at its bound the one with the most room left,
+        # or least over, wins, earliest in the preference order first.
+        best = None
+        best_room = None
+        for node in ring.iter_nodes(key):
+            if down and node in down:
+                continue
+            room = self._bound(node, ring_load) - self.load(node)
+            if room > 0:
+                return node
+            if best_room is None or room > best_room:
+                best, best_room = node, room
+        if best is None:
+            return self.find_node(ring, key, None, zone, version)
+        return best
@@ -0,0 +1,102 @@
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = None
+
+
+class _LinkedEntries(object):
+
+    # The few OrderedDict operations LookupCache uses, for Python 2.6, which
+    # has no OrderedDict: a dict of links in a circular list kept in
+    # insertion order, oldest first, so every operation is constant time.
+
+    def __init__(self):
+        self._links = {}
+        self._root = root = []
+        root[:] = [root, root, None, None]
+
+    def __len__(self):
+        return len(self._links)
+
+    def __setitem__(self, key, value):
+        link = self._links.get(key)
+        if link is not None:
+            link[3] = value
+            return
+        root = self._root
+        last = root[0]
+        last[1] = root[0] = self._links[key] = [last, root, key, value]
+
+    def pop(self, key):
+        previous, following, key, value = self._links.pop(key)
+        previous[1] = following
+        following[0] = previous
+        return value
+
+    def popitem(self, last=True):
+        if not self._links:
+            raise KeyError('dictionary is empty')
+        link = self._root[0] if last else self._root[1]
+        key = link[2]
+        return key, self.pop(key)
+
+    def clear(self):
+        self._links.clear()
+        root = self._root
+        root[:] = [root, root, None, None]
+
+
+class LookupCache(object):
+
+    # A bounded LRU of lookup results tagged with the topology version they
+    # were computed against. The first lookup made against a newer version
+    # drops every entry, so callers never have to invalidate by hand.
+
+    def __init__(self, maxsize=1024):
+        if maxsize < 1:
+            raise ValueError("Cache size must be at least 1, got %s" % (maxsize))
+        self.maxsize = maxsize
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = (_LinkedEntries() if OrderedDict is None
+                         else OrderedDict())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, version):
+        if version != self.version:
+            self.clear()
+            self.version = version
+        try:
+            value = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self._entries[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value, version):
+        if version != self.version:
+            return
+        self._entries[key] = value
+        while len(self._entries) > self.maxsize:
+            try:
+                self._entries.popitem(last=False)
+            except KeyError:
+                break
+
+    def clear(self):
+        self._entries.clear()
+
+    def info(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'version': self.version,
+        }
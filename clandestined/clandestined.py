@@ -1,95 +1,772 @@
 
+import copy
+import heapq
+import math
+from array import array
 from collections import defaultdict
+from functools import partial
+from itertools import islice
+from multiprocessing.pool import ThreadPool
 
 from . import murmur3
+from .bounded import BoundedLoad
+from .cache import LookupCache
+from .engines import MURMUR3_32
+from .engines import get_engine
+from .stats import LookupStats
+from .stats import RingStats
+from .stats import clock
+
+
+# bytes per packed prefix state, see _murmur3.prefix_state
+_STATE_SIZE = 12
+
+# smallest batch find_nodes_many hands to a worker thread
+_WORKER_CHUNK = 4096
+
+
+def _native_murmur3():
+    # the extension's ring helpers hash with the C murmur3_32, so they are
+    # only used while murmur3.murmur3_32 hasn't been swapped out.
+    native = murmur3._native
+    if native is not None and murmur3.murmur3_32 is native.murmur3_32:
+        return native
+    return None
+
+
+def _weighted_score(score, weight):
+    # logarithmic weighted rendezvous: the hash is mapped into (0, 1) so that
+    # for a fixed weight the score is strictly increasing in the hash.
+    return weight / -math.log((score + 0.5) / 4294967296.0)
 
 
 class RendezvousHash(object):
 
-    def __init__(self, nodes=None, seed=0):
+    # nodes, _prefixes, _states and _weights run in parallel and _index maps
+    # each node to its position. Removal moves the last node into the gap,
+    # so membership changes never shift or rescan the rest of the ring, and
+    # lookups never depend on node order.
+    __slots__ = ('nodes', 'seed', 'weights', 'stats', 'engine', '_index',
+                 '_prefixes', '_states', '_weights')
+
+    def __init__(self, nodes=None, seed=0, weights=None, engine=None):
         self.nodes = []
         self.seed = seed
+        self.weights = {}
+        # the hash engine that scores keys against nodes, see engines.py.
+        # Lookups with the default murmur3_32 engine don't go through it.
+        self.engine = get_engine(engine)
+        # LookupStats while instrumentation is enabled, see enable_stats
+        self.stats = None
+        self._index = {}
+        # each node's "<node>-" prefix, and the engine's state after hashing
+        # it packed in node order, so a lookup only hashes the key bytes per
+        # node.
+        self._prefixes = []
+        self._states = bytearray()
+        self._weights = array('d')
         if nodes is not None:
-            self.nodes = nodes
-        self.hash_function = lambda x: murmur3.murmur3_32(x, seed)
+            for node in nodes:
+                self.add_node(node)
+        if weights is not None:
+            for node, weight in weights.items():
+                self.set_weight(node, weight)
+
+    @classmethod
+    def _from_arrays(cls, nodes, seed, weights, states=None):
+        # a ring over already packed weights and prefix states, e.g. slices
+        # of a mapped topology file, which are copied on the first change.
+        ring = cls.__new__(cls)
+        ring.nodes = list(nodes)
+        ring.seed = seed
+        ring.stats = None
+        ring.engine = MURMUR3_32
+        ring._index = dict((node, index)
+                           for index, node in enumerate(ring.nodes))
+        ring._prefixes = ["%s-" % (str(node),) for node in ring.nodes]
+        ring._weights = weights
+        ring.weights = dict((node, weight)
+                            for node, weight in zip(ring.nodes, weights)
+                            if weight != 1.0)
+        if states is None:
+            states = bytearray()
+            for prefix in ring._prefixes:
+                states += ring._prefix_state(prefix)
+        ring._states = states
+        return ring
+
+    def _writable(self):
+        if not isinstance(self._states, bytearray):
+            self._states = bytearray(self._states)
+        if not isinstance(self._weights, array):
+            self._weights = array('d', self._weights)
+
+    def __getstate__(self):
+        state = dict((name, getattr(self, name)) for name in self.__slots__)
+        if not isinstance(self._states, bytearray):
+            state['_states'] = bytearray(self._states)
+        if not isinstance(self._weights, array):
+            state['_weights'] = array('d', self._weights)
+        # a callback may not pickle, and counts belong to this process
+        state['stats'] = None
+        return state
+
+    def __setstate__(self, state):
+        # rings pickled before engines existed used murmur3_32
+        self.engine = MURMUR3_32
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def __len__(self):
+        return len(self.nodes)
 
-    def add_node(self, node):
-        if node not in self.nodes:
+    def __contains__(self, node):
+        return node in self._index
+
+    def hash_function(self, key):
+        # looked up on every call rather than bound at init, so rings stay
+        # picklable and follow a swapped out murmur3.murmur3_32.
+        return murmur3.murmur3_32(key, self.seed)
+
+    def _prefix_state(self, prefix):
+        if self.engine is not MURMUR3_32:
+            return self.engine.node_state(prefix, self.seed)
+        if murmur3._native is None:
+            return b''
+        return murmur3._native.prefix_state(prefix, self.seed)
+
+    @staticmethod
+    def _weight(weight):
+        weight = float(weight)
+        if not weight > 0:
+            raise ValueError("Node weight must be positive, got %s" % (weight))
+        return weight
+
+    # _states and _weights grow and shrink in place, in amortized constant
+    # time, before the rest of the ring changes. A concurrent find_node_many
+    # may hold an export of either, which makes resizing it fail with
+    # BufferError, so it is copied and swapped in whole instead and the
+    # ring is never left half changed.
+
+    def _grow(self, state):
+        try:
+            self._states += state
+        except BufferError:
+            self._states = self._states + state
+        try:
+            self._weights.append(1.0)
+        except BufferError:
+            weights = self._weights[:]
+            weights.append(1.0)
+            self._weights = weights
+
+    def _shrink(self, index, size):
+        # drops the last node's state and weight, moving them to index
+        last = len(self.nodes) - 1
+        states = self._states
+        moved = states[last * size:]
+        try:
+            del states[last * size:]
+        except BufferError:
+            states = self._states = states[:last * size]
+        weights = self._weights
+        moved_weight = weights[last]
+        try:
+            weights.pop()
+        except BufferError:
+            weights = self._weights = weights[:last]
+        if index != last:
+            # a write in place, which exports don't prevent
+            states[index * size:(index + 1) * size] = moved
+            weights[index] = moved_weight
+
+    def add_node(self, node, weight=1.0):
+        if node not in self._index:
+            weight = self._weight(weight)
+            self._writable()
+            prefix = "%s-" % (str(node),)
+            self._grow(self._prefix_state(prefix))
+            self._index[node] = len(self.nodes)
             self.nodes.append(node)
+            self._prefixes.append(prefix)
+            self.set_weight(node, weight)
 
     def remove_node(self, node):
-        if node in self.nodes:
-            self.nodes.remove(node)
-        else:
+        if node not in self._index:
             raise ValueError("No such node %s to remove" % (node))
+        self._writable()
+        index = self._index[node]
+        self._shrink(index, len(self._states) // len(self.nodes))
+        del self._index[node]
+        last = len(self.nodes) - 1
+        if index != last:
+            moved = self.nodes[last]
+            self._index[moved] = index
+            self.nodes[index] = moved
+            self._prefixes[index] = self._prefixes[last]
+        self.nodes.pop()
+        self._prefixes.pop()
+        self.weights.pop(node, None)
+
+    def set_weight(self, node, weight):
+        if node not in self._index:
+            raise ValueError("No such node %s to weight" % (node))
+        weight = self._weight(weight)
+        self._writable()
+        self._weights[self._index[node]] = weight
+        # only non-default weights are kept, an empty dict means the ring
+        # scores by raw hash exactly as an unweighted ring always has.
+        if weight == 1.0:
+            self.weights.pop(node, None)
+        else:
+            self.weights[node] = weight
+
+    def enable_stats(self, callback=None):
+        self.stats = LookupStats(callback)
+        return self.stats
+
+    def disable_stats(self):
+        self.stats = None
+
+    def score(self, node, key):
+        engine = self.engine
+        if engine is MURMUR3_32:
+            score = self.hash_function("%s-%s" % (str(node), str(key)))
+        else:
+            score = engine.score(self.seed, "%s-" % (str(node),), str(key))
+        if self.weights:
+            return engine.weighted(score, self.weights.get(node, 1.0))
+        return score
+
+    def copy(self):
+        ring = RendezvousHash.__new__(RendezvousHash)
+        ring.nodes = list(self.nodes)
+        ring.seed = self.seed
+        ring.weights = dict(self.weights)
+        ring.stats = None
+        ring.engine = self.engine
+        ring._index = dict(self._index)
+        ring._prefixes = list(self._prefixes)
+        ring._states = bytearray(self._states)
+        ring._weights = array('d', self._weights)
+        return ring
+
+    def _scores(self, key):
+        engine = self.engine
+        if engine is not MURMUR3_32:
+            scores = engine.scores(self, key)
+            if self.weights:
+                return [engine.weighted(score, weight)
+                        for score, weight in zip(scores, self._weights)]
+            return scores
+        native = _native_murmur3()
+        if native is not None:
+            scores = native.scores(self._states, str(key))
+        else:
+            key = str(key)
+            hash_function = self.hash_function
+            scores = [hash_function(prefix + key) for prefix in self._prefixes]
+        if self.weights:
+            return [_weighted_score(score, weight)
+                    for score, weight in zip(scores, self._weights)]
+        return scores
 
     def find_node(self, key):
+        if self.stats is not None:
+            return self._find_node_stats(key)
+        if self.engine is not MURMUR3_32:
+            return self._find_node_tied(key)[0]
+        native = _native_murmur3()
+        if native is not None:
+            if not self.nodes:
+                return None
+            index, tied = native.find_node(
+                self._states, str(key), self._weights if self.weights else None)
+            if tied:
+                return self._tie_break(key)
+            return self.nodes[index]
         high_score = -1
         winner = None
-        for node in self.nodes:
-            score = self.hash_function("%s-%s" % (str(node), str(key)))
+        for node, score in zip(self.nodes, self._scores(key)):
             if score > high_score:
                 (high_score, winner) = (score, node)
             elif score == high_score:
                 (high_score, winner) = (score, max(str(node), str(winner)))
         return winner
 
+    def find_node_many(self, keys):
+        if self.stats is not None:
+            return self._find_node_many_stats(keys)
+        if self.engine is not MURMUR3_32 or _native_murmur3() is not None:
+            keys = list(keys)
+            if not self.nodes:
+                return [None] * len(keys)
+            nodes = self.nodes
+            indexes = self._find_indexes(keys)
+            return [nodes[index] if index >= 0 else self._tie_break(key)
+                    for key, index in zip(keys, indexes)]
+        return [self.find_node(key) for key in keys]
+
+    # The instrumented lookups. They are kept apart so that find_node and
+    # find_node_many only pay one attribute check while stats are disabled.
+
+    def _find_node_tied(self, key):
+        # (winner, whether the high score was tied)
+        if not self.nodes:
+            return None, False
+        native = _native_murmur3()
+        if self.engine is not MURMUR3_32:
+            index, tied = self.engine.find_node(self, key)
+        elif native is not None:
+            index, tied = native.find_node(
+                self._states, str(key), self._weights if self.weights else None)
+        else:
+            scores = self._scores(key)
+            high_score = max(scores)
+            index = scores.index(high_score)
+            tied = scores.count(high_score) > 1
+        if tied:
+            return self._tie_break(key), True
+        return self.nodes[index], False
+
+    def _find_node_stats(self, key):
+        stats = self.stats
+        start = clock()
+        winner, tied = self._find_node_tied(key)
+        elapsed = clock() - start
+        stats.add_node(winner)
+        if tied:
+            stats.add_tie()
+        stats.add_lookup(key, winner, elapsed)
+        return winner
+
+    def _find_node_many_stats(self, keys):
+        stats = self.stats
+        keys = list(keys)
+        start = clock()
+        if self.nodes and (self.engine is not MURMUR3_32 or
+                           _native_murmur3() is not None):
+            nodes = self.nodes
+            indexes = self._find_indexes(keys)
+            found = [(nodes[index], False) if index >= 0
+                     else (self._tie_break(key), True)
+                     for key, index in zip(keys, indexes)]
+        else:
+            found = [self._find_node_tied(key) for key in keys]
+        elapsed = clock() - start
+        winners = []
+        for winner, tied in found:
+            stats.add_node(winner)
+            if tied:
+                stats.add_tie()
+            winners.append(winner)
+        stats.add_lookups(keys, winners, elapsed)
+        return winners
+
+    def _find_indexes(self, keys):
+        # every key's winner as a node position, a tied winner at i is
+        # stored as -1 - i and needs _tie_break
+        return self.engine.find_node_many(self, keys)
+
+    def _tie_break(self, key):
+        # several nodes share the high score, the winner is the highest str()
+        scores = self._scores(key)
+        high_score = max(scores)
+        return max(str(node) for node, score in zip(self.nodes, scores)
+                   if score == high_score)
+
+    # nodes with equal scores are ordered by str(node), highest first, in
+    # both find_nodes and iter_nodes.
+    def find_nodes(self, key, n):
+        scores = self._scores(key)
+        nodes = self.nodes
+        best = heapq.nlargest(n, range(len(scores)), key=scores.__getitem__)
+        if not best:
+            return []
+        low = scores[best[-1]]
+        if scores.count(low) > 1:
+            # ties at the cut-off are settled by str(node), not by position
+            tied = [index for index, score in enumerate(scores) if score == low]
+            tied.sort(key=lambda index: str(nodes[index]), reverse=True)
+            best = [index for index in best if scores[index] != low]
+            best.extend(tied[:n - len(best)])
+        best.sort(key=lambda index: (scores[index], str(nodes[index])),
+                  reverse=True)
+        return [nodes[index] for index in best]
+
+    def iter_nodes(self, key):
+        scores = self._scores(key)
+        nodes = list(self.nodes)
+        heap = [(-score, index) for index, score in enumerate(scores)]
+        heapq.heapify(heap)
+        while heap:
+            score, index = heapq.heappop(heap)
+            if heap and heap[0][0] == score:
+                tied = [index]
+                while heap and heap[0][0] == score:
+                    tied.append(heapq.heappop(heap)[1])
+                tied.sort(key=lambda index: str(nodes[index]), reverse=True)
+                for index in tied:
+                    yield nodes[index]
+            else:
+                yield nodes[index]
+
 
 class Cluster(object):
 
-    def __init__(self, cluster_config=None, replicas=2, seed=0):
-        self.seed = seed
+    # clusters pickled before hash engines had none
+    engine = None
 
-        def RendezvousHashConstructor():
-            return RendezvousHash(nodes=None, seed=self.seed)
+    def __init__(self, cluster_config=None, replicas=2, seed=0,
+                 ring_class=RendezvousHash, cache_size=None, engine=None):
+        self.seed = seed
+        self.ring_class = ring_class
+        # the hash engine name every ring is made with, None for the ring
+        # class's default
+        self.engine = engine
+        # bumped by every topology change, cached lookups from an older
+        # version are discarded.
+        self.version = 0
+        self.cache = None
+        if cache_size is not None:
+            self.cache = LookupCache(cache_size)
 
         self.replicas = replicas
         self.nodes = {}
         self.zones = []
         self.zone_members = defaultdict(list)
-        self.rings = defaultdict(RendezvousHashConstructor)
+        # a partial rather than a closure over self keeps clusters picklable,
+        # engine is left out unless given so any ring class can be used.
+        ring_args = {'nodes': None, 'seed': seed}
+        if engine is not None:
+            ring_args['engine'] = engine
+        self.rings = defaultdict(partial(ring_class, **ring_args))
+        # the version at which each zone's ring last changed, so snapshots
+        # can share the rings that didn't.
+        self._ring_versions = {}
+        self._snapshot = None
+        # the last published snapshot, for readers that must not lock
+        self.published = None
+        # LookupStats while instrumentation is enabled, see enable_stats
+        self.stats = None
+        self._ring_stats = None
+        # BoundedLoad while bounded-load lookups are enabled, see
+        # enable_bounded_load
+        self.bounded_load = None
+        # PartitionTable of find_nodes_by_index winners, see
+        # enable_partition_table
+        self.partition_table = None
+        # node ids lookups route around, see mark_down
+        self.down = set()
 
         if cluster_config is not None:
             for node, node_data in cluster_config.items():
                 name = node_data.get('name', None)
                 zone = node_data.get('zone', None)
-                self.add_node(node, node_name=name, node_zone=zone)
+                weight = node_data.get('weight', 1.0)
+                self.add_node(node, node_name=name, node_zone=zone,
+                              node_weight=weight)
+
+    def __getstate__(self):
+        # a callback may not pickle, and counts belong to this process
+        state = self.__dict__.copy()
+        state['stats'] = None
+        state['_ring_stats'] = None
+        return state
 
     def add_zone(self, zone):
         if zone not in self.zones:
             self.zones.append(zone)
             self.zones = sorted(self.zones)
+            self.version += 1
+            if self.partition_table is not None:
+                self.partition_table.add_zone(zone)
 
     def remove_zone(self, zone):
         if zone in self.zones:
             self.zones.remove(zone)
             for member in self.zone_members[zone]:
-                self.nodes.remove(member)
+                del self.nodes[member]
             self.zones = sorted(self.zones)
             del self.rings[zone]
             del self.zone_members[zone]
+            self._ring_versions.pop(zone, None)
+            self.version += 1
+            if self.partition_table is not None:
+                self.partition_table.remove_zone(zone)
         else:
             raise ValueError("No such zone %s to remove" % (zone))
 
-    def add_node(self, node_id, node_zone=None, node_name=None):
-        if node_id in self.nodes.keys():
+    def add_node(self, node_id, node_zone=None, node_name=None,
+                 node_weight=1.0):
+        if node_id in self.nodes:
             raise ValueError('Node with name %s already exists', node_id)
         self.add_zone(node_zone)
-        self.rings[node_zone].add_node(node_id)
+        ring = self.rings[node_zone]
+        ring.add_node(node_id, weight=node_weight)
+        if self._ring_stats is not None and hasattr(ring, 'stats'):
+            ring.stats = self._ring_stats
         self.nodes[node_id] = node_name
         self.zone_members[node_zone].append(node_id)
+        self.version += 1
+        self._ring_versions[node_zone] = self.version
+        if self.partition_table is not None:
+            self.partition_table.add_node(node_zone, ring, node_id)
 
     def remove_node(self, node_id, node_name=None, node_zone=None):
-        self.rings[node_zone].remove_node(node_id)
+        ring = self.rings[node_zone]
+        ring.remove_node(node_id)
         del self.nodes[node_id]
         self.zone_members[node_zone].remove(node_id)
+        self.down.discard(node_id)
+        self.version += 1
+        self._ring_versions[node_zone] = self.version
+        if self.partition_table is not None:
+            self.partition_table.remove_node(node_zone, ring, node_id)
         if len(self.zone_members[node_zone]) == 0:
             self.remove_zone(node_zone)
 
+    def set_node_weight(self, node_id, node_weight, node_zone=None):
+        if node_zone not in self.rings:
+            raise ValueError("No such zone %s to weight" % (node_zone))
+        ring = self.rings[node_zone]
+        ring.set_weight(node_id, node_weight)
+        self.version += 1
+        self._ring_versions[node_zone] = self.version
+        if self.partition_table is not None:
+            self.partition_table.set_weight(node_zone, ring, node_id)
+
+    def mark_down(self, node_id):
+        # lookups return the next best live node in node_id's zone in its
+        # place until mark_up. The rings, the topology version and cached
+        # lookups are left alone, so marking is constant time.
+        if node_id not in self.nodes:
+            raise ValueError("No such node %s to mark down" % (node_id))
+        self.down.add(node_id)
+
+    def mark_up(self, node_id):
+        if node_id not in self.nodes:
+            raise ValueError("No such node %s to mark up" % (node_id))
+        self.down.discard(node_id)
+
+    def _is_down(self, node):
+        down = self.down
+        if node in down:
+            return True
+        # a tie-break winner is the str() of the node id it stands for
+        return node not in self.nodes and any(str(node_id) == node
+                                              for node_id in down)
+
+    def _live_winner(self, ring, key, winner):
+        # winner, or the next best live node in ring when it is marked down.
+        # A ring without one keeps its winner.
+        if self._is_down(winner):
+            down = self.down
+            for candidate in ring.iter_nodes(key):
+                if candidate not in down:
+                    return candidate
+        return winner
+
+    def _live_nodes(self, key, offset, nodes):
+        # replaces the replicas marked down with the next best live node in
+        # their zone
+        zones = self.zones
+        for i, node in enumerate(nodes):
+            ring = self.rings[zones[(i + offset) % len(zones)]]
+            nodes[i] = self._live_winner(ring, key, node)
+        return nodes
+
+    def enable_stats(self, callback=None):
+        # rings report ties to the cluster's stats, which counts everything
+        # else itself.
+        self.stats = LookupStats(callback)
+        self._ring_stats = RingStats(self.stats)
+        for ring in self.rings.values():
+            if hasattr(ring, 'stats'):
+                ring.stats = self._ring_stats
+        return self.stats
+
+    def disable_stats(self):
+        self.stats = None
+        self._ring_stats = None
+        for ring in self.rings.values():
+            if hasattr(ring, 'stats'):
+                ring.stats = None
+
+    def enable_bounded_load(self, load_factor=1.25, capacity=None):
+        # find_nodes skips replicas over their bound in each zone. Callers
+        # report assignments to the returned BoundedLoad's add and release.
+        self.bounded_load = BoundedLoad(load_factor, capacity)
+        return self.bounded_load
+
+    def disable_bounded_load(self):
+        self.bounded_load = None
+
+    def enable_partition_table(self, partitions, key_indexes=1):
+        # find_nodes_by_index answers from a precomputed table for partition
+        # ids below partitions and key indexes below key_indexes. Topology
+        # changes update it in place.
+        from .partitions import PartitionTable
+        table = PartitionTable(partitions, key_indexes)
+        table.build(self)
+        self.partition_table = table
+        return table
+
+    def disable_partition_table(self):
+        self.partition_table = None
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if (snapshot is None or snapshot.version != self.version or
+                snapshot.down != self.down):
+            snapshot = ClusterSnapshot(self, snapshot)
+            self._snapshot = snapshot
+        return snapshot
+
+    def publish(self):
+        # a single reference assignment, so readers of self.published see
+        # either the old topology or the new one and never a mix of both.
+        self.published = self.snapshot()
+        return self.published
+
+    def compile(self, path):
+        from .topology import compile_cluster
+        compile_cluster(self, path)
+
+    @classmethod
+    def load(cls, path, mmap=True, cache_size=None):
+        from .topology import load_cluster
+        return load_cluster(path, mmap=mmap, cache_size=cache_size)
+
+    def distribution(self, keys):
+        from .distribution import distribution
+        return distribution(self, keys)
+
+    def copy(self):
+        cluster = Cluster(replicas=self.replicas, seed=self.seed,
+                          ring_class=self.ring_class, engine=self.engine)
+        for zone in self.zones:
+            ring = self.rings[zone]
+            for node_id in self.zone_members[zone]:
+                cluster.add_node(node_id, node_zone=zone,
+                                 node_name=self.nodes[node_id],
+                                 node_weight=ring.weights.get(node_id, 1.0))
+        cluster.down = set(self.down)
+        return cluster
+
+    def _plan(self, keys, trial, zone, changed):
+        # yields (key, old_replicas, new_replicas) for keys whose replicas
+        # differ between this cluster and trial. When zone is given only that
+        # zone's ring differs, and changed(key, winner) returns the new winner
+        # for a key whose old winner in the zone was winner.
+        keys = iter(keys)
+        while True:
+            chunk = list(islice(keys, 1024))
+            if not chunk:
+                break
+            if zone is None:
+                old = self.find_nodes_many(chunk)
+                new = trial.find_nodes_many(chunk)
+                for key, old_nodes, new_nodes in zip(chunk, old, new):
+                    if old_nodes != new_nodes:
+                        yield key, old_nodes, new_nodes
+                continue
+            zone_count = len(self.zones)
+            slot = self.zones.index(zone)
+            for key, old_nodes in zip(chunk, self.find_nodes_many(chunk)):
+                offset = sum(map(ord, key)) % zone_count
+                new_nodes = None
+                for i in range(self.replicas):
+                    if (i + offset) % zone_count != slot:
+                        continue
+                    winner = changed(key, old_nodes[i])
+                    if winner != old_nodes[i]:
+                        if new_nodes is None:
+                            new_nodes = list(old_nodes)
+                        new_nodes[i] = winner
+                if new_nodes is not None:
+                    yield key, old_nodes, new_nodes
+
+    def plan_add_node(self, keys, node_id, node_zone=None, node_name=None,
+                      node_weight=1.0):
+        if node_id in self.nodes:
+            raise ValueError('Node with name %s already exists', node_id)
+        ring = self.rings.get(node_zone)
+        if ring is None or not hasattr(ring, 'score'):
+            # a new zone changes every key's zone offsets, so compare against
+            # a full trial cluster instead.
+            trial = self.copy()
+            trial.add_node(node_id, node_zone=node_zone, node_name=node_name,
+                           node_weight=node_weight)
+            return self._plan(keys, trial, None, None)
+
+        trial_ring = ring.copy()
+        trial_ring.add_node(node_id, weight=node_weight)
+        members = set(ring.nodes)
+
+        def changed(key, winner):
+            # rendezvous only needs the new node's score against the live
+            # winner's. A tie-break winner, or a down one from a zone without
+            # live nodes, is looked up again.
+            if winner not in members or self._is_down(winner):
+                return self._live_winner(trial_ring, key,
+                                         trial_ring.find_node(key))
+            score = trial_ring.score(node_id, key)
+            high_score = trial_ring.score(winner, key)
+            if score > high_score:
+                return node_id
+            elif score == high_score:
+                return max(str(node_id), str(winner))
+            return winner
+
+        return self._plan(keys, None, node_zone, changed)
+
+    def plan_remove_node(self, keys, node_id, node_name=None, node_zone=None):
+        if node_id not in self.zone_members.get(node_zone, ()):
+            raise ValueError("No such node %s to remove" % (node_id))
+        ring = self.rings[node_zone]
+        if len(self.zone_members[node_zone]) == 1 or not hasattr(ring, 'score'):
+            # removing the zone's last member removes the zone too
+            trial = self.copy()
+            trial.remove_node(node_id, node_zone=node_zone)
+            return self._plan(keys, trial, None, None)
+
+        trial_ring = ring.copy()
+        trial_ring.remove_node(node_id)
+
+        def changed(key, winner):
+            # only keys the removed node won need rescoring
+            if winner == node_id or winner == str(node_id):
+                return self._live_winner(trial_ring, key,
+                                         trial_ring.find_node(key))
+            return winner
+
+        return self._plan(keys, None, node_zone, changed)
+
     def node_name(self, node_id):
         return self.nodes.get(node_id, None)
 
     def find_nodes(self, key, offset=None):
+        if self.bounded_load is not None:
+            return self._find_nodes_bounded(key, offset)
+        stats = self.stats
+        if stats is not None:
+            start = clock()
+        cache = self.cache
+        if cache is not None:
+            cache_key = (key, offset, self.replicas)
+            cached = cache.get(cache_key, self.version)
+            if cached is not None:
+                nodes = list(cached)
+                if self.down:
+                    if offset is None:
+                        offset = sum(ord(char) for char in key) % \
+                            len(self.zones)
+                    nodes = self._live_nodes(key, offset, nodes)
+                if stats is not None:
+                    self._record(stats, [key], [offset], [nodes],
+                                 clock() - start)
+                return nodes
         nodes = []
         if offset is None:
             offset = sum(ord(char) for char in key) % len(self.zones)
@@ -97,9 +774,181 @@ class Cluster(object):
             zone = self.zones[(i + offset) % len(self.zones)]
             ring = self.rings[zone]
             nodes.append(ring.find_node(key))
+        # the cache holds the winners with every node up, so marking nodes
+        # down or up never invalidates it.
+        if cache is not None:
+            cache.put(cache_key, tuple(nodes), self.version)
+        if self.down:
+            nodes = self._live_nodes(key, offset, nodes)
+        if stats is not None:
+            self._record(stats, [key], [offset], [nodes], clock() - start)
         return nodes
 
+    def _find_nodes_bounded(self, key, offset):
+        # results depend on the loads at the time, so they aren't cached
+        stats = self.stats
+        if stats is not None:
+            start = clock()
+        if offset is None:
+            offset = sum(ord(char) for char in key) % len(self.zones)
+        bounded_load = self.bounded_load
+        down = self.down or None
+        nodes = []
+        for i in range(self.replicas):
+            zone = self.zones[(i + offset) % len(self.zones)]
+            nodes.append(bounded_load.find_node(
+                self.rings[zone], key, down, zone,
+                self._ring_versions.get(zone)))
+        if stats is not None:
+            self._record(stats, [key], [offset], [nodes], clock() - start)
+        return nodes
+
+    def find_nodes_many(self, keys, workers=None):
+        if self.bounded_load is not None:
+            return [self.find_nodes(key) for key in keys]
+        stats = self.stats
+        if stats is not None:
+            start = clock()
+        keys = list(keys)
+        if workers is not None and workers > 1 and len(keys) > _WORKER_CHUNK:
+            # the rings score each chunk in the extension with the GIL
+            # released, so the chunks are routed in parallel. map() keeps
+            # the results in input order.
+            size = max(_WORKER_CHUNK, -(-len(keys) // (workers * 4)))
+            chunks = [keys[start:start + size]
+                      for start in range(0, len(keys), size)]
+            pool = ThreadPool(min(workers, len(chunks)))
+            try:
+                results = pool.map(self.find_nodes_many, chunks)
+            finally:
+                pool.close()
+                pool.join()
+            return [nodes for result in results for nodes in result]
+        zone_count = len(self.zones)
+        offsets = [sum(map(ord, key)) % zone_count for key in keys]
+        # a key's winner in a zone doesn't depend on which replica slot asked
+        # for it, so each ring resolves the keys that need it in one batch.
+        wanted = [[] for zone in self.zones]
+        for position, offset in enumerate(offsets):
+            for i in range(min(self.replicas, zone_count)):
+                wanted[(i + offset) % zone_count].append(position)
+        winners = []
+        for zone, positions in zip(self.zones, wanted):
+            found = self.rings[zone].find_node_many(
+                [keys[position] for position in positions])
+            winners.append(dict(zip(positions, found)))
+        results = [[winners[(i + offset) % zone_count][position]
+                    for i in range(self.replicas)]
+                   for position, offset in enumerate(offsets)]
+        if self.down:
+            is_down = self._is_down
+            for key, offset, nodes in zip(keys, offsets, results):
+                for node in nodes:
+                    if is_down(node):
+                        self._live_nodes(key, offset, nodes)
+                        break
+        if stats is not None:
+            self._record(stats, keys, offsets, results, clock() - start)
+        return results
+
+    def _record(self, stats, keys, offsets, results, elapsed):
+        zones = self.zones
+        zone_count = len(zones)
+        for key, offset, nodes in zip(keys, offsets, results):
+            if offset is None:
+                offset = sum(ord(char) for char in key)
+            for i, node in enumerate(nodes):
+                stats.add_node(node)
+                stats.add_zone(zones[(i + offset) % zone_count])
+        if len(keys) == 1:
+            stats.add_lookup(keys[0], list(results[0]), elapsed)
+        else:
+            stats.add_lookups(keys, results, elapsed)
+
     def find_nodes_by_index(self, partition_id, key_index):
+        table = self.partition_table
+        # stats and bounded loads need the lookup itself
+        if (table is not None and self.stats is None and
+                self.bounded_load is None):
+            position = table.position(partition_id, key_index)
+            if position is not None:
+                zones = self.zones
+                offset = partition_id + key_index % len(zones)
+                winners = table.winners
+                nodes = [winners[zones[(i + offset) % len(zones)]][position]
+                         for i in range(self.replicas)]
+                if self.down:
+                    nodes = self._live_nodes(table.keys[position], offset,
+                                             nodes)
+                return nodes
         offset = int(partition_id) + int(key_index) % len(self.zones)
         key = "%s-%s" % (partition_id, key_index)
         return self.find_nodes(key, offset=offset)
+
+
+def _copy_ring(ring):
+    if hasattr(ring, 'copy'):
+        return ring.copy()
+    return copy.deepcopy(ring)
+
+
+class ClusterSnapshot(Cluster):
+
+    # A frozen copy of a Cluster's topology that can be read from any number
+    # of threads without locking, since nothing ever changes it. Rings whose
+    # zone didn't change since the previous snapshot are shared with it, the
+    # rest are copied. Lookups and plans work as on a Cluster, copy() gives
+    # a mutable Cluster to build the next topology from.
+
+    def __init__(self, cluster, previous=None):
+        rings = {}
+        for zone in cluster.zones:
+            version = cluster._ring_versions.get(zone)
+            if (previous is not None and zone in previous.rings and
+                    previous._ring_versions.get(zone) == version):
+                rings[zone] = previous.rings[zone]
+            elif zone in cluster.rings:
+                rings[zone] = _copy_ring(cluster.rings[zone])
+            else:
+                rings[zone] = cluster.rings.default_factory()
+        state = {
+            'seed': cluster.seed,
+            'ring_class': cluster.ring_class,
+            'engine': cluster.engine,
+            'version': cluster.version,
+            'cache': None,
+            'replicas': cluster.replicas,
+            'nodes': dict(cluster.nodes),
+            'zones': tuple(cluster.zones),
+            'zone_members': dict((zone, tuple(cluster.zone_members[zone]))
+                                 for zone in cluster.zones),
+            'rings': rings,
+            '_ring_versions': dict(cluster._ring_versions),
+            '_snapshot': None,
+            'published': None,
+            'stats': None,
+            '_ring_stats': None,
+            # loads are live state, shared with the cluster
+            'bounded_load': cluster.bounded_load,
+            'partition_table': None,
+            'down': frozenset(cluster.down),
+        }
+        self.__dict__.update(state)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ClusterSnapshot is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("ClusterSnapshot is immutable")
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("ClusterSnapshot is immutable, change a copy()")
+
+    add_zone = remove_zone = add_node = remove_node = _immutable
+    set_node_weight = publish = enable_stats = disable_stats = _immutable
+    enable_bounded_load = disable_bounded_load = _immutable
+    enable_partition_table = disable_partition_table = _immutable
+    mark_down = mark_up = _immutable
+
+    def snapshot(self):
+        return self
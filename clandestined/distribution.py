@@ -0,0 +1,159 @@
+import math
+from array import array
+
+from .clandestined import RendezvousHash
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Cluster.distribution resolves each zone's ring once over every sampled key
+# that has a replica in it, in one batch, and counts winners per replica
+# slot. RendezvousHash rings hand winners back as ring positions, and NumPy,
+# when installed, does the zone offsets and the counting in bulk.
+
+
+def _offsets(keys, zone_count):
+    # the zone offset find_nodes gives each key, as a list or numpy array
+    if numpy is not None and keys:
+        try:
+            codes = u''.join(keys).encode('utf-32-le')
+        except (TypeError, UnicodeError):
+            codes = None
+        if codes is not None:
+            # sums of code points from a running total, so that empty keys
+            # sum to 0 like they do in find_nodes
+            totals = numpy.zeros(len(codes) // 4 + 1, dtype=numpy.int64)
+            numpy.cumsum(numpy.frombuffer(codes, dtype='<u4'),
+                         out=totals[1:])
+            ends = numpy.cumsum(numpy.fromiter(
+                map(len, keys), dtype=numpy.int64, count=len(keys)))
+            starts = numpy.concatenate(([0], ends[:-1]))
+            return (totals[ends] - totals[starts]) % zone_count
+    return [sum(map(ord, key)) % zone_count for key in keys]
+
+
+def _group(offsets, zone_count):
+    # positions of the keys with each offset, in key order
+    if numpy is not None and not isinstance(offsets, list):
+        order = numpy.argsort(offsets, kind='stable')
+        bounds = numpy.cumsum(numpy.bincount(offsets, minlength=zone_count))
+        return numpy.split(order, bounds[:-1])
+    groups = [[] for offset in range(zone_count)]
+    for position, offset in enumerate(offsets):
+        groups[offset].append(position)
+    return groups
+
+
+def _winners(ring, members, keys):
+    # (members, indexes), the winner of each key as a position in members.
+    # A tie-break winner is the str() of a node id, it is counted for the
+    # node it stands for.
+    if type(ring) is RendezvousHash:
+        members = ring.nodes
+        indexes = ring._find_indexes(keys)
+        if indexes and min(indexes) < 0:
+            names = dict((str(node), i) for i, node in enumerate(members))
+            for i, found in enumerate(indexes):
+                if found < 0:
+                    indexes[i] = names[ring._tie_break(keys[i])]
+        return members, indexes
+    if hasattr(ring, 'find_node_many'):
+        winners = ring.find_node_many(keys)
+    else:
+        winners = [ring.find_node(key) for key in keys]
+    position = dict((str(node), i) for i, node in enumerate(members))
+    position.update((node, i) for i, node in enumerate(members))
+    return members, array('l', [position[winner] for winner in winners])
+
+
+def _count(indexes, start, end, size):
+    if numpy is not None:
+        found = numpy.frombuffer(indexes, dtype=indexes.typecode)
+        return numpy.bincount(found[start:end], minlength=size).tolist()
+    counts = [0] * size
+    for index in indexes[start:end]:
+        counts[index] += 1
+    return counts
+
+
+def imbalance(counts):
+    # spread of a list of counts, max_mean is 1.0 when perfectly even
+    counts = list(counts)
+    if not counts:
+        return {'mean': 0.0, 'max': 0, 'max_mean': None, 'stddev': 0.0}
+    mean = float(sum(counts)) / len(counts)
+    variance = sum((count - mean) ** 2 for count in counts) / len(counts)
+    return {
+        'mean': mean,
+        'max': max(counts),
+        'max_mean': max(counts) / mean if mean else None,
+        'stddev': math.sqrt(variance),
+    }
+
+
+def distribution(cluster, keys):
+    keys = list(keys)
+    zones = cluster.zones
+    zone_count = len(zones)
+    if not zone_count:
+        raise ValueError("Cluster has no zones to distribute keys over")
+    # replica slots past the zone count wrap around to the same zones, and
+    # pick the same nodes as the slot they repeat.
+    distinct = min(cluster.replicas, zone_count)
+
+    offsets = _offsets(keys, zone_count)
+    groups = _group(offsets, zone_count)
+
+    slots = [dict((node, 0) for node in cluster.nodes)
+             for slot in range(distinct)]
+    for zone_index, zone in enumerate(zones):
+        wanted = [groups[(zone_index - slot) % zone_count]
+                  for slot in range(distinct)]
+        members = cluster.zone_members[zone]
+        if not members or not sum(len(positions) for positions in wanted):
+            continue
+        members, indexes = _winners(
+            cluster.rings[zone], members,
+            [keys[position] for positions in wanted
+             for position in positions])
+        start = 0
+        for slot, positions in enumerate(wanted):
+            end = start + len(positions)
+            counts = _count(indexes, start, end, len(members))
+            for node, count in zip(members, counts):
+                slots[slot][node] += count
+            start = end
+
+    nodes = dict((node, 0) for node in cluster.nodes)
+    zone_counts = dict((zone, 0) for zone in zones)
+    for slot in range(cluster.replicas):
+        zone_slot = slot % zone_count
+        for zone in zones:
+            for node in cluster.zone_members[zone]:
+                count = slots[zone_slot][node]
+                nodes[node] += count
+                zone_counts[zone] += count
+    offset_counts = dict((zone, len(positions))
+                         for zone, positions in zip(zones, groups))
+
+    key_count = len(keys)
+    return {
+        'keys': key_count,
+        'nodes': nodes,
+        'zones': zone_counts,
+        'slots': [dict(slots[slot % zone_count])
+                  for slot in range(cluster.replicas)],
+        'offsets': offset_counts,
+        'node_share': dict((node, float(count) / key_count if key_count
+                            else 0.0) for node, count in nodes.items()),
+        'zone_share': dict((zone, float(count) / key_count if key_count
+                            else 0.0) for zone, count in zone_counts.items()),
+        'imbalance': {
+            'nodes': imbalance(nodes.values()),
+            'zones': imbalance(zone_counts.values()),
+            'offsets': imbalance(offset_counts.values()),
+        },
+    }
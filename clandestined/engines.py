@@ -0,0 +1,227 @@
+import math
+import struct
+from array import array
+
+from . import murmur3
+
+
+# A hash engine decides how a RendezvousHash scores a key against each of
+# its nodes. Rings keep one packed state per node, made by the engine from
+# the node's "<node>-" prefix, and a score is an int that is compared as is,
+# or mapped through the engine's weighted() on weighted rings. Ties are
+# broken by str(node) whatever the engine.
+#
+#   murmur3_32   murmur3_32 of "<node>-<key>", the default and the only
+#                engine placements have ever been made with
+#   murmur3_128  murmur3_x64_128 of "<node>-<key>", both digest halves make
+#                up a 128-bit score so ties need a full 128-bit collision
+#   mix64        fmix64 of the node's and the key's 64-bit hashes xor'd,
+#                the key is hashed once per lookup instead of once per node
+#
+# Engines are looked up by name with get_engine, and more can be added with
+# register_engine. Engine is an abstract base: an engine needs a name and
+# its own score, the rest has pure python defaults built on score.
+
+ENGINES = {}
+
+DEFAULT_ENGINE = 'murmur3_32'
+
+_MASK64 = 0xffffffffffffffff
+
+_NODE_HASH = struct.Struct('=Q')
+
+
+def _function(method):
+    # the function behind a Python 2 unbound method
+    return getattr(method, '__func__', method)
+
+
+def _check_engine(engine):
+    if not isinstance(engine, Engine):
+        raise TypeError("Hash engines must be Engine instances, not %s"
+                        % (type(engine).__name__))
+    if _function(type(engine).score) is _function(Engine.score):
+        raise TypeError("Hash engine %s does not implement score"
+                        % (type(engine).__name__))
+    if not engine.name:
+        raise ValueError("Hash engine %s has no name"
+                         % (type(engine).__name__))
+    return engine
+
+
+def register_engine(engine):
+    ENGINES[_check_engine(engine).name] = engine
+    return engine
+
+
+def get_engine(engine=None):
+    if engine is None:
+        engine = DEFAULT_ENGINE
+    if isinstance(engine, Engine):
+        return _check_engine(engine)
+    try:
+        return ENGINES[engine]
+    except KeyError:
+        raise ValueError("No such hash engine %s, choose from %s"
+                         % (engine, ", ".join(sorted(ENGINES))))
+
+
+def _native():
+    # the extension is only used while murmur3_32 hasn't been swapped out,
+    # as for the rings' own native lookups.
+    native = murmur3._native
+    if native is not None and murmur3.murmur3_32 is native.murmur3_32:
+        return native
+    return None
+
+
+class Engine(object):
+
+    name = None
+    # width of a score, and the ENGINE_* id of the extension's version
+    bits = 32
+    native_id = None
+
+    def __reduce__(self):
+        # engines pickle by name, rings refer to the registered instance
+        return (get_engine, (self.name,))
+
+    def __repr__(self):
+        return "<%s engine>" % (self.name,)
+
+    def node_state(self, prefix, seed):
+        native = _native()
+        if native is None or self.native_id is None:
+            return b''
+        return native.engine_state(self.native_id, prefix, seed)
+
+    def _native_for(self, ring):
+        # the extension, if it can score with the states ring holds
+        native = _native()
+        if native is not None and self.native_id is not None and \
+                ring._states:
+            return native
+        return None
+
+    def score(self, seed, prefix, key):
+        # the int score of key against the node with this "<node>-" prefix,
+        # which every engine must implement
+        raise NotImplementedError("%s does not implement score"
+                                  % (type(self).__name__))
+
+    def scores(self, ring, key):
+        key = str(key)
+        native = self._native_for(ring)
+        if native is not None:
+            return native.engine_scores(self.native_id, ring._states, key,
+                                        ring.seed)
+        return [self.score(ring.seed, prefix, key)
+                for prefix in ring._prefixes]
+
+    def weighted(self, score, weight):
+        # logarithmic weighted rendezvous over the top 64 bits of the score,
+        # using 53 of them so the mapping into (0, 1) is exact
+        high = score >> (self.bits - 64)
+        return weight / -math.log(((high >> 11) + 0.5) / 9007199254740992.0)
+
+    def find_node(self, ring, key):
+        # (index, tied) of the high score, (None, False) for an empty ring
+        if not ring.nodes:
+            return None, False
+        weights = ring._weights if ring.weights else None
+        native = self._native_for(ring)
+        if native is not None:
+            return native.engine_find_node(self.native_id, ring._states,
+                                           str(key), ring.seed, weights)
+        return self._best(self.scores(ring, key), weights)
+
+    def find_node_many(self, ring, keys):
+        # winner indexes, a tied winner at index i is stored as -1 - i
+        keys = list(keys)
+        weights = ring._weights if ring.weights else None
+        native = self._native_for(ring)
+        if native is not None and ring.nodes:
+            return native.engine_find_node_many(
+                self.native_id, ring._states, keys, ring.seed, weights)
+        indexes = array('l')
+        for key in keys:
+            index, tied = self._best(self.scores(ring, key), weights)
+            indexes.append(-1 - index if tied else index)
+        return indexes
+
+    def _best(self, scores, weights):
+        if weights is not None:
+            scores = [self.weighted(score, weight)
+                      for score, weight in zip(scores, weights)]
+        high_score = max(scores)
+        return scores.index(high_score), scores.count(high_score) > 1
+
+
+class Murmur3Engine(Engine):
+
+    name = 'murmur3_32'
+    bits = 32
+    native_id = 0
+
+    def score(self, seed, prefix, key):
+        return murmur3.murmur3_32(prefix + key, seed)
+
+    def scores(self, ring, key):
+        # the ring's hash_function, so a swapped murmur3_32 is followed
+        key = str(key)
+        native = self._native_for(ring)
+        if native is not None:
+            return native.scores(ring._states, key)
+        hash_function = ring.hash_function
+        return [hash_function(prefix + key) for prefix in ring._prefixes]
+
+    def weighted(self, score, weight):
+        return weight / -math.log((score + 0.5) / 4294967296.0)
+
+
+class Murmur3x128Engine(Engine):
+
+    name = 'murmur3_128'
+    bits = 128
+    native_id = 1
+
+    def score(self, seed, prefix, key):
+        digest = murmur3.murmur3_x64_128(prefix + key, seed)
+        # the first digest half is the high half of the score
+        return ((digest & _MASK64) << 64) | (digest >> 64)
+
+
+class Mix64Engine(Engine):
+
+    name = 'mix64'
+    bits = 64
+    native_id = 2
+
+    @staticmethod
+    def _hash64(data, seed):
+        return murmur3.murmur3_x64_128(data, seed) & _MASK64
+
+    def node_state(self, prefix, seed):
+        # the node's hash, which the pure python scoring uses as well
+        return _NODE_HASH.pack(self._hash64(prefix, seed))
+
+    def score(self, seed, prefix, key):
+        return murmur3.fmix64(self._hash64(prefix, seed) ^
+                              self._hash64(key, seed))
+
+    def scores(self, ring, key):
+        key = str(key)
+        native = self._native_for(ring)
+        if native is not None:
+            return native.engine_scores(self.native_id, ring._states, key,
+                                        ring.seed)
+        key_hash = self._hash64(key, ring.seed)
+        states = bytes(ring._states)
+        return [murmur3.fmix64(_NODE_HASH.unpack_from(states, offset)[0] ^
+                               key_hash)
+                for offset in range(0, len(states), _NODE_HASH.size)]
+
+
+MURMUR3_32 = register_engine(Murmur3Engine())
+MURMUR3_128 = register_engine(Murmur3x128Engine())
+MIX64 = register_engine(Mix64Engine())
@@ -0,0 +1,226 @@
+from . import murmur3
+from .clandestined import RendezvousHash
+
+
+class HierarchicalRendezvousHash(object):
+
+    # Nodes are the leaves of a trie over the base fanout digits of their
+    # murmur3_32 hash, lowest digit first. A branch of the trie with more
+    # than bucket_size nodes below it is split into its non-empty children,
+    # the others are buckets. A lookup runs rendezvous over the children of
+    # each split branch, weighted by the number of nodes below each child,
+    # then over the members of the bucket it reaches, so it scores about
+    # fanout * log(n / bucket_size) labels plus one bucket instead of every
+    # node. The weights give every node an even share of keys, as on a flat
+    # ring, however unevenly the nodes fall into branches.
+    #
+    # The trie only depends on the nodes, so rings of the same nodes agree.
+    # Adding or removing a node changes the weights along its own path, which
+    # moves keys to or from that node and a few more between the nodes that
+    # share a branch with it, and a bucket that splits or merges shuffles
+    # keys between its members.
+
+    def __init__(self, nodes=None, seed=0, fanout=8, bucket_size=32):
+        if fanout < 2:
+            raise ValueError("fanout must be at least 2, got %s" % (fanout))
+        if bucket_size < 1:
+            raise ValueError("bucket_size must be at least 1, got %s"
+                             % (bucket_size))
+        self.nodes = []
+        self.seed = seed
+        self.fanout = fanout
+        self.bucket_size = bucket_size
+        self.weights = {}
+        # the deepest level a 32-bit hash has digits for
+        self._max_level = 0
+        while fanout ** (self._max_level + 1) <= 2 ** 32:
+            self._max_level += 1
+        self._hashes = {}
+        # the nodes below each non-empty (level, prefix) branch
+        self._members = {}
+        # weighted rings of child labels for split branches, and rings of
+        # member nodes for buckets
+        self._rings = {}
+        self._buckets = {}
+        if nodes is not None:
+            for node in nodes:
+                self._add(node)
+            if self.nodes:
+                self._build((0, 0))
+
+    def _hash(self, node):
+        return murmur3.murmur3_32(str(node), self.seed)
+
+    def _path(self, node):
+        hashed = self._hashes[node]
+        return [(level, hashed % self.fanout ** level)
+                for level in range(self._max_level + 1)]
+
+    @staticmethod
+    def _label(branch):
+        return "%d:%d" % branch
+
+    @staticmethod
+    def _branch(label):
+        level, prefix = label.split(':')
+        return int(level), int(prefix)
+
+    def _is_split(self, branch):
+        return (branch[0] < self._max_level and
+                len(self._members[branch]) > self.bucket_size)
+
+    def _children(self, branch):
+        level = branch[0] + 1
+        return set((level, self._hashes[node] % self.fanout ** level)
+                   for node in self._members[branch])
+
+    def _build(self, branch):
+        # the rings of branch and everything below it, from the members
+        if not self._is_split(branch):
+            self._buckets[branch] = RendezvousHash(
+                nodes=list(self._members[branch]), seed=self.seed)
+            return
+        ring = RendezvousHash(seed=self.seed)
+        for child in self._children(branch):
+            ring.add_node(self._label(child),
+                          weight=len(self._members[child]))
+            self._build(child)
+        self._rings[branch] = ring
+
+    def _drop(self, branch):
+        # the rings of branch and of the branches below it
+        self._rings.pop(branch, None)
+        self._buckets.pop(branch, None)
+        for node in self._members.get(branch, ()):
+            hashed = self._hashes[node]
+            for level in range(branch[0] + 1, self._max_level + 1):
+                below = (level, hashed % self.fanout ** level)
+                self._rings.pop(below, None)
+                self._buckets.pop(below, None)
+
+    def _add(self, node):
+        self._hashes[node] = self._hash(node)
+        self.nodes.append(node)
+        for branch in self._path(node):
+            self._members.setdefault(branch, set()).add(node)
+
+    def _update(self, node, path):
+        # brings the rings along path up to date with the members after
+        # node was added or removed
+        for branch, child in zip(path, path[1:] + [None]):
+            if branch not in self._members:
+                return
+            split = self._is_split(branch)
+            if split and branch in self._rings:
+                ring = self._rings[branch]
+                label = self._label(child)
+                count = len(self._members.get(child, ()))
+                if count == 0:
+                    ring.remove_node(label)
+                elif label in ring:
+                    ring.set_weight(label, count)
+                else:
+                    ring.add_node(label, weight=count)
+                continue
+            if not split and branch in self._buckets:
+                bucket = self._buckets[branch]
+                if node in self._members[branch]:
+                    bucket.add_node(node)
+                else:
+                    bucket.remove_node(node)
+                return
+            # the branch was split and is now a bucket, or the other way
+            self._drop(branch)
+            self._build(branch)
+            return
+
+    def add_node(self, node, weight=1.0):
+        if weight != 1.0:
+            raise ValueError("HierarchicalRendezvousHash does not support "
+                             "node weights")
+        if node in self._hashes:
+            return
+        self._add(node)
+        self._update(node, self._path(node))
+
+    def remove_node(self, node):
+        if node not in self._hashes:
+            raise ValueError("No such node %s to remove" % (node))
+        path = self._path(node)
+        self.nodes.remove(node)
+        for branch in path:
+            members = self._members[branch]
+            members.discard(node)
+            if not members:
+                del self._members[branch]
+                self._rings.pop(branch, None)
+                self._buckets.pop(branch, None)
+        del self._hashes[node]
+        self._update(node, path)
+
+    def set_weight(self, node, weight):
+        if node not in self._hashes:
+            raise ValueError("No such node %s to weight" % (node))
+        if weight != 1.0:
+            raise ValueError("HierarchicalRendezvousHash does not support "
+                             "node weights")
+
+    def find_node(self, key):
+        if not self.nodes:
+            return None
+        branch = (0, 0)
+        rings = self._rings
+        while branch in rings:
+            branch = self._branch(rings[branch].find_node(key))
+        return self._buckets[branch].find_node(key)
+
+    def find_node_many(self, keys):
+        keys = list(keys)
+        if not self.nodes:
+            return [None] * len(keys)
+        # walk the trie one level at a time, resolving every key that sits
+        # in the same branch with a single batch lookup.
+        found = [None] * len(keys)
+        branches = [(0, 0)] * len(keys)
+        pending = range(len(keys))
+        while pending:
+            groups = {}
+            for position in pending:
+                groups.setdefault(branches[position], []).append(position)
+            pending = []
+            for branch, positions in groups.items():
+                batch = [keys[position] for position in positions]
+                if branch in self._rings:
+                    labels = self._rings[branch].find_node_many(batch)
+                    for position, label in zip(positions, labels):
+                        branches[position] = self._branch(label)
+                    pending.extend(positions)
+                else:
+                    winners = self._buckets[branch].find_node_many(batch)
+                    for position, winner in zip(positions, winners):
+                        found[position] = winner
+        return found
+
+    def iter_nodes(self, key):
+        return self._iter_branch((0, 0), key)
+
+    def _iter_branch(self, branch, key):
+        if branch in self._buckets:
+            for node in self._buckets[branch].iter_nodes(key):
+                yield node
+            return
+        if branch not in self._rings:
+            return
+        for label in self._rings[branch].iter_nodes(key):
+            for node in self._iter_branch(self._branch(label), key):
+                yield node
+
+    def find_nodes(self, key, n):
+        nodes = []
+        if n <= 0:
+            return nodes
+        for node in self.iter_nodes(key):
+            nodes.append(node)
+            if len(nodes) == n:
+                break
+        return nodes
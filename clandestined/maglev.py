@@ -0,0 +1,221 @@
+from array import array
+
+from . import murmur3
+
+
+_MASK32 = 0xffffffff
+_MASK64 = 0xffffffffffffffff
+
+
+def _is_prime(number):
+    if number < 2 or number % 2 == 0:
+        return number == 2
+    divisor = 3
+    while divisor * divisor <= number:
+        if number % divisor == 0:
+            return False
+        divisor += 2
+    return True
+
+
+def _fill(offsets, skips, size, weights=None):
+    # pure python version of the extension's maglev_table, slot for slot
+    table = array('l', [-1]) * size
+    positions = list(offsets)
+    credits = [0.0] * len(positions)
+    step = [1.0] * len(positions)
+    if weights is not None:
+        max_weight = max(weights)
+        step = [weight / max_weight for weight in weights]
+    filled = 0
+    while filled < size:
+        for index, skip in enumerate(skips):
+            if filled == size:
+                break
+            credits[index] += step[index]
+            while credits[index] >= 1.0 and filled < size:
+                credits[index] -= 1.0
+                slot = positions[index]
+                while table[slot] >= 0:
+                    slot += skip
+                    if slot >= size:
+                        slot -= size
+                table[slot] = index
+                positions[index] = (slot + skip) % size
+                filled += 1
+    return table
+
+
+class MaglevHash(object):
+
+    # Maglev consistent hashing. Each node walks its own permutation of a
+    # table_size slot lookup table, offset + i * skip modulo the prime
+    # table_size, with offset and skip taken from the two halves of the
+    # murmur3 x64_128 digest of str(node) under the ring's seed. Nodes take
+    # turns claiming their next free slot until the table is full, so every
+    # node owns table_size / len(nodes) slots give or take one, or a share
+    # in proportion to its weight. A lookup is one murmur3_32 of the key and
+    # one index into the table.
+    #
+    # The table is refilled from scratch on the first lookup after the nodes
+    # or weights change, in the extension when it is available, so a batch of
+    # changes such as building a Cluster only fills it once. Nodes fill it in
+    # str() order, so it only depends on the nodes, weights, seed and size.
+    # Unlike rendezvous hashing a change also moves a small share of keys
+    # between the other nodes, and table_size should be well over 100 times
+    # the node count to keep that share and the imbalance low.
+
+    def __init__(self, nodes=None, seed=0, weights=None, table_size=65537):
+        if not _is_prime(table_size):
+            raise ValueError("table_size must be a prime, got %s"
+                             % (table_size))
+        self.nodes = []
+        self.seed = seed
+        self.table_size = table_size
+        self.weights = {}
+        self._permutations = {}
+        # the owner of each slot, a new list on every build so copies can
+        # share it, or None until the next lookup builds it
+        self._slots = None
+        if nodes is not None:
+            for node in nodes:
+                self._add(node)
+        if weights:
+            for node, weight in weights.items():
+                if node in self._permutations:
+                    self._set_weight(node, weight)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node):
+        return node in self._permutations
+
+    def hash_function(self, key):
+        return murmur3.murmur3_32(key, self.seed)
+
+    def _permutation(self, node):
+        digest = murmur3.murmur3_x64_128(str(node), self.seed & _MASK32)
+        offset = (digest & _MASK64) % self.table_size
+        skip = (digest >> 64) % (self.table_size - 1) + 1
+        return offset, skip
+
+    @staticmethod
+    def _weight(weight):
+        weight = float(weight)
+        # an infinite weight would leave the other nodes no share to fill
+        if not 0 < weight < float('inf'):
+            raise ValueError("Node weight must be positive and finite, got %s"
+                             % (weight))
+        return weight
+
+    def _add(self, node):
+        if node not in self._permutations:
+            self._permutations[node] = self._permutation(node)
+            self.nodes.append(node)
+
+    def _set_weight(self, node, weight):
+        weight = self._weight(weight)
+        # only non-default weights are kept, as on RendezvousHash
+        if weight == 1.0:
+            self.weights.pop(node, None)
+        else:
+            self.weights[node] = weight
+
+    def _table(self):
+        slots = self._slots
+        if slots is None:
+            slots = self._slots = self._build()
+        return slots
+
+    def _build(self):
+        if not self.nodes:
+            return []
+        order = sorted(self.nodes, key=lambda node: (str(node), repr(node)))
+        offsets = [self._permutations[node][0] for node in order]
+        skips = [self._permutations[node][1] for node in order]
+        weights = None
+        if self.weights:
+            weights = array('d', [self.weights.get(node, 1.0)
+                                  for node in order])
+        if murmur3._native is not None:
+            table = murmur3._native.maglev_table(offsets, skips,
+                                                 self.table_size, weights)
+        else:
+            table = _fill(offsets, skips, self.table_size, weights)
+        return [order[index] for index in table]
+
+    def add_node(self, node, weight=1.0):
+        if node not in self._permutations:
+            weight = self._weight(weight)
+            self._add(node)
+            self._set_weight(node, weight)
+            self._slots = None
+
+    def remove_node(self, node):
+        if node not in self._permutations:
+            raise ValueError("No such node %s to remove" % (node))
+        del self._permutations[node]
+        self.nodes.remove(node)
+        self.weights.pop(node, None)
+        self._slots = None
+
+    def set_weight(self, node, weight):
+        if node not in self._permutations:
+            raise ValueError("No such node %s to weight" % (node))
+        previous = self.weights.get(node, 1.0)
+        self._set_weight(node, weight)
+        if self.weights.get(node, 1.0) != previous:
+            self._slots = None
+
+    def copy(self):
+        ring = MaglevHash.__new__(MaglevHash)
+        ring.nodes = list(self.nodes)
+        ring.seed = self.seed
+        ring.table_size = self.table_size
+        ring.weights = dict(self.weights)
+        ring._permutations = dict(self._permutations)
+        # built first, so the two share the table
+        ring._slots = self._table()
+        return ring
+
+    def find_node(self, key):
+        if not self.nodes:
+            return None
+        return self._table()[self.hash_function(key) % self.table_size]
+
+    def find_node_many(self, keys):
+        keys = list(keys)
+        if not self.nodes:
+            return [None] * len(keys)
+        slots = self._table()
+        size = self.table_size
+        return [slots[hashed % size]
+                for hashed in murmur3.murmur3_32_many(keys, self.seed)]
+
+    def iter_nodes(self, key):
+        # the key's node, then the owners of the following slots in the
+        # order they first appear, which are in effect a random order.
+        if not self.nodes:
+            return
+        slots = self._table()
+        size = self.table_size
+        slot = self.hash_function(key) % size
+        seen = set()
+        for step in range(size):
+            node = slots[(slot + step) % size]
+            if node not in seen:
+                seen.add(node)
+                yield node
+                if len(seen) == len(self.nodes):
+                    return
+
+    def find_nodes(self, key, n):
+        nodes = []
+        if n <= 0:
+            return nodes
+        for node in self.iter_nodes(key):
+            nodes.append(node)
+            if len(nodes) == n:
+                break
+        return nodes
@@ -1,3 +1,5 @@
+import struct
+from array import array
 
 try:
     import __pypy__
@@ -12,58 +14,198 @@ except ImportError:
     MURMUR3_FALLBACK = True
 
 
-if MURMUR3_IS_PYPY or MURMUR3_FALLBACK:
-    def murmur3_32(data, seed = 0):
-        """MurmurHash3 was written by Austin Appleby, and is placed in the
-           public domain. The author hereby disclaims copyright to this source
-           code."""
-
-        c1 = 0xcc9e2d51
-        c2 = 0x1b873593
-
-        length = len(data)
-        h1 = seed
-        roundedEnd = (length & 0xfffffffc)  # round down to 4 byte block
-        for i in range(0, roundedEnd, 4):
-          # little endian load order
-          k1 = (ord(data[i]) & 0xff) | ((ord(data[i + 1]) & 0xff) << 8) | \
-               ((ord(data[i + 2]) & 0xff) << 16) | (ord(data[i + 3]) << 24)
-          k1 *= c1
-          k1 = (k1 << 15) | ((k1 & 0xffffffff) >> 17) # ROTL32(k1,15)
-          k1 *= c2
-
-          h1 ^= k1
-          h1 = (h1 << 13) | ((h1 & 0xffffffff) >> 19)  # ROTL32(h1,13)
-          h1 = h1 * 5 + 0xe6546b64
-
-        # tail
+def _to_bytes(data):
+    # str is hashed as UTF-8, as the extension does, anything else must
+    # support the buffer protocol.
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, type(u'')):
+        return data.encode('utf-8')
+    return memoryview(data).tobytes()
+
+
+def _blocks(data, count):
+    return struct.unpack_from('<%dI' % (count,), data)
+
+
+def pure_murmur3_32(data, seed = 0):
+    """MurmurHash3 was written by Austin Appleby, and is placed in the
+       public domain. The author hereby disclaims copyright to this source
+       code."""
+
+    data = _to_bytes(data)
+    length = len(data)
+    h1 = seed & 0xffffffff
+    roundedEnd = (length & 0xfffffffc)  # round down to 4 byte block
+    # little endian load order, decoded in one call
+    for k1 in _blocks(data, roundedEnd >> 2):
+        k1 = (k1 * 0xcc9e2d51) & 0xffffffff
+        k1 = ((k1 << 15) | (k1 >> 17)) * 0x1b873593  # ROTL32(k1,15)
+
+        h1 ^= k1 & 0xffffffff
+        h1 = ((h1 << 13) | (h1 >> 19)) & 0xffffffff  # ROTL32(h1,13)
+        h1 = (h1 * 5 + 0xe6546b64) & 0xffffffff
+
+    # tail
+    tail = bytearray(data[roundedEnd:])
+    if tail:
         k1 = 0
+        for byte in reversed(tail):
+            k1 = (k1 << 8) | byte
+        k1 = (k1 * 0xcc9e2d51) & 0xffffffff
+        k1 = (((k1 << 15) | (k1 >> 17)) * 0x1b873593) & 0xffffffff  # ROTL32(k1,15)
+        h1 ^= k1
+
+    # finalization
+    h1 ^= length & 0xffffffff
+
+    # fmix(h1)
+    h1 ^= h1 >> 16
+    h1 = (h1 * 0x85ebca6b) & 0xffffffff
+    h1 ^= h1 >> 13
+    h1 = (h1 * 0xc2b2ae35) & 0xffffffff
+    h1 ^= h1 >> 16
+
+    return h1
+
+
+def pure_murmur3_32_many(keys, seed = 0):
+    """Calculate murmur3_32 for each key in an iterable, returning the
+       hashes as an array('I') in input order."""
+    return array('I', [pure_murmur3_32(key, seed) for key in keys])
+
+
+class PureMurmur3(object):
+    """Incremental murmur3_32 hasher. Data is fed with update() and
+       digest() returns the hash of everything fed so far, so a common
+       prefix can be hashed once and copy()'d for each suffix."""
+
+    def __init__(self, data=None, seed=0):
+        self._hash = seed & 0xffffffff
+        self._tail = b''
+        self._length = 0
+        if data is not None:
+            self.update(data)
+
+    def update(self, data):
+        data = _to_bytes(data)
+        self._length += len(data)
+        if self._tail:
+            data = self._tail + data
+        end = len(data) & ~3
+        h1 = self._hash
+        for k1 in _blocks(data, end >> 2):
+            k1 = (k1 * 0xcc9e2d51) & 0xffffffff
+            k1 = ((k1 << 15) | (k1 >> 17)) * 0x1b873593
+            h1 ^= k1 & 0xffffffff
+            h1 = ((h1 << 13) | (h1 >> 19)) & 0xffffffff
+            h1 = (h1 * 5 + 0xe6546b64) & 0xffffffff
+        self._hash = h1
+        self._tail = data[end:]
 
-        val = length & 0x03
-        if val == 3:
-            k1 = (ord(data[roundedEnd + 2]) & 0xff) << 16
-        # fallthrough
-        if val in [2, 3]:
-            k1 |= (ord(data[roundedEnd + 1]) & 0xff) << 8
-        # fallthrough
-        if val in [1, 2, 3]:
-            k1 |= ord(data[roundedEnd]) & 0xff
-            k1 *= c1
-            k1 = (k1 << 15) | ((k1 & 0xffffffff) >> 17)  # ROTL32(k1,15)
-            k1 *= c2
+    def copy(self):
+        other = PureMurmur3.__new__(PureMurmur3)
+        other._hash = self._hash
+        other._tail = self._tail
+        other._length = self._length
+        return other
+
+    def digest(self):
+        h1 = self._hash
+        if self._tail:
+            k1 = 0
+            for byte in reversed(bytearray(self._tail)):
+                k1 = (k1 << 8) | byte
+            k1 = (k1 * 0xcc9e2d51) & 0xffffffff
+            k1 = (((k1 << 15) | (k1 >> 17)) * 0x1b873593) & 0xffffffff
             h1 ^= k1
 
-        # finalization
-        h1 ^= length
+        h1 ^= self._length & 0xffffffff
+        h1 ^= h1 >> 16
+        h1 = (h1 * 0x85ebca6b) & 0xffffffff
+        h1 ^= h1 >> 13
+        h1 = (h1 * 0xc2b2ae35) & 0xffffffff
+        h1 ^= h1 >> 16
+        return h1
+
+
+_MASK64 = 0xffffffffffffffff
+
+
+def _rotl64(value, bits):
+    return ((value << bits) | (value >> (64 - bits))) & _MASK64
+
+
+def fmix64(value):
+    """The murmur3 64-bit finalizer, a bijective mix of a 64-bit int."""
+    value ^= value >> 33
+    value = (value * 0xff51afd7ed558ccd) & _MASK64
+    value ^= value >> 33
+    value = (value * 0xc4ceb9fe1a85ec53) & _MASK64
+    value ^= value >> 33
+    return value
+
+
+def pure_murmur3_x64_128(data, seed = 0):
+    """MurmurHash3_x64_128, returned as one int holding the first 64-bit
+       half of the digest in its low bits and the second in its high bits."""
 
-        # fmix(h1)
-        h1 ^= ((h1 & 0xffffffff) >> 16)
-        h1 *= 0x85ebca6b
-        h1 ^= ((h1 & 0xffffffff) >> 13)
-        h1 *= 0xc2b2ae35
-        h1 ^= ((h1 & 0xffffffff) >> 16)
+    data = _to_bytes(data)
+    length = len(data)
+    c1 = 0x87c37b91114253d5
+    c2 = 0x4cf5ad432745937f
+    h1 = h2 = seed & 0xffffffff
+    end = length & ~15
+    blocks = struct.unpack_from('<%dQ' % (end >> 3,), data)
+    for i in range(0, len(blocks), 2):
+        k1 = _rotl64((blocks[i] * c1) & _MASK64, 31)
+        h1 ^= (k1 * c2) & _MASK64
+        h1 = (_rotl64(h1, 27) + h2) & _MASK64
+        h1 = (h1 * 5 + 0x52dce729) & _MASK64
 
-        return h1 & 0xffffffff
+        k2 = _rotl64((blocks[i + 1] * c2) & _MASK64, 33)
+        h2 ^= (k2 * c1) & _MASK64
+        h2 = (_rotl64(h2, 31) + h1) & _MASK64
+        h2 = (h2 * 5 + 0x38495ab5) & _MASK64
+
+    # tail, the first 8 bytes feed k1 and the rest k2
+    tail = bytearray(data[end:])
+    if len(tail) > 8:
+        k2 = 0
+        for byte in reversed(tail[8:]):
+            k2 = (k2 << 8) | byte
+        k2 = _rotl64((k2 * c2) & _MASK64, 33)
+        h2 ^= (k2 * c1) & _MASK64
+    if tail:
+        k1 = 0
+        for byte in reversed(tail[:8]):
+            k1 = (k1 << 8) | byte
+        k1 = _rotl64((k1 * c1) & _MASK64, 31)
+        h1 ^= (k1 * c2) & _MASK64
+
+    h1 ^= length
+    h2 ^= length
+    h1 = (h1 + h2) & _MASK64
+    h2 = (h2 + h1) & _MASK64
+    h1 = fmix64(h1)
+    h2 = fmix64(h2)
+    h1 = (h1 + h2) & _MASK64
+    h2 = (h2 + h1) & _MASK64
+    return h1 | (h2 << 64)
+
+
+if MURMUR3_IS_PYPY or MURMUR3_FALLBACK:
+    murmur3_32 = pure_murmur3_32
+    murmur3_32_many = pure_murmur3_32_many
+    murmur3_x64_128 = pure_murmur3_x64_128
+    Murmur3 = PureMurmur3
+
+    _native = None
 
 else:
     murmur3_32 = _murmur3.murmur3_32
+    murmur3_32_many = _murmur3.murmur3_32_many
+    murmur3_x64_128 = _murmur3.murmur3_x64_128
+    Murmur3 = _murmur3.Murmur3
+
+    _native = _murmur3
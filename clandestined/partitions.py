@@ -0,0 +1,133 @@
+from array import array
+
+from .clandestined import RendezvousHash
+from .clandestined import _native_murmur3
+from .engines import MURMUR3_32
+
+
+# below any weighted score, which are all positive
+_NO_SCORE = -1.0
+
+
+class PartitionTable(object):
+
+    # The winner of every find_nodes_by_index key in every zone, for
+    # partition ids below partitions and key indexes below key_indexes, in
+    # flat lists indexed by partition_id * key_indexes + key_index.
+    #
+    # RendezvousHash zones also keep each winner's weighted score, so a node
+    # added to the zone only has to beat the stored scores, and removing a
+    # node only looks up the keys it won again. Other ring classes redo the
+    # whole zone on every change.
+
+    def __init__(self, partitions, key_indexes=1):
+        if partitions < 1 or key_indexes < 1:
+            raise ValueError("A partition table needs at least one partition "
+                             "and key index")
+        self.partitions = partitions
+        self.key_indexes = key_indexes
+        self.keys = ["%s-%s" % (partition_id, key_index)
+                     for partition_id in range(partitions)
+                     for key_index in range(key_indexes)]
+        self.winners = {}
+        self.scores = {}
+
+    def position(self, partition_id, key_index):
+        # None when the table doesn't cover the key
+        if type(partition_id) is not int or type(key_index) is not int:
+            return None
+        if not (0 <= partition_id < self.partitions and
+                0 <= key_index < self.key_indexes):
+            return None
+        return partition_id * self.key_indexes + key_index
+
+    def build(self, cluster):
+        self.winners = {}
+        self.scores = {}
+        for zone in cluster.zones:
+            self.add_zone(zone)
+            if zone in cluster.rings:
+                self.update_zone(zone, cluster.rings[zone])
+
+    def add_zone(self, zone):
+        if zone not in self.winners:
+            self.winners[zone] = [None] * len(self.keys)
+            self.scores[zone] = array('d', [_NO_SCORE]) * len(self.keys)
+
+    def remove_zone(self, zone):
+        self.winners.pop(zone, None)
+        self.scores.pop(zone, None)
+
+    def update_zone(self, zone, ring, positions=None):
+        # looks the keys at positions, or all of them, up again
+        if positions is None:
+            positions = range(len(self.keys))
+        keys = [self.keys[position] for position in positions]
+        found = ring.find_node_many(keys)
+        winners = self.winners[zone]
+        scores = self.scores[zone]
+        ranked = type(ring) is RendezvousHash and len(ring)
+        weighted = ranked and ring.weights
+        for position, key, winner in zip(positions, keys, found):
+            winners[position] = winner
+            if ranked:
+                score = max(ring._scores(key))
+                scores[position] = score if weighted else \
+                    ring.engine.weighted(score, 1.0)
+            else:
+                scores[position] = _NO_SCORE
+
+    def _challenge(self, zone, ring, node, positions):
+        # node takes every key at positions it outscores the winner for,
+        # ties go to the highest str() as in RendezvousHash.find_node
+        prefix = "%s-" % (str(node),)
+        keys = [self.keys[position] for position in positions]
+        engine = ring.engine
+        native = _native_murmur3()
+        if engine is not MURMUR3_32:
+            hashes = [engine.score(ring.seed, prefix, key) for key in keys]
+        elif native is not None:
+            hashes = native.murmur3_32_many([prefix + key for key in keys],
+                                            ring.seed)
+        else:
+            hashes = [ring.hash_function(prefix + key) for key in keys]
+        weight = ring.weights.get(node, 1.0)
+        winners = self.winners[zone]
+        scores = self.scores[zone]
+        for position, hashed in zip(positions, hashes):
+            score = engine.weighted(hashed, weight)
+            if score > scores[position]:
+                winners[position] = node
+                scores[position] = score
+            elif score == scores[position]:
+                winners[position] = max(str(node), str(winners[position]))
+
+    def _won_by(self, zone, ring, node):
+        # the keys node won, and those settled by a tie-break between
+        # nodes with non-str ids, which may change with any of them
+        return [position for position, winner
+                in enumerate(self.winners[zone])
+                if winner == node or (winner is not None and winner not in
+                                      ring)]
+
+    def add_node(self, zone, ring, node):
+        self.add_zone(zone)
+        if type(ring) is not RendezvousHash:
+            return self.update_zone(zone, ring)
+        self._challenge(zone, ring, node, range(len(self.keys)))
+
+    def remove_node(self, zone, ring, node):
+        if type(ring) is not RendezvousHash:
+            return self.update_zone(zone, ring)
+        self.update_zone(zone, ring, self._won_by(zone, ring, node))
+
+    def set_weight(self, zone, ring, node):
+        if type(ring) is not RendezvousHash:
+            return self.update_zone(zone, ring)
+        # the keys node won may now go to others, the rest may go to it
+        won = self._won_by(zone, ring, node)
+        self.update_zone(zone, ring, won)
+        won = set(won)
+        self._challenge(zone, ring, node, [position for position
+                                           in range(len(self.keys))
+                                           if position not in won])
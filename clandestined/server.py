@@ -0,0 +1,326 @@
+import argparse
+import asyncio
+import json
+import signal
+import struct
+import sys
+
+from .clandestined import Cluster
+
+
+# A local lookup service, so clients in any language route keys with this
+# implementation rather than a reimplementation of it. Needs Python 3.
+#
+# Every message is a frame: a big-endian uint32 byte length, then the body.
+# All integers below are big-endian and strings are UTF-8.
+#
+#   request   uint8 op, uint32 request id, op payload
+#   response  uint8 op, uint32 request id, uint8 status, payload
+#
+#   OP_FIND   request payload: uint32 key count, then per key a uint32
+#             length and the key. response payload: uint32 key count,
+#             uint32 replicas, then per key and replica a uint32 length and
+#             the node id, with length 0xffffffff for no node.
+#   OP_INFO   no request payload. response payload: uint64 topology
+#             version, uint32 replicas, uint32 node count.
+#
+# A status other than STATUS_OK carries a UTF-8 error message as payload.
+# Requests may be pipelined, responses come back in request order on each
+# connection. reload() swaps in a new topology without closing connections,
+# requests already being resolved finish against the old one.
+
+OP_FIND = 1
+OP_INFO = 2
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+NO_NODE = 0xffffffff
+
+_FRAME = struct.Struct('>I')
+_REQUEST = struct.Struct('>BI')
+_RESPONSE = struct.Struct('>BIB')
+_INFO = struct.Struct('>QII')
+_FIND = struct.Struct('>II')
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def _frame(body):
+    return _FRAME.pack(len(body)) + body
+
+
+def _pack_string(value):
+    value = value.encode('utf-8')
+    return _FRAME.pack(len(value)) + value
+
+
+def _unpack_strings(body, offset, count):
+    strings = []
+    size = len(body)
+    for i in range(count):
+        if offset + 4 > size:
+            raise ProtocolError("truncated frame")
+        length, = _FRAME.unpack_from(body, offset)
+        offset += 4
+        if offset + length > size:
+            raise ProtocolError("truncated frame")
+        strings.append(body[offset:offset + length].decode('utf-8'))
+        offset += length
+    return strings, offset
+
+
+def encode_find(request_id, keys):
+    parts = [_REQUEST.pack(OP_FIND, request_id), _FRAME.pack(len(keys))]
+    parts.extend(_pack_string(key) for key in keys)
+    return _frame(b''.join(parts))
+
+
+def encode_info(request_id):
+    return _frame(_REQUEST.pack(OP_INFO, request_id))
+
+
+def decode_response(body):
+    # returns (op, request_id, result), raising ProtocolError for error
+    # responses.
+    op, request_id, status = _RESPONSE.unpack_from(body)
+    offset = _RESPONSE.size
+    if status != STATUS_OK:
+        return op, request_id, ProtocolError(body[offset:].decode('utf-8'))
+    if op == OP_INFO:
+        version, replicas, node_count = _INFO.unpack_from(body, offset)
+        return op, request_id, {'version': version, 'replicas': replicas,
+                                'nodes': node_count}
+    count, replicas = _FIND.unpack_from(body, offset)
+    offset += _FIND.size
+    results = []
+    for i in range(count):
+        nodes = []
+        for j in range(replicas):
+            length, = _FRAME.unpack_from(body, offset)
+            offset += 4
+            if length == NO_NODE:
+                nodes.append(None)
+            else:
+                nodes.append(body[offset:offset + length].decode('utf-8'))
+                offset += length
+        results.append(nodes)
+    return op, request_id, results
+
+
+class _Topology(object):
+
+    # a snapshot and its node ids pre-encoded for responses, swapped as one
+    # reference on reload.
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.encoded = dict((node, _pack_string(str(node)))
+                            for node in snapshot.nodes)
+        self.encoded[None] = _FRAME.pack(NO_NODE)
+
+
+class RoutingServer(object):
+
+    def __init__(self, cluster, executor_threshold=1024,
+                 max_frame=64 * 1024 * 1024):
+        # batches of at least executor_threshold keys are resolved on the
+        # loop's default executor, where the extension scores them without
+        # the GIL, so one large batch doesn't stall other connections.
+        self.executor_threshold = executor_threshold
+        self.max_frame = max_frame
+        self.requests = 0
+        self.reload(cluster)
+
+    def reload(self, cluster):
+        self._topology = _Topology(cluster.snapshot())
+
+    @property
+    def snapshot(self):
+        return self._topology.snapshot
+
+    def start_tcp(self, host='127.0.0.1', port=0, **kwargs):
+        return asyncio.start_server(self.handle, host, port, **kwargs)
+
+    def start_unix(self, path, **kwargs):
+        return asyncio.start_unix_server(self.handle, path, **kwargs)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(_FRAME.size)
+                except asyncio.IncompleteReadError:
+                    break
+                length, = _FRAME.unpack(header)
+                if length > self.max_frame or length < _REQUEST.size:
+                    # the stream can't be resynchronised after a bad length
+                    writer.write(self._error(0, 0, "bad frame length %d"
+                                             % (length,)))
+                    break
+                body = await reader.readexactly(length)
+                writer.write(await self._dispatch(body))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _error(self, op, request_id, message):
+        return _frame(_RESPONSE.pack(op, request_id, STATUS_ERROR) +
+                      message.encode('utf-8'))
+
+    async def _dispatch(self, body):
+        op, request_id = _REQUEST.unpack_from(body)
+        self.requests += 1
+        topology = self._topology
+        snapshot = topology.snapshot
+        try:
+            if op == OP_INFO:
+                return _frame(_RESPONSE.pack(op, request_id, STATUS_OK) +
+                              _INFO.pack(snapshot.version, snapshot.replicas,
+                                         len(snapshot.nodes)))
+            if op != OP_FIND:
+                raise ProtocolError("unknown op %d" % (op,))
+            if len(body) < _REQUEST.size + 4:
+                raise ProtocolError("truncated frame")
+            count, = _FRAME.unpack_from(body, _REQUEST.size)
+            keys, offset = _unpack_strings(body, _REQUEST.size + 4, count)
+            if offset != len(body):
+                raise ProtocolError("trailing bytes in frame")
+            if keys and not snapshot.zones:
+                raise ProtocolError("cluster has no zones to route to")
+            if len(keys) >= self.executor_threshold:
+                loop = asyncio.get_event_loop()
+                results = await loop.run_in_executor(
+                    None, snapshot.find_nodes_many, keys)
+            else:
+                results = snapshot.find_nodes_many(keys)
+        except (ProtocolError, UnicodeDecodeError) as e:
+            return self._error(op, request_id, "%s" % (e,))
+        encoded = topology.encoded
+        parts = [_RESPONSE.pack(op, request_id, STATUS_OK),
+                 _FIND.pack(len(results), snapshot.replicas)]
+        parts.extend(encoded[node] for nodes in results for node in nodes)
+        return _frame(b''.join(parts))
+
+
+class RoutingClient(object):
+
+    # An asyncio client for RoutingServer. Requests may be issued
+    # concurrently, they are pipelined on the one connection.
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._next_id = 0
+        self._pending = {}
+        self._task = asyncio.ensure_future(self._read_responses())
+
+    @classmethod
+    async def open_tcp(cls, host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    @classmethod
+    async def open_unix(cls, path):
+        reader, writer = await asyncio.open_unix_connection(path)
+        return cls(reader, writer)
+
+    async def _read_responses(self):
+        error = ConnectionError("connection closed")
+        try:
+            while True:
+                header = await self._reader.readexactly(_FRAME.size)
+                length, = _FRAME.unpack(header)
+                body = await self._reader.readexactly(length)
+                op, request_id, result = decode_response(body)
+                future = self._pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            error = ConnectionError("connection closed: %s" % (e,))
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self._pending.clear()
+
+    def _request(self, encode, *args):
+        request_id = self._next_id
+        self._next_id = (self._next_id + 1) & 0xffffffff
+        future = asyncio.get_event_loop().create_future()
+        self._pending[request_id] = future
+        self._writer.write(encode(request_id, *args))
+        return future
+
+    async def find_nodes_many(self, keys):
+        return await self._request(encode_find, list(keys))
+
+    async def find_nodes(self, key):
+        return (await self.find_nodes_many([key]))[0]
+
+    async def info(self):
+        return await self._request(encode_info)
+
+    async def close(self):
+        self._writer.close()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def _load_cluster(path, replicas, seed):
+    with open(path) as handle:
+        return Cluster(json.load(handle), replicas=replicas, seed=seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m clandestined.server',
+        description='serve replica lookups over a socket, SIGHUP reloads '
+                    'the config')
+    parser.add_argument('config', help='cluster config JSON')
+    parser.add_argument('-r', '--replicas', type=int, default=2)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('--unix', default=None, help='listen on this socket')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7311)
+    args = parser.parse_args(argv)
+
+    server = RoutingServer(_load_cluster(args.config, args.replicas, args.seed))
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    def reload():
+        try:
+            server.reload(_load_cluster(args.config, args.replicas, args.seed))
+        except (IOError, ValueError) as e:
+            sys.stderr.write("reload failed, keeping old topology: %s\n" % (e,))
+
+    if hasattr(signal, 'SIGHUP'):
+        loop.add_signal_handler(signal.SIGHUP, reload)
+    if args.unix is not None:
+        listener = loop.run_until_complete(server.start_unix(args.unix))
+    else:
+        listener = loop.run_until_complete(server.start_tcp(args.host,
+                                                            args.port))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        loop.run_until_complete(listener.wait_closed())
+        loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import math
+import time
+
+
+# timer for lookup latencies, perf_counter where there is one
+clock = getattr(time, 'perf_counter', time.time)
+
+# latency bucket i counts lookups under 2 ** i nanoseconds, the last bucket
+# takes everything slower.
+LATENCY_BUCKETS = 40
+
+
+def _bucket(seconds):
+    nanoseconds = seconds * 1e9
+    if nanoseconds < 1:
+        return 0
+    return min(math.frexp(nanoseconds)[1], LATENCY_BUCKETS - 1)
+
+
+class LookupStats(object):
+
+    # Selection counters and a latency histogram for the lookups made on a
+    # ring or cluster that has them enabled. The optional callback is called
+    # with (key, result, seconds) for every lookup, batch lookups report each
+    # key with the batch's average latency. Updates aren't locked, counts
+    # from lookups racing in several threads may be slightly low.
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.reset()
+
+    def reset(self):
+        self.lookups = 0
+        self.ties = 0
+        self.nodes = {}
+        self.zones = {}
+        self.latency = [0] * LATENCY_BUCKETS
+        self.latency_total = 0.0
+
+    def add_node(self, node):
+        self.nodes[node] = self.nodes.get(node, 0) + 1
+
+    def add_zone(self, zone):
+        self.zones[zone] = self.zones.get(zone, 0) + 1
+
+    def add_tie(self):
+        self.ties += 1
+
+    def add_lookup(self, key, result, seconds):
+        self.lookups += 1
+        self.latency_total += seconds
+        self.latency[_bucket(seconds)] += 1
+        if self.callback is not None:
+            self.callback(key, result, seconds)
+
+    def add_lookups(self, keys, results, seconds):
+        count = len(keys)
+        if not count:
+            return
+        each = seconds / count
+        self.lookups += count
+        self.latency_total += seconds
+        self.latency[_bucket(each)] += count
+        if self.callback is not None:
+            for key, result in zip(keys, results):
+                self.callback(key, result, each)
+
+    def snapshot(self):
+        # latency is a list of (upper bound in seconds, count) for each
+        # non-empty bucket, fastest first.
+        return {
+            'lookups': self.lookups,
+            'ties': self.ties,
+            'nodes': dict(self.nodes),
+            'zones': dict(self.zones),
+            'latency': [(2.0 ** bucket / 1e9, count)
+                        for bucket, count in enumerate(self.latency)
+                        if count],
+            'latency_total': self.latency_total,
+        }
+
+
+class RingStats(object):
+
+    # What a Cluster hands its rings. The cluster counts lookups, nodes and
+    # zones itself, cache hits included, so its rings only report ties.
+
+    __slots__ = ('stats',)
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def add_node(self, node):
+        pass
+
+    def add_tie(self):
+        self.stats.ties += 1
+
+    def add_lookup(self, key, result, seconds):
+        pass
+
+    def add_lookups(self, keys, results, seconds):
+        pass
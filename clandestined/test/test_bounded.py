@@ -0,0 +1,212 @@
+import math
+import pickle
+import unittest
+
+from clandestined import Cluster
+from clandestined import HierarchicalRendezvousHash
+from clandestined import RendezvousHash
+from clandestined.bounded import BoundedLoad
+
+
+class BoundedLoadTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.nodes = [str(i) for i in range(8)]
+        self.ring = RendezvousHash(nodes=self.nodes)
+        self.keys = [str(i) for i in range(2000)]
+
+    def test_loads(self):
+        load = BoundedLoad()
+        load.add('1')
+        load.add('1', 3)
+        load.add('2')
+        load.release('2')
+        load.release('3')
+        self.assertEqual({'1': 4}, load.loads)
+        self.assertEqual(4, load.load('1'))
+        self.assertEqual(0, load.load('2'))
+        load.set_load('2', 5)
+        load.set_load('1', 0)
+        self.assertEqual({'2': 5}, load.loads)
+        load.reset()
+        self.assertEqual({}, load.loads)
+        self.assertRaises(ValueError, BoundedLoad, 0.5)
+
+    def test_bound(self):
+        load = BoundedLoad(1.5)
+        # the key being placed counts towards the ring's load
+        self.assertEqual(1, load.bound(self.ring, '0'))
+        for node in self.nodes:
+            load.add(node, 2)
+        self.assertEqual(4, load.bound(self.ring, '0'))
+        # load outside the ring doesn't count
+        load.add('elsewhere', 100)
+        self.assertEqual(4, load.bound(self.ring, '0'))
+
+        self.ring.set_weight('0', 2)
+        self.assertEqual(6, load.bound(self.ring, '0'))
+        self.assertEqual(3, load.bound(self.ring, '1'))
+
+        self.assertEqual(7, BoundedLoad(capacity=7).bound(self.ring, '0'))
+        load = BoundedLoad(1.5, capacity={'0': 9})
+        self.assertEqual(9, load.bound(self.ring, '0'))
+        self.assertEqual(1, load.bound(self.ring, '1'))
+
+    def test_unloaded(self):
+        load = BoundedLoad()
+        for key in self.keys:
+            self.assertEqual(self.ring.find_node(key),
+                             load.find_node(self.ring, key))
+        self.assertEqual(None, load.find_node(RendezvousHash(), 'lol'))
+
+    def test_skips_overloaded(self):
+        load = BoundedLoad(capacity=1)
+        order = list(self.ring.iter_nodes('lol'))
+        for expected in order:
+            self.assertEqual(expected, load.find_node(self.ring, 'lol'))
+            load.add(expected)
+        # all nodes are full, the first one least over its bound wins
+        self.assertEqual(order[0], load.find_node(self.ring, 'lol'))
+        load.release(order[3])
+        self.assertEqual(order[3], load.find_node(self.ring, 'lol'))
+        load.add(order[3])
+        load.add(order[0])
+        self.assertEqual(order[1], load.find_node(self.ring, 'lol'))
+
+    def test_deterministic(self):
+        loads = {'0': 30, '3': 12, '5': 40}
+        first = BoundedLoad(1.1)
+        second = BoundedLoad(1.1)
+        for node, amount in loads.items():
+            first.set_load(node, amount)
+            second.set_load(node, amount)
+        self.assertEqual([first.find_node(self.ring, key)
+                          for key in self.keys],
+                         [second.find_node(self.ring, key)
+                          for key in self.keys])
+
+    def test_max_load(self):
+        # skewed keys, most of which share a winner without a bound
+        keys = [key for key in self.keys
+                if self.ring.find_node(key) in ('0', '1')]
+        for load_factor in (1.0, 1.1, 1.5):
+            load = BoundedLoad(load_factor)
+            for key in keys:
+                load.add(load.find_node(self.ring, key))
+            self.assertEqual(len(keys), sum(load.loads.values()))
+            limit = math.ceil(load_factor * len(keys) / len(self.nodes))
+            self.assertTrue(max(load.loads.values()) <= limit)
+
+    def test_hierarchical(self):
+        ring = HierarchicalRendezvousHash(nodes=self.nodes, fanout=2)
+        load = BoundedLoad(capacity=1)
+        order = list(ring.iter_nodes('lol'))
+        for expected in order[:3]:
+            self.assertEqual(expected, load.find_node(ring, 'lol'))
+            load.add(expected)
+
+
+class ClusterBoundedLoadTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cluster_config = {
+            '1': {'name': 'node1', 'zone': 'a'},
+            '2': {'name': 'node2', 'zone': 'a'},
+            '3': {'name': 'node3', 'zone': 'b'},
+            '4': {'name': 'node4', 'zone': 'b'},
+            '5': {'name': 'node5', 'zone': 'c'},
+            '6': {'name': 'node6', 'zone': 'c'},
+        }
+        self.keys = [str(i) for i in range(500)]
+
+    def test_find_nodes(self):
+        cluster = Cluster(self.cluster_config, cache_size=100)
+        plain = Cluster(self.cluster_config)
+        self.assertEqual(['2', '3'], cluster.find_nodes('lol'))
+        load = cluster.enable_bounded_load(capacity=1)
+        self.assertTrue(cluster.bounded_load is load)
+        self.assertEqual(['2', '3'], cluster.find_nodes('lol'))
+        load.add('2')
+        # cached results aren't used while loads decide
+        self.assertEqual(['1', '3'], cluster.find_nodes('lol'))
+        load.add('3')
+        self.assertEqual(['1', '4'], cluster.find_nodes('lol'))
+        self.assertEqual([cluster.find_nodes(key) for key in self.keys],
+                         cluster.find_nodes_many(self.keys))
+        cluster.disable_bounded_load()
+        self.assertEqual(['2', '3'], cluster.find_nodes('lol'))
+        self.assertEqual(plain.find_nodes_many(self.keys),
+                         cluster.find_nodes_many(self.keys))
+
+    def test_assignment(self):
+        cluster = Cluster(self.cluster_config)
+        load = cluster.enable_bounded_load(1.1)
+        for key in self.keys:
+            for node in cluster.find_nodes(key):
+                load.add(node)
+        limit = math.ceil(1.1 * 2 * len(self.keys) / 6)
+        self.assertTrue(max(load.loads.values()) <= limit)
+
+    def test_find_nodes_by_index(self):
+        cluster = Cluster(self.cluster_config)
+        expected = cluster.find_nodes_by_index(1, 2)
+        load = cluster.enable_bounded_load(capacity=1)
+        self.assertEqual(expected, cluster.find_nodes_by_index(1, 2))
+        load.add(expected[0])
+        self.assertNotEqual(expected[0], cluster.find_nodes_by_index(1, 2)[0])
+
+    def test_running_totals(self):
+        # the zone totals kept by add, release and set_load, and rebuilt on
+        # topology changes, bound lookups as summing the ring's loads does
+        cluster = Cluster(self.cluster_config)
+        load = cluster.enable_bounded_load(1.1)
+
+        def check():
+            summed = BoundedLoad(1.1)
+            for node, amount in load.loads.items():
+                summed.set_load(node, amount)
+            for key in self.keys[:100]:
+                offset = sum(map(ord, key)) % len(cluster.zones)
+                zones = [cluster.zones[(i + offset) % len(cluster.zones)]
+                         for i in range(cluster.replicas)]
+                self.assertEqual([summed.find_node(cluster.rings[zone], key)
+                                  for zone in zones],
+                                 cluster.find_nodes(key))
+            for zone, tracked in load._zones.items():
+                self.assertEqual(sum(load.load(node) for node
+                                     in cluster.rings[zone].nodes),
+                                 tracked[1])
+
+        for key in self.keys:
+            for node in cluster.find_nodes(key):
+                load.add(node)
+        check()
+        load.release('1', 20)
+        load.set_load('3', 0)
+        load.add('elsewhere', 100)
+        check()
+        cluster.add_node('7', node_zone='a')
+        cluster.remove_node('4', node_zone='b')
+        load.add('4', 10)
+        load.add('7', 5)
+        check()
+        cluster.set_node_weight('5', 3, node_zone='c')
+        check()
+        load.reset()
+        check()
+
+    def test_snapshot_and_pickle(self):
+        cluster = Cluster(self.cluster_config)
+        load = cluster.enable_bounded_load(capacity=1)
+        snapshot = cluster.snapshot()
+        load.add('2')
+        self.assertEqual(['1', '3'], snapshot.find_nodes('lol'))
+        self.assertRaises(TypeError, snapshot.enable_bounded_load)
+        self.assertRaises(TypeError, snapshot.disable_bounded_load)
+        copied = pickle.loads(pickle.dumps(cluster))
+        self.assertEqual({'2': 1}, copied.bounded_load.loads)
+        self.assertEqual(['1', '3'], copied.find_nodes('lol'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+
+import unittest
+
+from clandestined.cache import LookupCache
+from clandestined.cache import _LinkedEntries
+
+
+class LookupCacheTestCase(unittest.TestCase):
+
+    def test_init(self):
+        cache = LookupCache(2)
+        self.assertEqual(2, cache.maxsize)
+        self.assertEqual(0, len(cache))
+        self.assertRaises(ValueError, LookupCache, 0)
+
+    def test_get_put(self):
+        cache = LookupCache(2)
+        self.assertEqual(None, cache.get('a', 0))
+        cache.put('a', ('1',), 0)
+        self.assertEqual(('1',), cache.get('a', 0))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def test_lru_eviction(self):
+        cache = LookupCache(2)
+        cache.get('a', 0)
+        cache.put('a', 1, 0)
+        cache.put('b', 2, 0)
+        cache.get('a', 0)
+        cache.put('c', 3, 0)
+        self.assertEqual(2, len(cache))
+        self.assertEqual(None, cache.get('b', 0))
+        self.assertEqual(1, cache.get('a', 0))
+        self.assertEqual(3, cache.get('c', 0))
+
+    def test_version_invalidates(self):
+        cache = LookupCache(2)
+        cache.get('a', 0)
+        cache.put('a', 1, 0)
+        self.assertEqual(None, cache.get('a', 1))
+        self.assertEqual(0, len(cache))
+        # results computed against an older topology are not stored
+        cache.put('a', 1, 0)
+        self.assertEqual(0, len(cache))
+
+    def test_info(self):
+        cache = LookupCache(2)
+        cache.get('a', 3)
+        cache.put('a', 1, 3)
+        cache.get('a', 3)
+        self.assertEqual({'hits': 1, 'misses': 1, 'size': 1, 'maxsize': 2,
+                          'version': 3}, cache.info())
+
+    def test_linked_entries(self):
+        # the LRU used where collections has no OrderedDict
+        cache = LookupCache(2)
+        cache._entries = _LinkedEntries()
+        cache.get('a', 0)
+        cache.put('a', 1, 0)
+        cache.put('b', 2, 0)
+        cache.get('a', 0)
+        cache.put('c', 3, 0)
+        self.assertEqual(2, len(cache))
+        self.assertEqual(None, cache.get('b', 0))
+        self.assertEqual(1, cache.get('a', 0))
+        self.assertEqual(3, cache.get('c', 0))
+        cache.put('c', 4, 0)
+        self.assertEqual(4, cache.get('c', 0))
+        self.assertEqual(None, cache.get('a', 1))
+        self.assertEqual(0, len(cache))
+        entries = _LinkedEntries()
+        self.assertRaises(KeyError, entries.popitem)
+        self.assertRaises(KeyError, entries.pop, 'a')
+        for key in 'abc':
+            entries[key] = key.upper()
+        self.assertEqual(('c', 'C'), entries.popitem())
+        self.assertEqual(('a', 'A'), entries.popitem(last=False))
+        self.assertEqual(('b', 'B'), entries.popitem(last=False))
+        self.assertEqual(0, len(entries))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,9 +2,22 @@
 import unittest
 
 from test_docs import *
+from test_bounded import *
+from test_cache import *
 from test_cluster import *
 from test_collision import *
+from test_distribution import *
+from test_engines import *
+from test_health import *
+from test_hierarchical import *
+from test_maglev import *
+from test_main import *
+from test_murmur3 import *
+from test_partitions import *
 from test_rendezvous_hash import *
+from test_server import *
+from test_stats import *
+from test_topology import *
 
 if __name__ == '__main__':
     unittest.main()
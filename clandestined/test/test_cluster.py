@@ -1,7 +1,11 @@
 
+import pickle
+import threading
 import unittest
 
 from clandestined import Cluster
+from clandestined import ClusterSnapshot
+from clandestined import HierarchicalRendezvousHash
 
 
 class ClusterTestCase(unittest.TestCase):
@@ -187,6 +191,141 @@ class ClusterTestCase(unittest.TestCase):
         self.assertEqual(['1', '3'], cluster.find_nodes('foo'))
         self.assertEqual(['2', '4'], cluster.find_nodes('slap'))
 
+    def test_find_nodes_many(self):
+        cluster_config = {
+            '1': {'name': 'node1', 'zone': 'a'},
+            '2': {'name': 'node2', 'zone': 'a'},
+            '3': {'name': 'node3', 'zone': 'b'},
+            '4': {'name': 'node4', 'zone': 'b'},
+            '5': {'name': 'node5', 'zone': 'c'},
+            '6': {'name': 'node6', 'zone': 'c'},
+        }
+        cluster = Cluster(cluster_config)
+
+        self.assertEqual([['2', '3'], ['6', '2'], ['5', '2']],
+                         cluster.find_nodes_many(['lol', 'wat', 'ok']))
+        self.assertEqual([], cluster.find_nodes_many([]))
+
+        keys = [str(i) for i in range(1000)]
+        for replicas in (1, 2, 3, 4):
+            cluster.replicas = replicas
+            self.assertEqual([cluster.find_nodes(key) for key in keys],
+                             cluster.find_nodes_many(iter(keys)))
+
+    def test_find_nodes_many_workers(self):
+        cluster_config = {
+            '1': {'name': 'node1', 'zone': 'a'},
+            '2': {'name': 'node2', 'zone': 'a', 'weight': 2},
+            '3': {'name': 'node3', 'zone': 'b'},
+            '4': {'name': 'node4', 'zone': 'b'},
+            '5': {'name': 'node5', 'zone': 'c'},
+        }
+        cluster = Cluster(cluster_config)
+
+        keys = [str(i) for i in range(20000)]
+        expected = cluster.find_nodes_many(keys)
+        for workers in (None, 1, 2, 3, 8):
+            self.assertEqual(expected,
+                             cluster.find_nodes_many(iter(keys),
+                                                     workers=workers))
+        self.assertEqual([['2', '3']],
+                         cluster.find_nodes_many(['lol'], workers=4))
+        self.assertEqual([], cluster.find_nodes_many([], workers=4))
+
+    def test_pickle(self):
+        cluster_config = {
+            '1': {'name': 'node1', 'zone': 'a', 'weight': 2},
+            '2': {'name': 'node2', 'zone': 'a'},
+            '3': {'name': 'node3', 'zone': 'b'},
+        }
+        cluster = Cluster(cluster_config, seed=10, cache_size=16)
+        keys = [str(i) for i in range(100)]
+        expected = cluster.find_nodes_many(keys)
+
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copied = pickle.loads(pickle.dumps(cluster, protocol))
+            self.assertEqual(expected, copied.find_nodes_many(keys))
+            self.assertEqual(cluster.version, copied.version)
+            copied.add_node('4', node_zone='c')
+            self.assertEqual(['a', 'b', 'c'], copied.zones)
+            self.assertEqual(10, copied.rings['c'].seed)
+            self.assertEqual(['a', 'b'], cluster.zones)
+
+    def test_weights(self):
+        cluster_config = {
+            '1': {'zone': 'a', 'weight': 2},
+            '2': {'zone': 'a'},
+            '3': {'zone': 'b'},
+            '4': {'zone': 'b', 'weight': 0.5},
+        }
+        cluster = Cluster(cluster_config)
+        self.assertEqual({'1': 2.0}, cluster.rings['a'].weights)
+        self.assertEqual({'4': 0.5}, cluster.rings['b'].weights)
+
+        placements = cluster.find_nodes_many(str(i) for i in range(10000))
+        counts = {}
+        for nodes in placements:
+            for node in nodes:
+                counts[node] = counts.get(node, 0) + 1
+        self.assertEqual({'1': 6738, '2': 3262, '3': 6658, '4': 3342}, counts)
+
+        cluster.set_node_weight('4', 1, node_zone='b')
+        self.assertEqual({}, cluster.rings['b'].weights)
+        self.assertRaises(ValueError, cluster.set_node_weight, '4', 1, 'c')
+        self.assertEqual(['a', 'b'], sorted(cluster.rings))
+
+    def test_version(self):
+        cluster = Cluster()
+        self.assertEqual(0, cluster.version)
+        cluster.add_node('1', node_zone='a')
+        version = cluster.version
+        cluster.add_zone('a')
+        self.assertEqual(version, cluster.version)
+        cluster.add_node('2', node_zone='a')
+        self.assertTrue(cluster.version > version)
+        version = cluster.version
+        cluster.set_node_weight('2', 2, node_zone='a')
+        self.assertTrue(cluster.version > version)
+        version = cluster.version
+        cluster.remove_node('2', node_zone='a')
+        self.assertTrue(cluster.version > version)
+        version = cluster.version
+        cluster.remove_zone('a')
+        self.assertTrue(cluster.version > version)
+        self.assertEqual({}, cluster.nodes)
+
+    def test_cache(self):
+        cluster_config = {
+            '1': {'name': 'node1', 'zone': 'a'},
+            '2': {'name': 'node2', 'zone': 'a'},
+            '3': {'name': 'node3', 'zone': 'b'},
+            '4': {'name': 'node4', 'zone': 'b'},
+            '5': {'name': 'node5', 'zone': 'c'},
+            '6': {'name': 'node6', 'zone': 'c'},
+        }
+        self.assertEqual(None, Cluster(cluster_config).cache)
+        cluster = Cluster(cluster_config, cache_size=100)
+
+        self.assertEqual(['2', '3'], cluster.find_nodes('lol'))
+        self.assertEqual(['2', '3'], cluster.find_nodes('lol'))
+        self.assertEqual(['6', '1'], cluster.find_nodes_by_index(1, 1))
+        self.assertEqual(['6', '1'], cluster.find_nodes_by_index(1, 1))
+        self.assertEqual(2, cluster.cache.hits)
+        self.assertEqual(2, cluster.cache.misses)
+
+        cluster.find_nodes('lol').append('mutated')
+        self.assertEqual(['2', '3'], cluster.find_nodes('lol'))
+
+        cluster.replicas = 3
+        self.assertEqual(['2', '3', '5'], cluster.find_nodes('lol'))
+        cluster.replicas = 2
+
+        cluster.remove_node('2', node_zone='a')
+        self.assertEqual(['1', '3'], cluster.find_nodes('lol'))
+        cluster.add_node('2', node_zone='a')
+        self.assertEqual(['2', '3'], cluster.find_nodes('lol'))
+        self.assertEqual(5, cluster.cache.misses)
+
     def test_find_nodes_by_index(self):
         cluster_config = {
             '1': {'name': 'node1', 'zone': 'a'},
@@ -205,6 +344,249 @@ class ClusterTestCase(unittest.TestCase):
         self.assertEqual(['3', '5'], cluster.find_nodes_by_index(2, 2))
         self.assertEqual(['5', '2'], cluster.find_nodes_by_index(2, 3))
 
+    def test_copy(self):
+        cluster_config = {
+            '1': {'name': 'node1', 'zone': 'a', 'weight': 2},
+            '2': {'name': 'node2', 'zone': 'a'},
+            '3': {'name': 'node3', 'zone': 'b'},
+        }
+        cluster = Cluster(cluster_config, replicas=3, seed=7)
+        copy = cluster.copy()
+        self.assertEqual(cluster.nodes, copy.nodes)
+        self.assertEqual(cluster.zones, copy.zones)
+        self.assertEqual(3, copy.replicas)
+        self.assertEqual(7, copy.seed)
+        self.assertEqual({'1': 2.0}, copy.rings['a'].weights)
+        copy.remove_node('3', node_zone='b')
+        self.assertEqual(['a', 'b'], cluster.zones)
+
+
+class ClusterPlanTestCase(unittest.TestCase):
+
+    cluster_config = {
+        '1': {'name': 'node1', 'zone': 'a'},
+        '2': {'name': 'node2', 'zone': 'a'},
+        '3': {'name': 'node3', 'zone': 'b'},
+        '4': {'name': 'node4', 'zone': 'b', 'weight': 2},
+        '5': {'name': 'node5', 'zone': 'c'},
+        '6': {'name': 'node6', 'zone': 'c'},
+    }
+    keys = [str(i) for i in range(3000)]
+
+    def expected(self, cluster, change):
+        trial = cluster.copy()
+        change(trial)
+        return [(key, old, new) for key, old, new
+                in zip(self.keys, cluster.find_nodes_many(self.keys),
+                       trial.find_nodes_many(self.keys))
+                if old != new]
+
+    def test_plan_add_node(self):
+        cluster = Cluster(self.cluster_config)
+        plan = list(cluster.plan_add_node(iter(self.keys), '7', node_zone='a'))
+        self.assertEqual(self.expected(
+            cluster, lambda c: c.add_node('7', node_zone='a')), plan)
+        self.assertTrue(plan)
+        for key, old, new in plan:
+            self.assertTrue('7' in new)
+        self.assertEqual(6, len(cluster.nodes))
+
+    def test_plan_add_weighted_node(self):
+        cluster = Cluster(self.cluster_config)
+        for zone in ('a', 'b'):
+            plan = list(cluster.plan_add_node(self.keys, '7', node_zone=zone,
+                                              node_weight=3))
+            self.assertEqual(self.expected(
+                cluster, lambda c: c.add_node('7', node_zone=zone,
+                                              node_weight=3)), plan)
+
+    def test_plan_add_zone(self):
+        cluster = Cluster(self.cluster_config)
+        plan = list(cluster.plan_add_node(self.keys, '7', node_zone='d'))
+        self.assertEqual(self.expected(
+            cluster, lambda c: c.add_node('7', node_zone='d')), plan)
+        self.assertEqual(['a', 'b', 'c'], cluster.zones)
+
+    def test_plan_add_existing(self):
+        cluster = Cluster(self.cluster_config)
+        self.assertRaises(ValueError, cluster.plan_add_node, self.keys, '1')
+
+    def test_plan_remove_node(self):
+        cluster = Cluster(self.cluster_config)
+        plan = list(cluster.plan_remove_node(self.keys, '3', node_zone='b'))
+        self.assertEqual(self.expected(
+            cluster, lambda c: c.remove_node('3', node_zone='b')), plan)
+        for key, old, new in plan:
+            self.assertTrue('3' in old)
+        self.assertRaises(ValueError, cluster.plan_remove_node, self.keys,
+                          '3', node_zone='a')
+
+    def test_plan_remove_zone(self):
+        cluster = Cluster(self.cluster_config)
+        cluster.remove_node('6', node_zone='c')
+        plan = list(cluster.plan_remove_node(self.keys, '5', node_zone='c'))
+        self.assertEqual(self.expected(
+            cluster, lambda c: c.remove_node('5', node_zone='c')), plan)
+
+    def test_plan_hierarchical(self):
+        cluster_config = dict(self.cluster_config)
+        cluster_config['4'] = {'name': 'node4', 'zone': 'b'}
+        cluster = Cluster(cluster_config,
+                          ring_class=HierarchicalRendezvousHash)
+        plan = list(cluster.plan_add_node(self.keys, '7', node_zone='a'))
+        self.assertEqual(self.expected(
+            cluster, lambda c: c.add_node('7', node_zone='a')), plan)
+        plan = list(cluster.plan_remove_node(self.keys, '1', node_zone='a'))
+        self.assertEqual(self.expected(
+            cluster, lambda c: c.remove_node('1', node_zone='a')), plan)
+
+
+class ClusterSnapshotTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cluster_config = {
+            '1': {'name': 'node1', 'zone': 'a'},
+            '2': {'name': 'node2', 'zone': 'a', 'weight': 2},
+            '3': {'name': 'node3', 'zone': 'b'},
+            '4': {'name': 'node4', 'zone': 'b'},
+            '5': {'name': 'node5', 'zone': 'c'},
+            '6': {'name': 'node6', 'zone': 'c'},
+        }
+        self.keys = [str(i) for i in range(500)]
+
+    def test_lookups(self):
+        cluster = Cluster(self.cluster_config)
+        snapshot = cluster.snapshot()
+        self.assertTrue(isinstance(snapshot, ClusterSnapshot))
+        self.assertEqual(cluster.version, snapshot.version)
+        self.assertEqual(('a', 'b', 'c'), snapshot.zones)
+        self.assertEqual('node3', snapshot.node_name('3'))
+        self.assertEqual(cluster.find_nodes_many(self.keys),
+                         snapshot.find_nodes_many(self.keys))
+        self.assertEqual([cluster.find_nodes(key) for key in self.keys],
+                         [snapshot.find_nodes(key) for key in self.keys])
+        self.assertEqual(cluster.find_nodes_by_index(1, 2),
+                         snapshot.find_nodes_by_index(1, 2))
+
+    def test_immutable(self):
+        cluster = Cluster(self.cluster_config)
+        snapshot = cluster.snapshot()
+        self.assertRaises(TypeError, snapshot.add_node, '7', 'a')
+        self.assertRaises(TypeError, snapshot.remove_node, '1', node_zone='a')
+        self.assertRaises(TypeError, snapshot.set_node_weight, '1', 2, 'a')
+        self.assertRaises(TypeError, snapshot.add_zone, 'd')
+        self.assertRaises(TypeError, snapshot.remove_zone, 'a')
+        self.assertRaises(TypeError, snapshot.publish)
+        self.assertRaises(AttributeError, setattr, snapshot, 'replicas', 3)
+        self.assertRaises(AttributeError, delattr, snapshot, 'replicas')
+        self.assertTrue(snapshot.snapshot() is snapshot)
+
+    def test_isolated_from_changes(self):
+        cluster = Cluster(self.cluster_config)
+        snapshot = cluster.snapshot()
+        expected = snapshot.find_nodes_many(self.keys)
+        cluster.add_node('7', node_zone='a')
+        cluster.remove_node('3', node_zone='b')
+        cluster.set_node_weight('5', 3, node_zone='c')
+        cluster.remove_node('4', node_zone='b')
+        self.assertEqual(expected, snapshot.find_nodes_many(self.keys))
+        self.assertEqual(('a', 'b', 'c'), snapshot.zones)
+        self.assertEqual(('3', '4'), tuple(sorted(snapshot.zone_members['b'])))
+
+        rebuilt = snapshot.copy()
+        self.assertEqual(expected, rebuilt.find_nodes_many(self.keys))
+        rebuilt.add_node('7', node_zone='a')
+        self.assertEqual(expected, snapshot.find_nodes_many(self.keys))
+
+    def test_copy_on_write(self):
+        cluster = Cluster(self.cluster_config)
+        first = cluster.snapshot()
+        self.assertTrue(cluster.snapshot() is first)
+
+        cluster.add_node('7', node_zone='a')
+        second = cluster.snapshot()
+        self.assertFalse(second is first)
+        self.assertFalse(second.rings['a'] is first.rings['a'])
+        self.assertTrue(second.rings['b'] is first.rings['b'])
+        self.assertTrue(second.rings['c'] is first.rings['c'])
+        self.assertFalse(second.rings['a'] is cluster.rings['a'])
+        self.assertEqual(cluster.find_nodes_many(self.keys),
+                         second.find_nodes_many(self.keys))
+
+        cluster.set_node_weight('5', 3, node_zone='c')
+        third = cluster.snapshot()
+        self.assertTrue(third.rings['a'] is second.rings['a'])
+        self.assertFalse(third.rings['c'] is second.rings['c'])
+
+        cluster.remove_node('5', node_zone='c')
+        cluster.remove_node('6', node_zone='c')
+        cluster.add_node('5', node_zone='c')
+        fourth = cluster.snapshot()
+        self.assertFalse(fourth.rings['c'] is third.rings['c'])
+        self.assertEqual(['5'], fourth.rings['c'].nodes)
+
+    def test_publish(self):
+        cluster = Cluster(self.cluster_config)
+        self.assertEqual(None, cluster.published)
+        published = cluster.publish()
+        self.assertTrue(cluster.published is published)
+        cluster.add_node('7', node_zone='a')
+        self.assertTrue(cluster.published is published)
+        self.assertFalse(cluster.publish() is published)
+        self.assertEqual(cluster.version, cluster.published.version)
+
+    def test_hierarchical(self):
+        cluster_config = dict((node_id, {'zone': data['zone']})
+                              for node_id, data in self.cluster_config.items())
+        cluster = Cluster(cluster_config,
+                          ring_class=HierarchicalRendezvousHash)
+        snapshot = cluster.snapshot()
+        expected = snapshot.find_nodes_many(self.keys)
+        cluster.add_node('7', node_zone='a')
+        self.assertEqual(expected, snapshot.find_nodes_many(self.keys))
+
+    def test_pickle(self):
+        cluster = Cluster(self.cluster_config)
+        snapshot = cluster.publish()
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copied = pickle.loads(pickle.dumps(snapshot, protocol))
+            self.assertEqual(snapshot.find_nodes_many(self.keys),
+                             copied.find_nodes_many(self.keys))
+            self.assertRaises(TypeError, copied.add_node, '7', 'a')
+
+    def test_concurrent_readers(self):
+        cluster = Cluster(self.cluster_config)
+        cluster.publish()
+        errors = []
+        done = threading.Event()
+
+        def read():
+            try:
+                while not done.is_set():
+                    snapshot = cluster.published
+                    for key in self.keys[:50]:
+                        for node in snapshot.find_nodes(key):
+                            if node not in snapshot.nodes:
+                                errors.append((key, node))
+            except Exception as e:
+                errors.append(e)
+
+        readers = [threading.Thread(target=read) for i in range(4)]
+        for reader in readers:
+            reader.start()
+        try:
+            for i in range(200):
+                node_id = 'new%d' % (i,)
+                cluster.add_node(node_id, node_zone='abc'[i % 3])
+                cluster.publish()
+                cluster.remove_node(node_id, node_zone='abc'[i % 3])
+                cluster.publish()
+        finally:
+            done.set()
+            for reader in readers:
+                reader.join()
+        self.assertEqual([], errors)
+
 
 class ClusterIntegrationTestCase(unittest.TestCase):
 
@@ -28,6 +28,14 @@ class CollisionTestCase(unittest.TestCase):
         for i in range(1000):
             self.assertEqual('c', rendezvous.find_node(i))
 
+    def test_rendezvous_find_nodes_collision(self):
+        nodes = ['b', 'c', 'a', 'd']
+        rendezvous = RendezvousHash(nodes)
+        for i in range(100):
+            self.assertEqual(['d', 'c'], rendezvous.find_nodes(i, 2))
+            self.assertEqual(['d', 'c', 'b', 'a'],
+                             list(rendezvous.iter_nodes(i)))
+
     def test_rendezvous_names(self):
         nodes = [1, 2, 3, 'a', 'b', 'lol.wat.com']
         rendezvous = RendezvousHash(nodes)
@@ -0,0 +1,133 @@
+import sys
+import unittest
+
+from clandestined import Cluster
+from clandestined import HierarchicalRendezvousHash
+from clandestined import distribution
+
+
+class DistributionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cluster_config = {
+            '1': {'name': 'node1', 'zone': 'a'},
+            '2': {'name': 'node2', 'zone': 'a', 'weight': 2},
+            '3': {'name': 'node3', 'zone': 'b'},
+            '4': {'name': 'node4', 'zone': 'b'},
+            '5': {'name': 'node5', 'zone': 'c'},
+            '6': {'name': 'node6', 'zone': 'c'},
+            '7': {'name': 'node7', 'zone': 'c'},
+        }
+        # rings str() their keys, which takes UTF-8 bytes on Python 2
+        cafe = u'caf\xe9'
+        if sys.version_info[0] < 3:
+            cafe = cafe.encode('utf-8')
+        self.keys = [str(i) for i in range(2000)] + ['', cafe, '0']
+
+    def without_numpy(self):
+        numpy = distribution.numpy
+        distribution.numpy = None
+        self.addCleanup(setattr, distribution, 'numpy', numpy)
+
+    def expected(self, cluster, keys):
+        # what a loop over find_nodes counts
+        zone_of = dict((node, zone) for zone in cluster.zones
+                       for node in cluster.zone_members[zone])
+        names = dict((str(node), node) for node in cluster.nodes)
+        nodes = dict((node, 0) for node in cluster.nodes)
+        zones = dict((zone, 0) for zone in cluster.zones)
+        slots = [dict((node, 0) for node in cluster.nodes)
+                 for slot in range(cluster.replicas)]
+        offsets = dict((zone, 0) for zone in cluster.zones)
+        for key in keys:
+            found = cluster.find_nodes(key)
+            offset = sum(ord(char) for char in key) % len(cluster.zones)
+            offsets[cluster.zones[offset]] += 1
+            for slot, node in enumerate(found):
+                # tie-break winners are the str() of the winning node id
+                if node not in nodes:
+                    node = names[node]
+                nodes[node] += 1
+                zones[zone_of[node]] += 1
+                slots[slot][node] += 1
+        return nodes, zones, slots, offsets
+
+    def assertDistribution(self, cluster, keys):
+        result = cluster.distribution(keys)
+        nodes, zones, slots, offsets = self.expected(cluster, keys)
+        self.assertEqual(len(keys), result['keys'])
+        self.assertEqual(nodes, result['nodes'])
+        self.assertEqual(zones, result['zones'])
+        self.assertEqual(slots, result['slots'])
+        self.assertEqual(offsets, result['offsets'])
+        return result
+
+    def test_matches_find_nodes(self):
+        for replicas in (1, 2, 3, 5):
+            cluster = Cluster(self.cluster_config, replicas=replicas)
+            self.assertDistribution(cluster, self.keys)
+
+    def test_matches_find_nodes_without_numpy(self):
+        self.without_numpy()
+        for replicas in (1, 2, 4):
+            cluster = Cluster(self.cluster_config, replicas=replicas)
+            self.assertDistribution(cluster, self.keys)
+
+    def test_ties(self):
+        # "14558-0" and "109786-0" share a murmur3_32 hash
+        cluster = Cluster(self.cluster_config)
+        cluster.add_node(14558, node_zone='d')
+        cluster.add_node(109786, node_zone='d')
+        self.assertEqual('14558', cluster.rings['d'].find_node('0'))
+        self.assertDistribution(cluster, self.keys)
+        self.without_numpy()
+        self.assertDistribution(cluster, self.keys)
+
+    def test_other_rings(self):
+        del self.cluster_config['2']['weight']
+        cluster = Cluster(self.cluster_config,
+                          ring_class=HierarchicalRendezvousHash)
+        self.assertDistribution(cluster, self.keys)
+
+    def test_shares_and_imbalance(self):
+        cluster = Cluster(self.cluster_config)
+        result = cluster.distribution(self.keys)
+        self.assertEqual(float(result['nodes']['2']) / len(self.keys),
+                         result['node_share']['2'])
+        self.assertAlmostEqual(2.0, sum(result['zone_share'].values()))
+        # node 2 is weighted to take twice node 1's share
+        self.assertTrue(result['nodes']['2'] > result['nodes']['1'] * 1.7)
+        imbalance = result['imbalance']['nodes']
+        self.assertEqual(max(result['nodes'].values()), imbalance['max'])
+        self.assertAlmostEqual(2.0 * len(self.keys) / 7, imbalance['mean'])
+        self.assertAlmostEqual(imbalance['max'] / imbalance['mean'],
+                               imbalance['max_mean'])
+
+    def test_zone_offset_skew(self):
+        # sum(ord) of two digit keys is far from uniform over 4 zones
+        cluster = Cluster(self.cluster_config)
+        cluster.add_node('8', node_zone='d')
+        keys = [str(i) for i in range(10, 100)]
+        result = self.assertDistribution(cluster, keys)
+        self.assertEqual(len(keys), sum(result['offsets'].values()))
+        self.assertTrue(result['imbalance']['offsets']['max_mean'] > 1.0)
+
+    def test_imbalance(self):
+        self.assertEqual({'mean': 2.0, 'max': 3, 'max_mean': 1.5,
+                          'stddev': 1.0}, distribution.imbalance([1, 3]))
+        self.assertEqual(None, distribution.imbalance([0, 0])['max_mean'])
+        self.assertEqual(None, distribution.imbalance([])['max_mean'])
+
+    def test_empty(self):
+        cluster = Cluster(self.cluster_config)
+        result = cluster.distribution([])
+        self.assertEqual(0, result['keys'])
+        self.assertEqual(0, sum(result['nodes'].values()))
+        self.assertEqual(0.0, result['node_share']['1'])
+        cluster.add_zone('empty')
+        self.assertEqual(0, cluster.distribution(self.keys)['zones']['empty'])
+        self.assertRaises(ValueError, Cluster().distribution, self.keys)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,243 @@
+import copy
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from clandestined import Cluster
+from clandestined import RendezvousHash
+from clandestined import murmur3
+from clandestined.engines import MIX64
+from clandestined.engines import MURMUR3_32
+from clandestined.engines import MURMUR3_128
+from clandestined.engines import ENGINES
+from clandestined.engines import Engine
+from clandestined.engines import get_engine
+from clandestined.engines import register_engine
+
+
+class Murmur3x128TestCase(unittest.TestCase):
+
+    # reference digests from the mmh3 package's hash128
+    vectors = [
+        (b'', 0, 0),
+        (b'', 42, 277815913556825370913473028741106730275),
+        (b'a', 0, 306663426871196026783582893802692114569),
+        (b'hello', 0, 121118445609844952839898260755277781762),
+    ]
+
+    def test_vectors(self):
+        for data, seed, digest in self.vectors:
+            self.assertEqual(digest, murmur3.murmur3_x64_128(data, seed))
+            self.assertEqual(digest,
+                             murmur3.pure_murmur3_x64_128(data, seed))
+
+    def test_pure_matches(self):
+        for length in range(40):
+            data = ''.join(chr(97 + i % 26) for i in range(length))
+            self.assertEqual(murmur3.pure_murmur3_x64_128(data, 7),
+                             murmur3.murmur3_x64_128(data, 7))
+        self.assertEqual(murmur3.murmur3_x64_128(b'node1-mykey'),
+                         murmur3.murmur3_x64_128('node1-mykey'))
+
+
+class EngineTestCase(unittest.TestCase):
+
+    engines = ['murmur3_32', 'murmur3_128', 'mix64']
+
+    def setUp(self):
+        self.nodes = ['node%d.example.com' % (i,) for i in range(10)]
+        self.keys = [str(i) for i in range(500)]
+
+    def test_get_engine(self):
+        self.assertTrue(get_engine() is MURMUR3_32)
+        self.assertTrue(get_engine('murmur3_128') is MURMUR3_128)
+        self.assertTrue(get_engine(MIX64) is MIX64)
+        self.assertRaises(ValueError, get_engine, 'md5')
+        self.assertRaises(ValueError, RendezvousHash, engine='md5')
+
+    def test_register_engine(self):
+        class Sum(Engine):
+            name = 'sum'
+
+            def score(self, seed, prefix, key):
+                return sum(bytearray((prefix + key).encode('utf-8'))) + seed
+
+        class Unscored(Engine):
+            name = 'unscored'
+
+        self.addCleanup(ENGINES.pop, 'sum', None)
+        engine = register_engine(Sum())
+        self.assertTrue(get_engine('sum') is engine)
+        ring = RendezvousHash(['a', 'b', 'c'], engine='sum')
+        self.assertEqual('c', ring.find_node('x'))
+        self.assertEqual(['c', 'b', 'a'], ring.find_nodes('x', 3))
+        # the base class and engines without their own score are rejected
+        self.assertRaises(TypeError, register_engine, Engine())
+        self.assertRaises(TypeError, register_engine, Unscored())
+        self.assertRaises(TypeError, RendezvousHash, engine=Unscored())
+        self.assertRaises(TypeError, register_engine, 'md5')
+        unnamed = Sum()
+        unnamed.name = None
+        self.assertRaises(ValueError, register_engine, unnamed)
+        self.assertEqual(set(['murmur3_32', 'murmur3_128', 'mix64', 'sum']),
+                         set(ENGINES))
+
+    def test_default_unchanged(self):
+        ring = RendezvousHash(nodes=self.nodes)
+        default = RendezvousHash(nodes=self.nodes, engine='murmur3_32')
+        self.assertTrue(ring.engine is MURMUR3_32)
+        self.assertEqual([ring.find_node(key) for key in self.keys],
+                         [default.find_node(key) for key in self.keys])
+        self.assertEqual(murmur3.murmur3_32('node1.example.com-lol'),
+                         ring.score('node1.example.com', 'lol'))
+
+    def test_lookups_agree(self):
+        for engine in self.engines:
+            ring = RendezvousHash(nodes=self.nodes, engine=engine)
+            found = [ring.find_node(key) for key in self.keys]
+            self.assertEqual(found, ring.find_node_many(self.keys))
+            self.assertEqual(found, [next(ring.iter_nodes(key))
+                                     for key in self.keys])
+            scores = list(ring._scores('lol'))
+            self.assertEqual(ring.nodes[scores.index(max(scores))],
+                             ring.find_node('lol'))
+            self.assertEqual(scores, [ring.score(node, 'lol')
+                                      for node in ring.nodes])
+            # each engine spreads the keys over every node
+            self.assertEqual(set(self.nodes), set(found))
+
+    def test_engines_differ(self):
+        found = [[RendezvousHash(nodes=self.nodes, engine=engine)
+                  .find_node(key) for key in self.keys]
+                 for engine in self.engines]
+        self.assertNotEqual(found[0], found[1])
+        self.assertNotEqual(found[1], found[2])
+
+    def test_score_width(self):
+        ring = RendezvousHash(nodes=self.nodes, engine='murmur3_128')
+        self.assertTrue(max(max(ring._scores(key)) for key in self.keys)
+                        >= 2 ** 64)
+        ring = RendezvousHash(nodes=self.nodes, engine='mix64')
+        self.assertTrue(max(max(ring._scores(key)) for key in self.keys)
+                        < 2 ** 64)
+
+    def test_weights(self):
+        for engine in self.engines:
+            ring = RendezvousHash(nodes=self.nodes, engine=engine,
+                                  weights={self.nodes[0]: 10})
+            found = [ring.find_node(key) for key in self.keys]
+            self.assertEqual(found, ring.find_node_many(self.keys))
+            # a tenth of the weight goes to each other node
+            share = found.count(self.nodes[0]) / float(len(self.keys))
+            self.assertTrue(0.4 < share < 0.65, (engine, share))
+
+    def test_changes(self):
+        for engine in self.engines:
+            ring = RendezvousHash(nodes=self.nodes, engine=engine)
+            ring.remove_node(self.nodes[3])
+            ring.add_node('extra')
+            ring.remove_node(self.nodes[0])
+            fresh = RendezvousHash(nodes=ring.nodes, engine=engine)
+            self.assertEqual(fresh.find_node_many(self.keys),
+                             ring.find_node_many(self.keys))
+            self.assertEqual([fresh.find_node(key) for key in self.keys],
+                             [ring.find_node(key) for key in self.keys])
+
+    def test_pure_python(self):
+        native = murmur3._native
+        rings = dict((engine, RendezvousHash(nodes=self.nodes, engine=engine))
+                     for engine in self.engines)
+        expected = dict((engine, ring.find_node_many(self.keys))
+                        for engine, ring in rings.items())
+        murmur3._native = None
+        try:
+            for engine in self.engines:
+                ring = rings[engine]
+                self.assertEqual(expected[engine],
+                                 ring.find_node_many(self.keys))
+                ring = RendezvousHash(nodes=self.nodes, engine=engine)
+                self.assertEqual(expected[engine],
+                                 [ring.find_node(key) for key in self.keys])
+        finally:
+            murmur3._native = native
+
+    def test_copies(self):
+        for engine in self.engines:
+            ring = RendezvousHash(nodes=self.nodes, engine=engine)
+            expected = ring.find_node_many(self.keys)
+            for copied in (pickle.loads(pickle.dumps(ring)), ring.copy(),
+                           copy.deepcopy(ring)):
+                self.assertTrue(copied.engine is ring.engine)
+                self.assertEqual(expected, copied.find_node_many(self.keys))
+
+
+class ClusterEngineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cluster_config = {
+            '1': {'name': 'node1', 'zone': 'a'},
+            '2': {'name': 'node2', 'zone': 'a'},
+            '3': {'name': 'node3', 'zone': 'b'},
+            '4': {'name': 'node4', 'zone': 'b'},
+            '5': {'name': 'node5', 'zone': 'c'},
+            '6': {'name': 'node6', 'zone': 'c'},
+        }
+        self.keys = [str(i) for i in range(300)]
+        self.cluster = Cluster(self.cluster_config, engine='mix64')
+
+    def test_rings(self):
+        for ring in self.cluster.rings.values():
+            self.assertTrue(ring.engine is MIX64)
+        found = self.cluster.find_nodes_many(self.keys)
+        self.assertEqual([self.cluster.find_nodes(key) for key in self.keys],
+                         found)
+        self.assertNotEqual(Cluster(self.cluster_config)
+                            .find_nodes_many(self.keys), found)
+        self.cluster.add_node('7', node_zone='d')
+        self.assertTrue(self.cluster.rings['d'].engine is MIX64)
+
+    def test_copies(self):
+        found = self.cluster.find_nodes_many(self.keys)
+        snapshot = self.cluster.snapshot()
+        copied = self.cluster.copy()
+        pickled = pickle.loads(pickle.dumps(self.cluster))
+        for cluster in (snapshot, copied, pickled):
+            self.assertEqual('mix64', cluster.engine)
+            self.assertEqual(found, cluster.find_nodes_many(self.keys))
+        copied.add_node('7', node_zone='d')
+        self.assertTrue(copied.rings['d'].engine is MIX64)
+
+    def test_partition_table(self):
+        table = self.cluster.enable_partition_table(32, 2)
+        self.cluster.add_node('7', node_zone='a', node_weight=2)
+        self.cluster.remove_node('3', node_zone='b')
+        found = [self.cluster.find_nodes_by_index(partition_id, key_index)
+                 for partition_id in range(32) for key_index in range(2)]
+        self.cluster.disable_partition_table()
+        self.assertEqual([self.cluster.find_nodes_by_index(partition_id,
+                                                            key_index)
+                          for partition_id in range(32)
+                          for key_index in range(2)], found)
+        self.assertEqual(64, len(table.keys))
+
+    def test_distribution(self):
+        report = self.cluster.distribution(self.keys)
+        counts = {}
+        for nodes in self.cluster.find_nodes_many(self.keys):
+            for node in nodes:
+                counts[node] = counts.get(node, 0) + 1
+        self.assertEqual(counts, report['nodes'])
+
+    def test_compile(self):
+        path = tempfile.mkdtemp()
+        try:
+            self.assertRaises(TypeError, self.cluster.compile,
+                              os.path.join(path, 'topology'))
+        finally:
+            shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
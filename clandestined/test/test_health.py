@@ -0,0 +1,196 @@
+import pickle
+import unittest
+
+from clandestined import Cluster
+from clandestined import MaglevHash
+
+
+class HealthTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cluster_config = {
+            '1': {'name': 'node1', 'zone': 'a'},
+            '2': {'name': 'node2', 'zone': 'a'},
+            '3': {'name': 'node3', 'zone': 'a'},
+            '4': {'name': 'node4', 'zone': 'b'},
+            '5': {'name': 'node5', 'zone': 'b'},
+            '6': {'name': 'node6', 'zone': 'b'},
+        }
+        self.keys = [str(i) for i in range(500)]
+        self.cluster = Cluster(self.cluster_config, cache_size=1000)
+
+    def expected(self, cluster, key, offset=None):
+        # each replica down replaced by the first live node in its zone
+        if offset is None:
+            offset = sum(map(ord, key)) % len(cluster.zones)
+        nodes = []
+        for i in range(cluster.replicas):
+            zone = cluster.zones[(i + offset) % len(cluster.zones)]
+            live = [node for node in cluster.rings[zone].iter_nodes(key)
+                    if node not in cluster.down]
+            nodes.append(live[0] if live else
+                         cluster.rings[zone].find_node(key))
+        return nodes
+
+    def test_mark_down(self):
+        cluster = self.cluster
+        before = cluster.find_nodes_many(self.keys)
+        version = cluster.version
+        cluster.mark_down('1')
+        self.assertEqual(set(['1']), cluster.down)
+        self.assertEqual(version, cluster.version)
+        self.assertEqual(['1', '2', '3'], sorted(cluster.rings['a'].nodes))
+        found = [cluster.find_nodes(key) for key in self.keys]
+        self.assertEqual([self.expected(cluster, key) for key in self.keys],
+                         found)
+        self.assertEqual(found, cluster.find_nodes_many(self.keys))
+        self.assertTrue('1' not in set(node for nodes in found
+                                       for node in nodes))
+        # only the keys '1' had a replica for moved, and within zone a
+        for old, new in zip(before, found):
+            for old_node, new_node in zip(old, new):
+                if old_node != '1':
+                    self.assertEqual(old_node, new_node)
+                else:
+                    self.assertTrue(new_node in ('2', '3'))
+        cluster.mark_up('1')
+        self.assertEqual(set(), cluster.down)
+        self.assertEqual(before, [cluster.find_nodes(key)
+                                  for key in self.keys])
+        self.assertEqual(before, cluster.find_nodes_many(self.keys))
+
+    def test_cache_kept(self):
+        cluster = self.cluster
+        for key in self.keys:
+            cluster.find_nodes(key)
+        cached = len(cluster.cache)
+        cluster.mark_down('4')
+        cluster.mark_down('2')
+        self.assertEqual([self.expected(cluster, key) for key in self.keys],
+                         [cluster.find_nodes(key) for key in self.keys])
+        cluster.mark_up('4')
+        cluster.mark_up('2')
+        self.assertEqual(cached, len(cluster.cache))
+        self.assertEqual(cluster.version, cluster.cache.version)
+
+    def test_zone_down(self):
+        cluster = self.cluster
+        for node in ('1', '2', '3'):
+            cluster.mark_down(node)
+        plain = Cluster(self.cluster_config)
+        # zone a has nothing better than its own winners, b still fails over
+        cluster.mark_down('4')
+        plain.mark_down('4')
+        self.assertEqual(plain.find_nodes_many(self.keys),
+                         cluster.find_nodes_many(self.keys))
+        self.assertEqual([self.expected(cluster, key) for key in self.keys],
+                         [cluster.find_nodes(key) for key in self.keys])
+
+    def test_by_index(self):
+        cluster = self.cluster
+        cluster.mark_down('5')
+        indexes = [(partition_id, key_index) for partition_id in range(20)
+                   for key_index in range(3)]
+        found = [cluster.find_nodes_by_index(*index) for index in indexes]
+        self.assertEqual([self.expected(cluster, '%s-%s' % index,
+                                        index[0] + index[1] % 2)
+                          for index in indexes], found)
+        cluster.enable_partition_table(20, 3)
+        self.assertEqual(found, [cluster.find_nodes_by_index(*index)
+                                 for index in indexes])
+
+    def test_bounded(self):
+        cluster = self.cluster
+        load = cluster.enable_bounded_load(capacity=1)
+        cluster.mark_down('1')
+        cluster.mark_down('4')
+        for key in self.keys[:50]:
+            nodes = cluster.find_nodes(key)
+            self.assertFalse(set(nodes) & set(['1', '4']))
+        load.add('2')
+        load.add('5')
+        self.assertEqual(sorted(cluster.find_nodes('lol')), ['3', '6'])
+
+    def test_ties(self):
+        # "16940-0-0" and "107894-0-0" share a murmur3_32 hash, so the
+        # winner is the str() of the int node id 16940
+        cluster = Cluster()
+        cluster.add_node(16940, node_zone='t')
+        cluster.add_node(107894, node_zone='t')
+        self.assertEqual(['16940'], cluster.find_nodes('0-0')[:1])
+        cluster.mark_down(16940)
+        self.assertEqual([107894], cluster.find_nodes('0-0')[:1])
+        self.assertEqual([107894], cluster.find_nodes_many(['0-0'])[0][:1])
+
+    def test_maglev(self):
+        cluster = Cluster(self.cluster_config, ring_class=MaglevHash)
+        cluster.mark_down('3')
+        self.assertEqual([self.expected(cluster, key) for key in self.keys],
+                         cluster.find_nodes_many(self.keys))
+
+    def test_plans(self):
+        # plans report the live replicas before and after the change
+        def planned(cluster, change):
+            trial = cluster.copy()
+            change(trial)
+            return [(key, cluster.find_nodes(key), trial.find_nodes(key))
+                    for key in self.keys
+                    if cluster.find_nodes(key) != trial.find_nodes(key)]
+
+        cluster = self.cluster
+        cluster.mark_down('2')
+        cluster.mark_down('4')
+        for down in (['5'], ['1', '3']):
+            for node in down:
+                cluster.mark_down(node)
+            self.assertEqual(
+                planned(cluster, lambda trial: trial.add_node(
+                    '7', node_zone='a')),
+                list(cluster.plan_add_node(self.keys, '7', node_zone='a')))
+            self.assertEqual(
+                planned(cluster, lambda trial: trial.add_node(
+                    '8', node_zone='b')),
+                list(cluster.plan_add_node(self.keys, '8', node_zone='b')))
+            for node, zone in (('1', 'a'), ('5', 'b'), ('6', 'b')):
+                self.assertEqual(
+                    planned(cluster, lambda trial: trial.remove_node(
+                        node, node_zone=zone)),
+                    list(cluster.plan_remove_node(self.keys, node,
+                                                  node_zone=zone)))
+
+    def test_topology_changes(self):
+        cluster = self.cluster
+        self.assertRaises(ValueError, cluster.mark_down, '7')
+        self.assertRaises(ValueError, cluster.mark_up, '7')
+        cluster.mark_down('1')
+        cluster.mark_down('1')
+        cluster.remove_node('1', node_zone='a')
+        self.assertEqual(set(), cluster.down)
+        cluster.add_node('1', node_zone='a')
+        self.assertEqual(set(), cluster.down)
+
+    def test_copies(self):
+        cluster = self.cluster
+        first = cluster.publish()
+        cluster.mark_down('2')
+        self.assertEqual(frozenset(), first.down)
+        snapshot = cluster.publish()
+        self.assertFalse(snapshot is first)
+        self.assertEqual(frozenset(['2']), snapshot.down)
+        # no zone changed, so every ring is shared
+        for zone in cluster.zones:
+            self.assertTrue(snapshot.rings[zone] is first.rings[zone])
+        self.assertTrue(cluster.snapshot() is snapshot)
+        self.assertEqual(cluster.find_nodes_many(self.keys),
+                         snapshot.find_nodes_many(self.keys))
+        self.assertRaises(TypeError, snapshot.mark_down, '1')
+        self.assertRaises(TypeError, snapshot.mark_up, '2')
+        for copied in (cluster.copy(), snapshot.copy(),
+                       pickle.loads(pickle.dumps(cluster))):
+            self.assertEqual(set(['2']), copied.down)
+            copied.mark_up('2')
+        self.assertEqual(set(['2']), cluster.down)
+
+
+if __name__ == '__main__':
+    unittest.main()
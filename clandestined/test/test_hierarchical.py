@@ -0,0 +1,176 @@
+
+import unittest
+from collections import Counter
+
+from clandestined import Cluster
+from clandestined import HierarchicalRendezvousHash
+from clandestined import RendezvousHash
+from clandestined import murmur3
+
+
+class HierarchicalRendezvousHashTestCase(unittest.TestCase):
+
+    def test_init_no_options(self):
+        rendezvous = HierarchicalRendezvousHash()
+        self.assertEqual(0, len(rendezvous.nodes))
+        self.assertEqual(8, rendezvous.fanout)
+        self.assertEqual(32, rendezvous.bucket_size)
+        self.assertEqual(None, rendezvous.find_node('ok'))
+        self.assertEqual([], list(rendezvous.iter_nodes('ok')))
+
+    def test_init_invalid(self):
+        self.assertRaises(ValueError, HierarchicalRendezvousHash, fanout=1)
+        self.assertRaises(ValueError, HierarchicalRendezvousHash,
+                          bucket_size=0)
+
+    def test_add_node(self):
+        rendezvous = HierarchicalRendezvousHash()
+        rendezvous.add_node('1')
+        self.assertEqual(1, len(rendezvous.nodes))
+        rendezvous.add_node('1')
+        self.assertEqual(1, len(rendezvous.nodes))
+        rendezvous.add_node('2')
+        self.assertEqual(2, len(rendezvous.nodes))
+        self.assertRaises(ValueError, rendezvous.add_node, '3', 2.0)
+
+    def test_remove_node(self):
+        rendezvous = HierarchicalRendezvousHash(nodes=['0', '1', '2'])
+        rendezvous.remove_node('2')
+        self.assertEqual(2, len(rendezvous.nodes))
+        self.assertRaises(ValueError, rendezvous.remove_node, '2')
+        rendezvous.remove_node('1')
+        rendezvous.remove_node('0')
+        self.assertEqual(0, len(rendezvous.nodes))
+        self.assertEqual({}, rendezvous._rings)
+        self.assertEqual({}, rendezvous._buckets)
+        self.assertEqual(None, rendezvous.find_node('ok'))
+
+    def test_find_node(self):
+        # up to bucket_size nodes are one bucket, a plain rendezvous ring
+        nodes = [str(i) for i in range(10)]
+        rendezvous = HierarchicalRendezvousHash(nodes=nodes)
+        self.assertEqual('4', rendezvous.find_node('ok'))
+        self.assertEqual('4', rendezvous.find_node('mykey'))
+        self.assertEqual(['4', '1', '0'], rendezvous.find_nodes('mykey', 3))
+        self.assertEqual(RendezvousHash(nodes=nodes).find_nodes('mykey', 10),
+                         rendezvous.find_nodes('mykey', 10))
+
+    def test_structure(self):
+        # branches split once they outgrow bucket_size, so the trie deepens
+        # with the node count and no ring grows past fanout or bucket_size
+        rendezvous = HierarchicalRendezvousHash(
+            nodes=[str(i) for i in range(1000)])
+        root = rendezvous._rings[(0, 0)]
+        self.assertEqual(1000, sum(root.weights.get(label, 1.0)
+                                   for label in root.nodes))
+        for ring in rendezvous._rings.values():
+            self.assertTrue(len(ring.nodes) <= 8)
+        for bucket in rendezvous._buckets.values():
+            self.assertTrue(len(bucket.nodes) <= 32)
+        self.assertTrue(max(level for level, prefix
+                            in rendezvous._buckets) <= 3)
+        self.assertEqual(1000, sum(len(bucket.nodes) for bucket
+                                   in rendezvous._buckets.values()))
+
+    def test_incremental(self):
+        # adding and removing nodes one at a time builds the same trie as
+        # building it from the final nodes
+        rendezvous = HierarchicalRendezvousHash(fanout=4, bucket_size=4)
+        nodes = [str(i) for i in range(300)]
+        for node in nodes:
+            rendezvous.add_node(node)
+        for node in nodes[::3]:
+            rendezvous.remove_node(node)
+        live = [node for node in nodes if node not in nodes[::3]]
+        built = HierarchicalRendezvousHash(nodes=live, fanout=4,
+                                           bucket_size=4)
+        self.assertEqual(sorted(built._rings), sorted(rendezvous._rings))
+        self.assertEqual(sorted(built._buckets), sorted(rendezvous._buckets))
+        keys = [str(i) for i in range(2000)]
+        self.assertEqual(built.find_node_many(keys),
+                         rendezvous.find_node_many(keys))
+
+    def test_find_node_many(self):
+        rendezvous = HierarchicalRendezvousHash(
+            nodes=[str(i) for i in range(200)])
+        keys = [str(i) for i in range(2000)]
+        self.assertEqual([rendezvous.find_node(key) for key in keys],
+                         rendezvous.find_node_many(keys))
+        self.assertEqual([], rendezvous.find_node_many([]))
+
+    def test_iter_nodes(self):
+        nodes = [str(i) for i in range(50)]
+        rendezvous = HierarchicalRendezvousHash(nodes=nodes, fanout=4)
+        for key in range(50):
+            ranked = list(rendezvous.iter_nodes(key))
+            self.assertEqual(sorted(nodes), sorted(ranked))
+            self.assertEqual(rendezvous.find_node(key), ranked[0])
+            self.assertEqual(ranked[:5], rendezvous.find_nodes(key, 5))
+
+
+class HierarchicalRendezvousHashIntegrationTestCase(unittest.TestCase):
+
+    def branch(self, node):
+        return murmur3.murmur3_32(node) % 8
+
+    def test_balance(self):
+        # every node gets an even share of keys, as on a flat ring, however
+        # unevenly the nodes fall into buckets
+        nodes = [str(i) for i in range(100)]
+        keys = [str(i) for i in range(20000)]
+        rendezvous = HierarchicalRendezvousHash(nodes=nodes)
+        self.assertTrue(len(rendezvous._buckets) > 1)
+        counts = Counter(rendezvous.find_node_many(keys))
+        self.assertEqual(set(nodes), set(counts))
+        self.assertTrue(max(counts.values()) < 260, max(counts.values()))
+        self.assertTrue(min(counts.values()) > 140, min(counts.values()))
+
+    def test_grow(self):
+        # the new node takes its share, and keys only move within its branch
+        rendezvous = HierarchicalRendezvousHash(
+            nodes=[str(i) for i in range(200)])
+        keys = [str(i) for i in range(10000)]
+        placements = rendezvous.find_node_many(keys)
+        rendezvous.add_node('200')
+        new_placements = rendezvous.find_node_many(keys)
+        moved = [(old, new) for old, new in zip(placements, new_placements)
+                 if old != new]
+        self.assertTrue(30 < new_placements.count('200') < 70)
+        self.assertTrue(len(moved) < 3 * new_placements.count('200'))
+        self.assertEqual(set([self.branch('200')]),
+                         set(self.branch(new) for old, new in moved))
+
+    def test_shrink(self):
+        rendezvous = HierarchicalRendezvousHash(
+            nodes=[str(i) for i in range(200)])
+        keys = [str(i) for i in range(10000)]
+        placements = rendezvous.find_node_many(keys)
+        rendezvous.remove_node('7')
+        new_placements = rendezvous.find_node_many(keys)
+        moved = [(old, new) for old, new in zip(placements, new_placements)
+                 if old != new]
+        self.assertTrue('7' not in new_placements)
+        self.assertTrue(len(moved) < 3 * placements.count('7'))
+        self.assertEqual(set([self.branch('7')]),
+                         set(self.branch(old) for old, new in moved))
+
+    def test_cluster(self):
+        cluster_config = {
+            '1': {'zone': 'a'},
+            '2': {'zone': 'a'},
+            '3': {'zone': 'b'},
+            '4': {'zone': 'b'},
+        }
+        cluster = Cluster(cluster_config,
+                          ring_class=HierarchicalRendezvousHash)
+        self.assertTrue(isinstance(cluster.rings['a'],
+                                   HierarchicalRendezvousHash))
+        self.assertEqual(['3', '2'], cluster.find_nodes('lol'))
+        self.assertEqual([['3', '2'], ['2', '4']],
+                         cluster.find_nodes_many(['lol', 'wat']))
+        cluster.remove_node('3', node_zone='b')
+        self.assertEqual(['4', '2'], cluster.find_nodes('lol'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,241 @@
+import pickle
+import unittest
+from array import array
+from collections import Counter
+
+from clandestined import Cluster
+from clandestined import MaglevHash
+from clandestined import murmur3
+from clandestined.maglev import _fill
+
+
+class MaglevHashTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.nodes = ['node%d.example.com' % (i,) for i in range(20)]
+        self.keys = [str(i) for i in range(20000)]
+
+    def test_init_no_options(self):
+        maglev = MaglevHash()
+        self.assertEqual(0, len(maglev))
+        self.assertEqual(0, maglev.seed)
+        self.assertEqual(65537, maglev.table_size)
+        self.assertEqual(None, maglev.find_node('ok'))
+        self.assertEqual([None], maglev.find_node_many(['ok']))
+        self.assertEqual([], list(maglev.iter_nodes('ok')))
+
+    def test_init_invalid(self):
+        for size in (0, 1, 4, 65536):
+            self.assertRaises(ValueError, MaglevHash, table_size=size)
+        for weight in (0, float('inf')):
+            self.assertRaises(ValueError, MaglevHash, self.nodes,
+                              weights={self.nodes[0]: weight})
+
+    @unittest.skipIf(murmur3._native is None,
+                     "requires the _murmur3 extension")
+    def test_native_invalid(self):
+        # skip 2 never reaches the odd slots of a table of 4, so the fill
+        # would never finish
+        maglev_table = murmur3._native.maglev_table
+        for size in (0, 1, 4, 9, 65536):
+            self.assertRaises(ValueError, maglev_table, [0, 1], [2, 2], size)
+        self.assertRaises(ValueError, maglev_table, [0, 1], [1, 2], 5,
+                          array('d', [1.0, float('inf')]))
+        self.assertEqual([0, 1, 0, 1, 0],
+                         list(maglev_table([0, 1], [2, 2], 5)))
+
+    def test_add_remove_node(self):
+        maglev = MaglevHash(table_size=101)
+        maglev.add_node('1')
+        maglev.add_node('1')
+        maglev.add_node('2', 2)
+        self.assertEqual(['1', '2'], maglev.nodes)
+        self.assertEqual({'2': 2.0}, maglev.weights)
+        self.assertTrue('2' in maglev)
+        maglev.remove_node('2')
+        self.assertEqual({}, maglev.weights)
+        self.assertRaises(ValueError, maglev.remove_node, '2')
+        self.assertRaises(ValueError, maglev.set_weight, '2', 1)
+        self.assertEqual(set(['1']), set(maglev._table()))
+
+    def test_balance(self):
+        # every node owns table_size / len(nodes) slots, give or take one
+        maglev = MaglevHash(self.nodes)
+        owned = Counter(maglev._table())
+        self.assertEqual(set(self.nodes), set(owned))
+        self.assertTrue(max(owned.values()) - min(owned.values()) <= 1)
+
+    def test_weights(self):
+        maglev = MaglevHash(self.nodes, weights={self.nodes[0]: 3})
+        owned = Counter(maglev._table())
+        share = owned[self.nodes[0]] / float(owned[self.nodes[1]])
+        self.assertTrue(2.9 < share < 3.1, share)
+        maglev.set_weight(self.nodes[0], 1)
+        self.assertEqual(MaglevHash(self.nodes)._table(), maglev._table())
+
+    def test_lookups(self):
+        maglev = MaglevHash(self.nodes)
+        found = [maglev.find_node(key) for key in self.keys]
+        self.assertEqual(found, maglev.find_node_many(self.keys))
+        self.assertEqual(found[:500], [next(maglev.iter_nodes(key))
+                                       for key in self.keys[:500]])
+        slot = murmur3.murmur3_32('mykey') % maglev.table_size
+        self.assertEqual(maglev._table()[slot], maglev.find_node('mykey'))
+        ranked = list(maglev.iter_nodes('mykey'))
+        self.assertEqual(sorted(self.nodes), sorted(ranked))
+        self.assertEqual(ranked[:3], maglev.find_nodes('mykey', 3))
+        self.assertEqual([], maglev.find_nodes('mykey', 0))
+        self.assertNotEqual(found, MaglevHash(self.nodes, seed=1337)
+                            .find_node_many(self.keys))
+
+    def test_node_order(self):
+        # the table only depends on the nodes, not the order they came in
+        maglev = MaglevHash(self.nodes)
+        shuffled = MaglevHash(reversed(self.nodes))
+        self.assertEqual(maglev._table(), shuffled._table())
+        shuffled.remove_node(self.nodes[4])
+        shuffled.add_node(self.nodes[4])
+        self.assertEqual(maglev._table(), shuffled._table())
+
+    def test_pure_python(self):
+        maglev = MaglevHash(self.nodes, weights={self.nodes[3]: 2.5})
+        order = sorted(self.nodes)
+        offsets = [maglev._permutations[node][0] for node in order]
+        skips = [maglev._permutations[node][1] for node in order]
+        table = [order[index] for index in _fill(
+            offsets, skips, maglev.table_size,
+            [maglev.weights.get(node, 1.0) for node in order])]
+        self.assertEqual(maglev._table(), table)
+        native = murmur3._native
+        murmur3._native = None
+        try:
+            self.assertEqual(maglev._table(),
+                             MaglevHash(self.nodes, table_size=65537,
+                                        weights={self.nodes[3]: 2.5})._table())
+        finally:
+            murmur3._native = native
+
+    def test_disruption(self):
+        # removing or adding a node moves its own keys plus a small share of
+        # the others, well under 1% of keys for a table this size.
+        maglev = MaglevHash(self.nodes)
+        before = maglev.find_node_many(self.keys)
+        removed = maglev.copy()
+        removed.remove_node(self.nodes[7])
+        after = removed.find_node_many(self.keys)
+        moved = [key for key, old, new in zip(self.keys, before, after)
+                 if old != new and old != self.nodes[7]]
+        self.assertTrue(len(moved) < 0.01 * len(self.keys), len(moved))
+        added = maglev.copy()
+        added.add_node('extra')
+        after = added.find_node_many(self.keys)
+        moved = [key for key, old, new in zip(self.keys, before, after)
+                 if old != new and new != 'extra']
+        self.assertTrue(len(moved) < 0.01 * len(self.keys), len(moved))
+        share = after.count('extra') / float(len(self.keys))
+        self.assertTrue(0.03 < share < 0.07, share)
+
+    def test_lazy_build(self):
+        # changes only mark the table stale, the next lookup fills it once
+        maglev = MaglevHash()
+        for node in ['node%d' % (i,) for i in range(400)]:
+            maglev.add_node(node)
+        self.assertEqual(None, maglev._slots)
+        found = maglev.find_node('mykey')
+        table = maglev._slots
+        self.assertEqual(maglev.table_size, len(table))
+        self.assertEqual(found, maglev.find_node('mykey'))
+        self.assertTrue(maglev._slots is table)
+        maglev.set_weight('node0', 1)
+        self.assertTrue(maglev._slots is table)
+        copied = maglev.copy()
+        self.assertTrue(copied._slots is table)
+        maglev.remove_node('node0')
+        self.assertEqual(None, maglev._slots)
+        self.assertTrue(copied._slots is table)
+        self.assertEqual(set(maglev.nodes), set(maglev._table()))
+        cluster = Cluster(dict(('node%d' % (i,), {'zone': i % 2})
+                               for i in range(400)), ring_class=MaglevHash)
+        for ring in cluster.rings.values():
+            self.assertEqual(None, ring._slots)
+
+    def test_pure_fill(self):
+        # every slot is filled and every node owns its share of them
+        table = _fill(list(range(0, 1000)), list(range(1, 1001)), 10007)
+        self.assertEqual(10007, len(table))
+        owned = Counter(table)
+        self.assertEqual(set(range(1000)), set(owned))
+        self.assertEqual(set([10, 11]), set(owned.values()))
+
+    def test_copies(self):
+        maglev = MaglevHash(self.nodes, weights={self.nodes[0]: 2})
+        copied = maglev.copy()
+        copied.remove_node(self.nodes[0])
+        self.assertEqual(20, len(maglev))
+        self.assertEqual({self.nodes[0]: 2.0}, maglev.weights)
+        pickled = pickle.loads(pickle.dumps(maglev))
+        self.assertEqual(maglev.find_node_many(self.keys),
+                         pickled.find_node_many(self.keys))
+
+
+class ClusterMaglevTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cluster_config = {
+            '1': {'name': 'node1', 'zone': 'a'},
+            '2': {'name': 'node2', 'zone': 'a', 'weight': 2},
+            '3': {'name': 'node3', 'zone': 'b'},
+            '4': {'name': 'node4', 'zone': 'b'},
+            '5': {'name': 'node5', 'zone': 'c'},
+            '6': {'name': 'node6', 'zone': 'c'},
+        }
+        self.keys = [str(i) for i in range(500)]
+        self.cluster = Cluster(self.cluster_config, ring_class=MaglevHash)
+
+    def test_find_nodes(self):
+        cluster = self.cluster
+        found = cluster.find_nodes_many(self.keys)
+        self.assertEqual([cluster.find_nodes(key) for key in self.keys], found)
+        for key, nodes in zip(self.keys, found):
+            self.assertEqual(2, len(nodes))
+        self.assertEqual(2.0, cluster.rings['a'].weights['2'])
+        cluster.add_node('7', node_zone='d')
+        self.assertTrue(isinstance(cluster.rings['d'], MaglevHash))
+        cluster.remove_node('7', node_zone='d')
+        self.assertEqual(found, cluster.find_nodes_many(self.keys))
+
+    def test_copies(self):
+        found = self.cluster.find_nodes_many(self.keys)
+        snapshot = self.cluster.snapshot()
+        self.cluster.remove_node('1', node_zone='a')
+        self.assertEqual(found, snapshot.find_nodes_many(self.keys))
+        copied = snapshot.copy()
+        self.assertTrue(isinstance(copied.rings['a'], MaglevHash))
+        self.assertEqual(found, copied.find_nodes_many(self.keys))
+        pickled = pickle.loads(pickle.dumps(self.cluster))
+        self.assertEqual(self.cluster.find_nodes_many(self.keys),
+                         pickled.find_nodes_many(self.keys))
+
+    def test_plans_and_tables(self):
+        cluster = self.cluster
+        plan = list(cluster.plan_add_node(self.keys, '7', node_zone='a'))
+        trial = cluster.copy()
+        trial.add_node('7', node_zone='a')
+        self.assertEqual([(key, cluster.find_nodes(key), trial.find_nodes(key))
+                          for key in self.keys
+                          if cluster.find_nodes(key) != trial.find_nodes(key)],
+                         plan)
+        cluster.enable_partition_table(16, 2)
+        cluster.add_node('7', node_zone='a')
+        found = cluster.find_nodes_by_index(3, 1)
+        cluster.disable_partition_table()
+        self.assertEqual(cluster.find_nodes_by_index(3, 1), found)
+        load = cluster.enable_bounded_load(capacity=1)
+        first = cluster.find_nodes('lol')
+        load.add(first[0])
+        self.assertNotEqual(first[0], cluster.find_nodes('lol')[0])
+        self.assertRaises(TypeError, cluster.compile, '/nonexistent')
+
+
+if __name__ == '__main__':
+    unittest.main()
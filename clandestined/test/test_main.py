@@ -0,0 +1,99 @@
+import json
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from io import BytesIO
+
+from clandestined import Cluster
+from clandestined.__main__ import main
+
+
+class MainTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cluster_config = {
+            '1': {'name': 'node1', 'zone': 'a'},
+            '2': {'name': 'node2', 'zone': 'a'},
+            '3': {'name': 'node3', 'zone': 'b'},
+            '4': {'name': 'node4', 'zone': 'b'},
+            '5': {'name': 'node5', 'zone': 'c'},
+            '6': {'name': 'node6', 'zone': 'c'},
+        }
+        self.config = self.path('cluster.json', json.dumps(self.cluster_config))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def path(self, name, data):
+        path = os.path.join(self.dir, name)
+        handle = open(path, 'w')
+        handle.write(data)
+        handle.close()
+        return path
+
+    def run_main(self, argv, stdin=b''):
+        stdout = BytesIO()
+        main([self.config] + argv, stdin=BytesIO(stdin), stdout=stdout)
+        return stdout.getvalue()
+
+    def test_stdin(self):
+        output = self.run_main(['-p', '1'], b'lol\nwat\r\nok')
+        self.assertEqual(b'lol\t2,3\nwat\t6,2\nok\t5,2\n', output)
+
+    def test_options(self):
+        output = self.run_main(['-p', '1', '-r', '1', '-s', '1337'],
+                               b'lol\n')
+        cluster = Cluster(self.cluster_config, replicas=1, seed=1337)
+        self.assertEqual(('lol\t%s\n' % cluster.find_nodes('lol')[0]).encode(),
+                         output)
+
+    def test_processes(self):
+        keys = [str(i) for i in range(5000)]
+        data = '\n'.join(keys)
+        cluster = Cluster(self.cluster_config)
+        expected = ''.join('%s\t%s\n' % (key, ','.join(nodes)) for key, nodes
+                           in zip(keys, cluster.find_nodes_many(keys)))
+        path = self.path('keys.txt', data)
+        for processes in ('1', '2'):
+            self.assertEqual(expected.encode(),
+                             self.run_main([path, '-p', processes, '-c', '333']))
+            self.assertEqual(expected.encode(),
+                             self.run_main(['-p', processes, '-c', '333'],
+                                           data.encode()))
+
+    def test_empty(self):
+        path = self.path('keys.txt', '')
+        self.assertEqual(b'', self.run_main([path, '-p', '2']))
+        self.assertEqual(b'', self.run_main(['-p', '2']))
+
+    def test_binary(self):
+        output = self.run_main(['-p', '1', '-b'], b'lol\nwat\nok\n')
+        magic, version, replicas, count = struct.unpack_from('<4sIII', output)
+        self.assertEqual((b'CLND', 1, 2, 6), (magic, version, replicas, count))
+        position = 16
+        nodes = []
+        for i in range(count):
+            length, = struct.unpack_from('<I', output, position)
+            position += 4
+            nodes.append(output[position:position + length].decode('utf-8'))
+            position += length
+        self.assertEqual(['1', '2', '3', '4', '5', '6'], nodes)
+        records = struct.unpack_from('<6I', output, position)
+        self.assertEqual(len(output), position + 24)
+        self.assertEqual(['2', '3', '6', '2', '5', '2'],
+                         [nodes[index] for index in records])
+
+    def test_output_file(self):
+        output = os.path.join(self.dir, 'out.txt')
+        self.assertEqual(b'', self.run_main(['-p', '1', '-o', output],
+                                            b'lol\n'))
+        handle = open(output, 'rb')
+        self.assertEqual(b'lol\t2,3\n', handle.read())
+        handle.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
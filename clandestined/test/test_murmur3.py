@@ -0,0 +1,159 @@
+
+import random
+import sys
+import unittest
+from array import array
+
+from clandestined import murmur3
+
+
+class Murmur3ManyTestCase(unittest.TestCase):
+
+    def test_empty(self):
+        hashes = murmur3.murmur3_32_many([])
+        self.assertTrue(isinstance(hashes, array))
+        self.assertEqual(0, len(hashes))
+
+    def test_matches_single(self):
+        keys = ['', 'a', 'ab', 'abc', 'abcd', '6666', 'mykey', 'x' * 1000]
+        hashes = murmur3.murmur3_32_many(keys)
+        self.assertEqual(len(keys), len(hashes))
+        for key, value in zip(keys, hashes):
+            self.assertEqual(murmur3.murmur3_32(key), value)
+        self.assertEqual(1361238019, murmur3.murmur3_32_many(['6666'])[0])
+
+    def test_seed(self):
+        self.assertEqual([2981722772],
+                         list(murmur3.murmur3_32_many(['6666'], 10)))
+
+    def test_iterable(self):
+        hashes = murmur3.murmur3_32_many(str(i) for i in range(100))
+        self.assertEqual([murmur3.murmur3_32(str(i)) for i in range(100)],
+                         list(hashes))
+
+    def test_buffer(self):
+        hashes = murmur3.murmur3_32_many(['6666', 'mykey'])
+        self.assertEqual(4, hashes.itemsize)
+        # Python 2 arrays only have the old buffer interface
+        if sys.version_info[0] >= 3:
+            self.assertEqual(8, len(memoryview(hashes).tobytes()))
+        else:
+            self.assertEqual(8, len(buffer(hashes)))
+
+
+class Murmur3BufferTestCase(unittest.TestCase):
+
+    def test_buffers(self):
+        self.assertEqual(1361238019, murmur3.murmur3_32(b'6666'))
+        self.assertEqual(1361238019, murmur3.murmur3_32(bytearray(b'6666')))
+        self.assertEqual(1361238019, murmur3.murmur3_32(memoryview(b'6666')))
+        self.assertEqual(2981722772, murmur3.murmur3_32(b'6666', 10))
+
+    def test_unaligned_slices(self):
+        data = b'x' + b'node1.example.com-mykey' * 10
+        for start in range(4):
+            view = memoryview(data)[start:]
+            self.assertEqual(murmur3.murmur3_32(data[start:]),
+                             murmur3.murmur3_32(view))
+
+    @unittest.skipIf(murmur3._native is None, "slow without _murmur3")
+    def test_large_input(self):
+        data = 'node1.example.com-' * 10000
+        self.assertEqual(murmur3.murmur3_32(data),
+                         murmur3.murmur3_32(data.encode('utf-8')))
+        self.assertEqual(murmur3.murmur3_32(data),
+                         murmur3.murmur3_32_many([bytearray(data, 'utf-8')])[0])
+
+    def test_many_buffers(self):
+        keys = [b'6666', bytearray(b'6666'), '6666', memoryview(b'66666')[1:]]
+        self.assertEqual([1361238019] * 400,
+                         list(murmur3.murmur3_32_many(keys * 100)))
+
+    def test_hasher_buffers(self):
+        hasher = murmur3.Murmur3(bytearray(b'66'))
+        hasher.update(memoryview(b'66'))
+        self.assertEqual(1361238019, hasher.digest())
+
+    def test_invalid(self):
+        self.assertRaises(TypeError, murmur3.murmur3_32, 6666)
+        self.assertRaises(TypeError, murmur3.murmur3_32_many, ['6666', 6666])
+
+
+class Murmur3HasherTestCase(unittest.TestCase):
+
+    def test_digest(self):
+        self.assertEqual(1361238019, murmur3.Murmur3('6666').digest())
+        self.assertEqual(2981722772, murmur3.Murmur3('6666', seed=10).digest())
+        self.assertEqual(murmur3.murmur3_32(''), murmur3.Murmur3().digest())
+
+    def test_update(self):
+        data = 'node1.us-east-1.example.com-mykey'
+        for cut in range(len(data) + 1):
+            for seed in (0, 7):
+                hasher = murmur3.Murmur3(data[:cut], seed=seed)
+                hasher.update(data[cut:])
+                self.assertEqual(murmur3.murmur3_32(data, seed),
+                                 hasher.digest())
+
+    def test_update_chunks(self):
+        hasher = murmur3.Murmur3()
+        for char in 'abcdefghij':
+            hasher.update(char)
+            hasher.update(b'')
+        self.assertEqual(murmur3.murmur3_32('abcdefghij'), hasher.digest())
+
+    def test_bytes(self):
+        hasher = murmur3.Murmur3(b'66')
+        hasher.update(b'66')
+        self.assertEqual(1361238019, hasher.digest())
+
+    def test_copy(self):
+        prefix = murmur3.Murmur3('node-')
+        first = prefix.copy()
+        second = prefix.copy()
+        first.update('a')
+        second.update('bc')
+        self.assertEqual(murmur3.murmur3_32('node-a'), first.digest())
+        self.assertEqual(murmur3.murmur3_32('node-bc'), second.digest())
+        self.assertEqual(murmur3.murmur3_32('node-'), prefix.digest())
+
+
+@unittest.skipIf(murmur3._native is None, "requires the _murmur3 extension")
+class Murmur3PureParityTestCase(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(2316)
+        alphabet = u'abcxyz09-.\u00e9\u20ac\U0001d11e\x00'
+        self.keys = [u''.join(random.choice(alphabet)
+                              for _ in range(random.randrange(40)))
+                     for _ in range(500)]
+        self.seeds = [0, 1, 10, 2 ** 31 - 1]
+
+    def test_murmur3_32(self):
+        native = murmur3._native
+        for seed in self.seeds:
+            for key in self.keys:
+                self.assertEqual(native.murmur3_32(key, seed),
+                                 murmur3.pure_murmur3_32(key, seed))
+                data = key.encode('utf-8')
+                self.assertEqual(native.murmur3_32(data, seed),
+                                 murmur3.pure_murmur3_32(bytearray(data), seed))
+
+    def test_murmur3_32_many(self):
+        native = murmur3._native
+        self.assertEqual(list(native.murmur3_32_many(self.keys, 10)),
+                         list(murmur3.pure_murmur3_32_many(self.keys, 10)))
+
+    def test_hasher(self):
+        for key in self.keys:
+            data = key.encode('utf-8')
+            for cut in range(0, len(data) + 1, 3):
+                hasher = murmur3.PureMurmur3(data[:cut], seed=7)
+                copied = hasher.copy()
+                copied.update(data[cut:])
+                self.assertEqual(murmur3._native.murmur3_32(data, 7),
+                                 copied.digest())
+
+
+if __name__ == '__main__':
+    unittest.main()
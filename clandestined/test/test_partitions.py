@@ -0,0 +1,160 @@
+import pickle
+import random
+import unittest
+
+from clandestined import Cluster
+from clandestined import HierarchicalRendezvousHash
+from clandestined.partitions import PartitionTable
+
+
+class PartitionTableTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cluster_config = {
+            '1': {'name': 'node1', 'zone': 'a'},
+            '2': {'name': 'node2', 'zone': 'a'},
+            '3': {'name': 'node3', 'zone': 'b'},
+            '4': {'name': 'node4', 'zone': 'b'},
+            '5': {'name': 'node5', 'zone': 'c'},
+            '6': {'name': 'node6', 'zone': 'c'},
+        }
+        self.cluster = Cluster(self.cluster_config)
+        self.table = self.cluster.enable_partition_table(64, 3)
+
+    def assertTableCurrent(self, cluster):
+        table = cluster.partition_table
+        indexes = [(partition_id, key_index)
+                   for partition_id in range(table.partitions)
+                   for key_index in range(table.key_indexes)]
+        found = [cluster.find_nodes_by_index(*index) for index in indexes]
+        cluster.partition_table = None
+        try:
+            self.assertEqual([cluster.find_nodes_by_index(*index)
+                              for index in indexes], found)
+        finally:
+            cluster.partition_table = table
+
+    def test_lookups(self):
+        self.assertEqual(64 * 3, len(self.table.keys))
+        self.assertEqual(['a', 'b', 'c'], sorted(self.table.winners))
+        self.assertTableCurrent(self.cluster)
+        # keys outside the table are looked up as before
+        plain = Cluster(self.cluster_config)
+        for index in ((64, 0), (1, 3), (-1, 0), ('1', 2), (1.0, 2)):
+            self.assertEqual(plain.find_nodes_by_index(*index),
+                             self.cluster.find_nodes_by_index(*index))
+
+    def test_changes(self):
+        cluster = self.cluster
+        cluster.add_node('7', node_zone='a')
+        cluster.add_node(8, node_zone='d', node_weight=2)
+        self.assertTableCurrent(cluster)
+        cluster.set_node_weight('1', 3, node_zone='a')
+        self.assertTableCurrent(cluster)
+        cluster.set_node_weight('1', 0.5, node_zone='a')
+        self.assertTableCurrent(cluster)
+        cluster.remove_node('3', node_zone='b')
+        self.assertTableCurrent(cluster)
+        cluster.remove_node(8, node_zone='d')
+        self.assertEqual(['a', 'b', 'c'], sorted(self.table.winners))
+        self.assertTableCurrent(cluster)
+        cluster.add_zone('empty')
+        self.assertTableCurrent(cluster)
+        cluster.remove_zone('c')
+        self.assertTableCurrent(cluster)
+
+    def test_random_changes(self):
+        rand = random.Random(5)
+        cluster = self.cluster
+        next_node = 100
+        for step in range(100):
+            choice = rand.random()
+            if choice < 0.4 or len(cluster.nodes) < 3:
+                node = rand.choice([str(next_node), next_node])
+                next_node += 1
+                cluster.add_node(node, node_zone=rand.choice('abcd'),
+                                 node_weight=rand.choice([1, 1, 2, 0.5]))
+            else:
+                node = rand.choice(sorted(cluster.nodes, key=str))
+                zone = [zone for zone in cluster.zones
+                        if node in cluster.zone_members[zone]][0]
+                if choice < 0.7:
+                    cluster.remove_node(node, node_zone=zone)
+                else:
+                    cluster.set_node_weight(node, rand.choice([1, 3, 0.25]),
+                                            node_zone=zone)
+            self.assertTableCurrent(cluster)
+
+    def test_ties(self):
+        # "16940-0-0" and "107894-0-0" share a murmur3_32 hash
+        cluster = self.cluster
+        cluster.add_node(16940, node_zone='t')
+        cluster.add_node(107894, node_zone='t')
+        self.assertEqual('16940', self.table.winners['t'][0])
+        self.assertTableCurrent(cluster)
+        cluster.set_node_weight(16940, 2, node_zone='t')
+        self.assertTableCurrent(cluster)
+        cluster.set_node_weight(16940, 1, node_zone='t')
+        self.assertTableCurrent(cluster)
+        cluster.remove_node(107894, node_zone='t')
+        self.assertEqual(16940, self.table.winners['t'][0])
+        self.assertTableCurrent(cluster)
+
+    def test_only_changed_keys(self):
+        winners = list(self.table.winners['a'])
+        self.cluster.add_node('7', node_zone='a')
+        changed = [position for position, winner
+                   in enumerate(self.table.winners['a'])
+                   if winner != winners[position]]
+        self.assertTrue(changed)
+        self.assertEqual(set(['7']), set(self.table.winners['a'][position]
+                                         for position in changed))
+        self.cluster.remove_node('7', node_zone='a')
+        self.assertEqual(winners, self.table.winners['a'])
+
+    def test_other_rings(self):
+        cluster = Cluster(self.cluster_config,
+                          ring_class=HierarchicalRendezvousHash)
+        cluster.enable_partition_table(16, 2)
+        self.assertTableCurrent(cluster)
+        cluster.add_node('7', node_zone='a')
+        cluster.remove_node('3', node_zone='b')
+        self.assertTableCurrent(cluster)
+
+    def test_bypassed(self):
+        cluster = self.cluster
+        load = cluster.enable_bounded_load(capacity=1)
+        expected = cluster.find_nodes_by_index(1, 2)
+        load.add(expected[0])
+        self.assertNotEqual(expected, cluster.find_nodes_by_index(1, 2))
+        cluster.disable_bounded_load()
+        stats = cluster.enable_stats()
+        self.assertEqual(expected, cluster.find_nodes_by_index(1, 2))
+        self.assertEqual(1, stats.lookups)
+        cluster.disable_stats()
+
+        cluster.disable_partition_table()
+        self.assertEqual(None, cluster.partition_table)
+        cluster.add_node('7', node_zone='a')
+        plain = Cluster(self.cluster_config)
+        plain.add_node('7', node_zone='a')
+        self.assertEqual(plain.find_nodes_by_index(5, 1),
+                         cluster.find_nodes_by_index(5, 1))
+
+    def test_copies(self):
+        copied = pickle.loads(pickle.dumps(self.cluster))
+        self.assertTableCurrent(copied)
+        copied.add_node('7', node_zone='a')
+        self.assertTableCurrent(copied)
+        self.assertEqual(None, self.cluster.copy().partition_table)
+        snapshot = self.cluster.snapshot()
+        self.assertEqual(None, snapshot.partition_table)
+        self.assertRaises(TypeError, snapshot.enable_partition_table, 4)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, PartitionTable, 0)
+        self.assertRaises(ValueError, PartitionTable, 4, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
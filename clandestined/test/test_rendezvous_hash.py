@@ -1,9 +1,31 @@
 
+import pickle
+import sys
 import unittest
 
 from clandestined import RendezvousHash
 
 
+def native_str(text):
+    # rings str() their nodes and keys, which takes UTF-8 encoded bytes for
+    # non-ASCII text on Python 2
+    if sys.version_info[0] >= 3:
+        return text
+    return text.encode('utf-8')
+
+
+def reference_find_node(rendezvous, key):
+    high_score = -1
+    winner = None
+    for node in rendezvous.nodes:
+        score = rendezvous.hash_function("%s-%s" % (str(node), str(key)))
+        if score > high_score:
+            (high_score, winner) = (score, node)
+        elif score == high_score:
+            (high_score, winner) = (score, max(str(node), str(winner)))
+    return winner
+
+
 class RendezvousHashTestCase(unittest.TestCase):
 
     def test_init_no_options(self):
@@ -44,6 +66,75 @@ class RendezvousHashTestCase(unittest.TestCase):
         rendezvous.remove_node('0')
         self.assertEqual(0, len(rendezvous.nodes))
 
+    def test_membership(self):
+        rendezvous = RendezvousHash(nodes=['0', '1', '1', '2'])
+        self.assertEqual(['0', '1', '2'], rendezvous.nodes)
+        self.assertEqual(3, len(rendezvous))
+        self.assertTrue('1' in rendezvous)
+        self.assertFalse('3' in rendezvous)
+        rendezvous.remove_node('0')
+        self.assertFalse('0' in rendezvous)
+        self.assertEqual(['1', '2'], sorted(rendezvous.nodes))
+
+    def test_remove_middle_node(self):
+        nodes = [str(i) for i in range(50)]
+        rendezvous = RendezvousHash(nodes=nodes, weights={'49': 2, '3': 0.5})
+        keys = [str(i) for i in range(500)]
+        for node in ('10', '0', '48', '3', '25'):
+            rendezvous.remove_node(node)
+            expected = RendezvousHash(nodes=rendezvous.nodes,
+                                      weights=rendezvous.weights)
+            self.assertEqual(expected.find_node_many(keys),
+                             rendezvous.find_node_many(keys))
+            self.assertEqual([expected.find_nodes(key, 3) for key in keys],
+                             [rendezvous.find_nodes(key, 3) for key in keys])
+        self.assertEqual({'49': 2.0}, rendezvous.weights)
+        rendezvous.set_weight('49', 1)
+        unweighted = RendezvousHash(nodes=rendezvous.nodes)
+        for key in keys:
+            self.assertEqual(reference_find_node(unweighted, key),
+                             rendezvous.find_node(key))
+
+    def test_exported_buffers(self):
+        # a lookup in another thread may hold exports of the packed states
+        # and weights, which changes must leave whole and consistent
+        rendezvous = RendezvousHash(nodes=[str(i) for i in range(10)],
+                                    weights={'3': 2})
+        keys = [str(i) for i in range(200)]
+        states = memoryview(rendezvous._states)
+        if sys.version_info[0] >= 3:
+            weights = memoryview(rendezvous._weights)
+        before = states.tobytes()
+        rendezvous.add_node('10')
+        self.assertEqual(before, states.tobytes())
+        expected = RendezvousHash(nodes=rendezvous.nodes, weights={'3': 2})
+        self.assertEqual(expected.find_node_many(keys),
+                         rendezvous.find_node_many(keys))
+        # removals with the new buffers exported, then without
+        states = memoryview(rendezvous._states)
+        if sys.version_info[0] >= 3:
+            weights = memoryview(rendezvous._weights)
+        before = states.tobytes()
+        rendezvous.remove_node('4')
+        self.assertEqual(before, states.tobytes())
+        if sys.version_info[0] >= 3:
+            self.assertEqual(2.0, weights[3])
+        rendezvous.remove_node('3')
+        expected = RendezvousHash(nodes=rendezvous.nodes)
+        self.assertEqual(expected.find_node_many(keys),
+                         rendezvous.find_node_many(keys))
+
+    def test_pickle(self):
+        rendezvous = RendezvousHash(nodes=['0', '1', '2'], seed=10,
+                                    weights={'1': 2})
+        keys = [str(i) for i in range(100)]
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copied = pickle.loads(pickle.dumps(rendezvous, protocol))
+            self.assertEqual(rendezvous.find_node_many(keys),
+                             copied.find_node_many(keys))
+            copied.remove_node('0')
+            self.assertEqual(3, len(rendezvous.nodes))
+
     def test_find_node(self):
         nodes = ['0', '1', '2']
         rendezvous = RendezvousHash(nodes=nodes)
@@ -73,6 +164,125 @@ class RendezvousHashTestCase(unittest.TestCase):
         self.assertEqual('3', rendezvous.find_node('lol'))
 
 
+    def test_find_node_matches_reference(self):
+        nodes = [str(i) for i in range(50)] + [7, native_str(u'n\u00f6de'),
+                                                 'x' * 300]
+        rendezvous = RendezvousHash(nodes=nodes)
+        for i in range(1000):
+            self.assertEqual(reference_find_node(rendezvous, i),
+                             rendezvous.find_node(i))
+        self.assertEqual(reference_find_node(rendezvous, 'k' * 500),
+                         rendezvous.find_node('k' * 500))
+
+    def test_find_node_natural_collision(self):
+        # "14558-0" and "109786-0" share a murmur3_32 hash
+        rendezvous = RendezvousHash(nodes=[14558, 109786])
+        self.assertEqual('14558', rendezvous.find_node(0))
+        self.assertEqual(reference_find_node(rendezvous, 0),
+                         rendezvous.find_node(0))
+        rendezvous = RendezvousHash(nodes=[109786, 14558])
+        self.assertEqual('14558', rendezvous.find_node(0))
+
+    def test_find_node_empty(self):
+        rendezvous = RendezvousHash()
+        self.assertEqual(None, rendezvous.find_node('ok'))
+        self.assertEqual([None, None], rendezvous.find_node_many(['ok', 1]))
+
+    def test_find_node_many(self):
+        nodes = ['0', '1', '2']
+        rendezvous = RendezvousHash(nodes=nodes)
+        self.assertEqual(['0', '1', '2', '2'],
+                         rendezvous.find_node_many(['ok', 'mykey', 'wat', 'lol']))
+        self.assertEqual([], rendezvous.find_node_many([]))
+        keys = list(range(500)) + ['k' * 500, native_str(u'k\u00e9y')]
+        self.assertEqual([rendezvous.find_node(key) for key in keys],
+                         rendezvous.find_node_many(iter(keys)))
+
+    def test_find_node_many_natural_collision(self):
+        rendezvous = RendezvousHash(nodes=[14558, 109786])
+        self.assertEqual([rendezvous.find_node(1), '14558'],
+                         rendezvous.find_node_many([1, 0]))
+
+    def test_find_nodes(self):
+        nodes = [str(i) for i in range(20)]
+        rendezvous = RendezvousHash(nodes=nodes)
+        for key in range(200):
+            ranked = sorted(nodes, reverse=True, key=lambda node: (
+                rendezvous.hash_function("%s-%s" % (node, key)), node))
+            self.assertEqual(ranked[:3], rendezvous.find_nodes(key, 3))
+            self.assertEqual(rendezvous.find_node(key),
+                             rendezvous.find_nodes(key, 1)[0])
+        self.assertEqual([], rendezvous.find_nodes('ok', 0))
+        self.assertEqual(20, len(rendezvous.find_nodes('ok', 50)))
+        self.assertEqual([], RendezvousHash().find_nodes('ok', 2))
+
+    def test_find_nodes_natural_collision(self):
+        rendezvous = RendezvousHash(nodes=[109786, 14558])
+        self.assertEqual([14558], rendezvous.find_nodes(0, 1))
+        self.assertEqual([14558, 109786], rendezvous.find_nodes(0, 2))
+        self.assertEqual([14558, 109786], list(rendezvous.iter_nodes(0)))
+
+    def test_iter_nodes(self):
+        nodes = [str(i) for i in range(20)]
+        rendezvous = RendezvousHash(nodes=nodes)
+        for key in range(200):
+            self.assertEqual(rendezvous.find_nodes(key, 20),
+                             list(rendezvous.iter_nodes(key)))
+        candidates = rendezvous.iter_nodes('mykey')
+        self.assertEqual(rendezvous.find_node('mykey'), next(candidates))
+        self.assertEqual([], list(RendezvousHash().iter_nodes('mykey')))
+
+    def test_weights(self):
+        rendezvous = RendezvousHash(nodes=['0', '1'], weights={'1': 2})
+        self.assertEqual({'1': 2.0}, rendezvous.weights)
+        rendezvous.add_node('2', weight=0.5)
+        self.assertEqual({'1': 2.0, '2': 0.5}, rendezvous.weights)
+        rendezvous.set_weight('1', 1)
+        self.assertEqual({'2': 0.5}, rendezvous.weights)
+        rendezvous.remove_node('2')
+        self.assertEqual({}, rendezvous.weights)
+        self.assertRaises(ValueError, rendezvous.set_weight, '2', 1.0)
+        self.assertRaises(ValueError, rendezvous.set_weight, '1', 0)
+        self.assertRaises(ValueError, rendezvous.add_node, '3', -1)
+        self.assertEqual(['0', '1'], rendezvous.nodes)
+
+    def test_uniform_weights_match_unweighted(self):
+        nodes = [str(i) for i in range(10)]
+        unweighted = RendezvousHash(nodes=nodes)
+        weighted = RendezvousHash(nodes=nodes,
+                                  weights=dict((node, 3.0) for node in nodes))
+        keys = [str(i) for i in range(1000)]
+        self.assertEqual(unweighted.find_node_many(keys),
+                         weighted.find_node_many(keys))
+        for key in keys[:100]:
+            self.assertEqual(unweighted.find_node(key), weighted.find_node(key))
+            self.assertEqual(unweighted.find_nodes(key, 3),
+                             weighted.find_nodes(key, 3))
+
+    def test_weighted_find_node(self):
+        rendezvous = RendezvousHash(nodes=['0', '1', '2', '3'],
+                                    weights={'3': 3.0})
+        keys = [str(i) for i in range(10000)]
+        placements = rendezvous.find_node_many(keys)
+        self.assertEqual([rendezvous.find_node(key) for key in keys],
+                         placements)
+        self.assertEqual([rendezvous.find_nodes(key, 1)[0] for key in keys],
+                         placements)
+        self.assertEqual(5034, placements.count('3'))
+        self.assertEqual(1656, placements.count('0'))
+
+    def test_reweight_only_moves_reweighted_node(self):
+        rendezvous = RendezvousHash(nodes=['0', '1', '2', '3'],
+                                    weights={'3': 3.0})
+        keys = [str(i) for i in range(10000)]
+        before = rendezvous.find_node_many(keys)
+        rendezvous.set_weight('3', 1.5)
+        after = rendezvous.find_node_many(keys)
+        moved = [(old, new) for old, new in zip(before, after) if old != new]
+        self.assertEqual(1648, len(moved))
+        self.assertEqual(set(['3']), set(old for old, new in moved))
+
+
 class RendezvousHashIntegrationTestCase(unittest.TestCase):
 
     def test_grow(self):
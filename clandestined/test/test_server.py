@@ -0,0 +1,139 @@
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import unittest
+
+from clandestined import Cluster
+
+try:
+    import asyncio
+    from clandestined import server
+except (ImportError, SyntaxError):
+    server = None
+
+
+@unittest.skipIf(server is None, "requires asyncio")
+class RoutingServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cluster_config = {
+            '1': {'name': 'node1', 'zone': 'a'},
+            '2': {'name': 'node2', 'zone': 'a'},
+            '3': {'name': 'node3', 'zone': 'b'},
+            '4': {'name': 'node4', 'zone': 'b'},
+            '5': {'name': 'node5', 'zone': 'c'},
+            '6': {'name': 'node6', 'zone': 'c'},
+        }
+        self.cluster = Cluster(self.cluster_config)
+        self.keys = [str(i) for i in range(1000)]
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(asyncio.set_event_loop, None)
+        self.addCleanup(self.loop.close)
+
+    # the tests drive the client's coroutines with run_until_complete rather
+    # than coroutines of their own, so this module still imports on Pythons
+    # without async syntax, where it is skipped.
+
+    def wait(self, awaitable):
+        return self.loop.run_until_complete(awaitable)
+
+    def serve(self, routing=None, unix=None):
+        routing = routing or server.RoutingServer(self.cluster)
+        if unix is not None:
+            listener = self.wait(routing.start_unix(unix))
+            client = self.wait(server.RoutingClient.open_unix(unix))
+        else:
+            listener = self.wait(routing.start_tcp('127.0.0.1', 0))
+            port = listener.sockets[0].getsockname()[1]
+            client = self.wait(server.RoutingClient.open_tcp('127.0.0.1', port))
+
+        def close():
+            self.wait(client.close())
+            listener.close()
+            self.wait(listener.wait_closed())
+        self.addCleanup(close)
+        return client
+
+    def test_find_nodes(self):
+        expected = self.cluster.find_nodes_many(self.keys)
+        client = self.serve()
+        self.assertEqual(['2', '3'], self.wait(client.find_nodes('lol')))
+        self.assertEqual(expected, self.wait(client.find_nodes_many(self.keys)))
+        self.assertEqual([], self.wait(client.find_nodes_many([])))
+        info = self.wait(client.info())
+        self.assertEqual({'version': self.cluster.version, 'replicas': 2,
+                          'nodes': 6}, info)
+
+    def test_pipelined(self):
+        chunks = [self.keys[i:i + 37] for i in range(0, len(self.keys), 37)]
+        expected = [self.cluster.find_nodes_many(chunk) for chunk in chunks]
+        routing = server.RoutingServer(self.cluster)
+        client = self.serve(routing)
+        results = self.wait(asyncio.gather(
+            *[client.find_nodes_many(chunk) for chunk in chunks]))
+        self.assertEqual(expected, list(results))
+        self.assertEqual(len(chunks), routing.requests)
+
+    def test_executor(self):
+        expected = self.cluster.find_nodes_many(self.keys)
+        client = self.serve(server.RoutingServer(self.cluster,
+                                                 executor_threshold=10))
+        self.assertEqual(expected, self.wait(client.find_nodes_many(self.keys)))
+        self.assertEqual(expected[:3],
+                         self.wait(client.find_nodes_many(self.keys[:3])))
+
+    def test_reload(self):
+        before = self.cluster.find_nodes_many(self.keys)
+        self.cluster.add_node('7', node_zone='a', node_name='node7')
+        self.cluster.remove_node('6', node_zone='c')
+        after = self.cluster.find_nodes_many(self.keys)
+        self.assertNotEqual(before, after)
+        routing = server.RoutingServer(Cluster(self.cluster_config))
+        client = self.serve(routing)
+        self.assertEqual(before, self.wait(client.find_nodes_many(self.keys)))
+        routing.reload(self.cluster)
+        self.assertEqual(after, self.wait(client.find_nodes_many(self.keys)))
+
+    def test_unicode_keys(self):
+        keys = [u'caf\u00e9', u'\u20ac', u'\U0001d11e-key']
+        expected = self.cluster.find_nodes_many(keys)
+        client = self.serve()
+        self.assertEqual(expected, self.wait(client.find_nodes_many(keys)))
+
+    def test_errors(self):
+        client = self.serve()
+        future = client._request(
+            lambda request_id: server._frame(
+                struct.pack('>BI', 9, request_id)))
+        self.assertRaises(server.ProtocolError, self.wait, future)
+        future = client._request(
+            lambda request_id: server._frame(
+                struct.pack('>BII', server.OP_FIND, request_id, 2)))
+        self.assertRaises(server.ProtocolError, self.wait, future)
+        # the connection is still usable
+        self.assertEqual(['2', '3'], self.wait(client.find_nodes('lol')))
+
+    def test_empty_cluster(self):
+        client = self.serve(server.RoutingServer(Cluster()))
+        self.assertEqual([], self.wait(client.find_nodes_many([])))
+        try:
+            self.wait(client.find_nodes('lol'))
+        except server.ProtocolError as e:
+            self.assertTrue('no zones' in str(e))
+        else:
+            self.fail("expected a ProtocolError")
+
+    @unittest.skipIf(not hasattr(socket, 'AF_UNIX'), "requires unix sockets")
+    def test_unix(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        expected = self.cluster.find_nodes_many(self.keys)
+        client = self.serve(unix=os.path.join(directory, 'routing.sock'))
+        self.assertEqual(expected, self.wait(client.find_nodes_many(self.keys)))
+
+
+if __name__ == '__main__':
+    unittest.main()
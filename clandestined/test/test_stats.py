@@ -0,0 +1,211 @@
+import pickle
+import unittest
+
+from clandestined import Cluster
+from clandestined import RendezvousHash
+from clandestined.stats import LATENCY_BUCKETS
+from clandestined.stats import LookupStats
+
+
+class LookupStatsTestCase(unittest.TestCase):
+
+    def test_counters(self):
+        calls = []
+        stats = LookupStats(lambda *args: calls.append(args))
+        stats.add_node('1')
+        stats.add_node('1')
+        stats.add_zone(None)
+        stats.add_tie()
+        stats.add_lookup('a', '1', 3e-6)
+        stats.add_lookups(['b', 'c'], ['1', '2'], 1e-3)
+        stats.add_lookups([], [], 1.0)
+        self.assertEqual({
+            'lookups': 3,
+            'ties': 1,
+            'nodes': {'1': 2},
+            'zones': {None: 1},
+            'latency': [(4.096e-06, 1), (0.000524288, 2)],
+            'latency_total': 3e-6 + 1e-3,
+        }, stats.snapshot())
+        self.assertEqual([('a', '1', 3e-6), ('b', '1', 5e-4),
+                          ('c', '2', 5e-4)], calls)
+
+        stats.reset()
+        self.assertEqual(0, stats.lookups)
+        self.assertEqual([], stats.snapshot()['latency'])
+
+    def test_latency_buckets(self):
+        stats = LookupStats()
+        for seconds in (0, 1e-10, 1e-9, 1.5e-9, 3600):
+            stats.add_lookup('a', None, seconds)
+        # anything slower than the last bound lands in the last bucket
+        self.assertEqual([(1e-9, 2), (2e-9, 2),
+                          (2.0 ** (LATENCY_BUCKETS - 1) / 1e9, 1)],
+                         stats.snapshot()['latency'])
+
+
+class RingStatsTestCase(unittest.TestCase):
+
+    def test_disabled(self):
+        rendezvous = RendezvousHash(nodes=['0', '1', '2'])
+        self.assertEqual(None, rendezvous.stats)
+        rendezvous.find_node('lol')
+
+    def test_find_node(self):
+        nodes = [str(i) for i in range(10)]
+        plain = RendezvousHash(nodes=nodes, weights={'3': 2})
+        rendezvous = RendezvousHash(nodes=nodes, weights={'3': 2})
+        stats = rendezvous.enable_stats()
+        keys = [str(i) for i in range(200)]
+        for key in keys:
+            self.assertEqual(plain.find_node(key), rendezvous.find_node(key))
+        self.assertEqual(plain.find_node_many(keys),
+                         rendezvous.find_node_many(keys))
+        self.assertEqual(400, stats.lookups)
+        self.assertEqual(0, stats.ties)
+        expected = {}
+        for node in plain.find_node_many(keys):
+            expected[node] = expected.get(node, 0) + 2
+        self.assertEqual(expected, stats.nodes)
+        self.assertEqual({}, stats.zones)
+
+        rendezvous.disable_stats()
+        rendezvous.find_node('lol')
+        self.assertEqual(400, stats.lookups)
+
+    def test_ties(self):
+        # "14558-0" and "109786-0" share a murmur3_32 hash
+        rendezvous = RendezvousHash(nodes=[14558, 109786])
+        stats = rendezvous.enable_stats()
+        self.assertEqual('14558', rendezvous.find_node(0))
+        self.assertEqual(['14558', 109786],
+                         rendezvous.find_node_many([0, 'lol']))
+        self.assertEqual(2, stats.ties)
+        self.assertEqual({'14558': 2, 109786: 1}, stats.nodes)
+
+    def test_empty(self):
+        rendezvous = RendezvousHash()
+        stats = rendezvous.enable_stats()
+        self.assertEqual(None, rendezvous.find_node('lol'))
+        self.assertEqual([None], rendezvous.find_node_many(['lol']))
+        self.assertEqual({None: 2}, stats.nodes)
+
+    def test_copy_and_pickle(self):
+        rendezvous = RendezvousHash(nodes=['0', '1'])
+        rendezvous.enable_stats(callback=lambda *args: None)
+        self.assertEqual(None, rendezvous.copy().stats)
+        self.assertEqual(None, pickle.loads(pickle.dumps(rendezvous)).stats)
+
+
+class ClusterStatsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cluster_config = {
+            '1': {'name': 'node1', 'zone': 'a'},
+            '2': {'name': 'node2', 'zone': 'a'},
+            '3': {'name': 'node3', 'zone': 'b'},
+            '4': {'name': 'node4', 'zone': 'b'},
+            '5': {'name': 'node5', 'zone': 'c'},
+            '6': {'name': 'node6', 'zone': 'c'},
+        }
+        self.keys = [str(i) for i in range(300)]
+
+    def expected_counts(self, cluster, results):
+        nodes = {}
+        zones = {}
+        for nodes_found in results:
+            for node in nodes_found:
+                nodes[node] = nodes.get(node, 0) + 1
+                zone = self.cluster_config[node]['zone']
+                zones[zone] = zones.get(zone, 0) + 1
+        return nodes, zones
+
+    def test_find_nodes(self):
+        plain = Cluster(self.cluster_config)
+        cluster = Cluster(self.cluster_config, cache_size=100)
+        calls = []
+        stats = cluster.enable_stats(callback=lambda *args: calls.append(args))
+
+        expected = plain.find_nodes_many(self.keys)
+        self.assertEqual(expected, [cluster.find_nodes(key)
+                                    for key in self.keys])
+        # cache hits are counted too
+        self.assertEqual(expected[:10], [cluster.find_nodes(key)
+                                         for key in self.keys[:10]])
+        self.assertEqual(310, stats.lookups)
+        nodes, zones = self.expected_counts(
+            cluster, expected + expected[:10])
+        self.assertEqual(nodes, stats.nodes)
+        self.assertEqual(zones, stats.zones)
+        self.assertEqual(0, stats.ties)
+        self.assertEqual(310, len(calls))
+        self.assertEqual(('0', expected[0]), calls[0][:2])
+
+    def test_find_nodes_many(self):
+        plain = Cluster(self.cluster_config)
+        cluster = Cluster(self.cluster_config)
+        stats = cluster.enable_stats()
+        expected = plain.find_nodes_many(self.keys)
+        self.assertEqual(expected, cluster.find_nodes_many(self.keys))
+        self.assertEqual(expected, cluster.find_nodes_many(self.keys,
+                                                           workers=2))
+        self.assertEqual(600, stats.lookups)
+        nodes, zones = self.expected_counts(cluster, expected + expected)
+        self.assertEqual(nodes, stats.nodes)
+        self.assertEqual(zones, stats.zones)
+
+    def test_find_nodes_by_index(self):
+        plain = Cluster(self.cluster_config)
+        cluster = Cluster(self.cluster_config)
+        stats = cluster.enable_stats()
+        expected = plain.find_nodes_by_index(1, 2)
+        self.assertEqual(expected, cluster.find_nodes_by_index(1, 2))
+        nodes, zones = self.expected_counts(cluster, [expected])
+        self.assertEqual(nodes, stats.nodes)
+        self.assertEqual(zones, stats.zones)
+
+    def test_ties(self):
+        cluster = Cluster({14558: {'zone': 'a'}, 109786: {'zone': 'a'}},
+                          replicas=1)
+        stats = cluster.enable_stats()
+        self.assertEqual(['14558'], cluster.find_nodes('0'))
+        self.assertEqual([['14558']], cluster.find_nodes_many(['0']))
+        self.assertEqual(2, stats.ties)
+
+    def test_new_rings(self):
+        cluster = Cluster(self.cluster_config)
+        stats = cluster.enable_stats()
+        cluster.add_node(14558, node_zone='d')
+        cluster.add_node(109786, node_zone='d')
+        self.assertTrue(cluster.rings['d'].stats is not None)
+        cluster.rings['d'].find_node(0)
+        self.assertEqual(1, stats.ties)
+        self.assertEqual(0, stats.lookups)
+
+    def test_disable(self):
+        cluster = Cluster(self.cluster_config)
+        stats = cluster.enable_stats()
+        cluster.find_nodes('lol')
+        cluster.disable_stats()
+        cluster.find_nodes('lol')
+        cluster.find_nodes_many(self.keys)
+        self.assertEqual(1, stats.lookups)
+        self.assertEqual(None, cluster.stats)
+        for ring in cluster.rings.values():
+            self.assertEqual(None, ring.stats)
+
+    def test_copies(self):
+        cluster = Cluster(self.cluster_config)
+        cluster.enable_stats(callback=lambda *args: None)
+        copied = pickle.loads(pickle.dumps(cluster))
+        self.assertEqual(None, copied.stats)
+        self.assertEqual(None, copied.rings['a'].stats)
+        self.assertEqual(None, cluster.copy().stats)
+        snapshot = cluster.snapshot()
+        self.assertEqual(None, snapshot.stats)
+        self.assertEqual(None, snapshot.rings['a'].stats)
+        self.assertRaises(TypeError, snapshot.enable_stats)
+
+
+if __name__ == '__main__':
+    unittest.main()
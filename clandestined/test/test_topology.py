@@ -0,0 +1,122 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from clandestined import Cluster
+from clandestined import HierarchicalRendezvousHash
+from clandestined import murmur3
+
+
+class TopologyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'cluster.topo')
+        self.cluster_config = {
+            '1': {'name': 'node1', 'zone': 'a'},
+            '2': {'name': 'node2', 'zone': 'a', 'weight': 2},
+            '3': {'name': 'node3', 'zone': 'b'},
+            '4': {'zone': 'b'},
+            '5': {'name': 'node5', 'zone': 'c', 'weight': 0.5},
+            '6': {'name': 'node6', 'zone': 'c'},
+        }
+        self.cluster = Cluster(self.cluster_config, replicas=3, seed=7)
+        self.keys = [str(i) for i in range(1000)]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def assertSameCluster(self, expected, cluster):
+        self.assertEqual(expected.seed, cluster.seed)
+        self.assertEqual(expected.replicas, cluster.replicas)
+        self.assertEqual(expected.version, cluster.version)
+        self.assertEqual(expected.zones, cluster.zones)
+        self.assertEqual(expected.nodes, cluster.nodes)
+        for zone in expected.zones:
+            self.assertEqual(sorted(expected.zone_members[zone]),
+                             sorted(cluster.zone_members[zone]))
+            self.assertEqual(expected.rings[zone].weights,
+                             cluster.rings[zone].weights)
+        self.assertEqual(expected.find_nodes_many(self.keys),
+                         cluster.find_nodes_many(self.keys))
+        self.assertEqual([expected.find_nodes(key) for key in self.keys],
+                         [cluster.find_nodes(key) for key in self.keys])
+
+    def test_round_trip(self):
+        self.cluster.compile(self.path)
+        for mmap in (True, False):
+            cluster = Cluster.load(self.path, mmap=mmap)
+            self.assertSameCluster(self.cluster, cluster)
+
+    def test_rebuilt_states(self):
+        native = murmur3._native
+        murmur3._native = None
+        try:
+            self.cluster.compile(self.path)
+        finally:
+            murmur3._native = native
+        self.assertSameCluster(self.cluster, Cluster.load(self.path))
+
+    def test_changes_after_load(self):
+        self.cluster.compile(self.path)
+        cluster = Cluster.load(self.path)
+        expected = self.cluster.copy()
+        for changed in (cluster, expected):
+            changed.add_node('7', node_zone='a', node_name='node7')
+            changed.remove_node('3', node_zone='b')
+            changed.set_node_weight('6', 3, node_zone='c')
+            changed.add_node('8', node_zone='d')
+        self.assertEqual(expected.find_nodes_many(self.keys),
+                         cluster.find_nodes_many(self.keys))
+        # the file is untouched by changes to a cluster loaded from it
+        self.assertSameCluster(self.cluster, Cluster.load(self.path))
+
+    def test_snapshot_and_pickle(self):
+        self.cluster.compile(self.path)
+        cluster = Cluster.load(self.path, cache_size=10)
+        snapshot = cluster.snapshot()
+        copied = pickle.loads(pickle.dumps(cluster))
+        self.assertEqual(self.cluster.find_nodes_many(self.keys),
+                         snapshot.find_nodes_many(self.keys))
+        self.assertEqual(self.cluster.find_nodes_many(self.keys),
+                         copied.find_nodes_many(self.keys))
+        self.assertEqual(self.cluster.find_nodes('lol'),
+                         cluster.find_nodes('lol'))
+
+    def test_int_ids_and_empty_zone(self):
+        cluster = Cluster({1: {'zone': None}, 2: {'zone': None}, 3: {}})
+        cluster.compile(self.path)
+        loaded = Cluster.load(self.path)
+        self.assertEqual([None], loaded.zones)
+        self.assertEqual([1, 2, 3], sorted(loaded.rings[None].nodes))
+        self.assertEqual(cluster.find_nodes_many(self.keys),
+                         loaded.find_nodes_many(self.keys))
+
+        cluster = Cluster({'1': {'zone': 'a'}})
+        cluster.add_zone('empty')
+        cluster.compile(self.path)
+        loaded = Cluster.load(self.path)
+        self.assertEqual(['a', 'empty'], loaded.zones)
+        self.assertEqual([], loaded.zone_members['empty'])
+        self.assertEqual([cluster.find_nodes(key) for key in self.keys],
+                         [loaded.find_nodes(key) for key in self.keys])
+
+    def test_unsupported(self):
+        cluster = Cluster({'1': {}}, ring_class=HierarchicalRendezvousHash)
+        self.assertRaises(TypeError, cluster.compile, self.path)
+        cluster = Cluster({('a', 1): {}})
+        self.assertRaises(ValueError, cluster.compile, self.path)
+
+    def test_not_a_topology(self):
+        for data in (b'', b'CLNDTOPO', b'x' * 64):
+            handle = open(self.path, 'wb')
+            handle.write(data)
+            handle.close()
+            for mmap in (True, False):
+                self.assertRaises(ValueError, Cluster.load, self.path, mmap)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+import json
+import mmap as _mmap
+import struct
+import sys
+from array import array
+
+from . import murmur3
+from .clandestined import _STATE_SIZE
+from .clandestined import Cluster
+from .clandestined import RendezvousHash
+from .engines import MURMUR3_32
+
+
+# A compiled topology file lays a Cluster out so it can be loaded without an
+# add_node call per node, and mapped read-only so every process on a host
+# shares one copy of the per node arrays. All integers are little-endian.
+#
+#   header    "CLNDTOPO", uint32 format version, uint32 metadata length
+#   metadata  UTF-8 JSON: seed, replicas, version, zones, members and names
+#             per zone in ring order, whether prefix states are included,
+#             and the offset of each zone's arrays
+#   arrays    per zone, 8 byte aligned: float64 weights per member, then
+#             the packed murmur3 state after each member's "<node>-" prefix
+#
+# Prefix states are only written by the _murmur3 extension, in the writer's
+# byte order, and depend on the seed. A loader that can't use them as
+# written rebuilds or skips them.
+
+MAGIC = b'CLNDTOPO'
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('<8sII')
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _check_json(value, what):
+    if json.loads(json.dumps(value)) != value:
+        raise ValueError("Only str, int and None %s can be compiled" % (what))
+
+
+def compile_cluster(cluster, path):
+    native = murmur3._native is not None
+    zones = list(cluster.zones)
+    members = []
+    names = []
+    blobs = []
+    for zone in zones:
+        ring = cluster.rings.get(zone)
+        if ring is None:
+            ring = RendezvousHash(seed=cluster.seed)
+        if type(ring) is not RendezvousHash:
+            raise TypeError("Only RendezvousHash rings can be compiled, "
+                            "zone %s has a %s" % (zone, type(ring).__name__))
+        if ring.engine is not MURMUR3_32:
+            raise TypeError("Only murmur3_32 rings can be compiled, zone %s "
+                            "uses %s" % (zone, ring.engine.name))
+        members.append(list(ring.nodes))
+        names.append([cluster.nodes.get(node) for node in ring.nodes])
+        weights = array('d', ring._weights)
+        if weights.itemsize != 8:
+            raise ValueError("float64 weights are required")
+        if struct.pack('=d', 1.0) != struct.pack('<d', 1.0):
+            weights.byteswap()
+        # arrays only have tostring on Python 2, and only tobytes on 3.9+
+        if hasattr(weights, 'tobytes'):
+            blob = weights.tobytes()
+        else:
+            blob = weights.tostring()
+        if native:
+            blob += bytes(ring._states)
+        blobs.append(blob)
+    _check_json(zones, "zones")
+    _check_json(members, "node ids")
+    _check_json(names, "node names")
+
+    # offsets are relative to the end of the metadata, padded to 8 bytes
+    offsets = []
+    offset = 0
+    for blob in blobs:
+        offsets.append(offset)
+        offset = _align(offset + len(blob))
+    meta = json.dumps({
+        'seed': cluster.seed,
+        'replicas': cluster.replicas,
+        'version': cluster.version,
+        'zones': zones,
+        'members': members,
+        'names': names,
+        'states': native,
+        'byteorder': sys.byteorder,
+        'offsets': offsets,
+    }, separators=(',', ':')).encode('utf-8')
+
+    handle = open(path, 'wb')
+    try:
+        handle.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(meta)))
+        handle.write(meta)
+        start = _HEADER.size + len(meta)
+        handle.write(b'\0' * (_align(start) - start))
+        for blob in blobs:
+            handle.write(blob)
+            handle.write(b'\0' * (_align(len(blob)) - len(blob)))
+    finally:
+        handle.close()
+
+
+def _read(path, mmap):
+    handle = open(path, 'rb')
+    try:
+        if mmap:
+            try:
+                return _mmap.mmap(handle.fileno(), 0,
+                                  access=_mmap.ACCESS_READ)
+            except ValueError:
+                # empty files can't be mapped, and aren't topologies either
+                return b''
+        return handle.read()
+    finally:
+        handle.close()
+
+
+def load_cluster(path, mmap=True, cache_size=None):
+    data = _read(path, mmap)
+    if len(data) < _HEADER.size:
+        raise ValueError("%s is not a compiled topology" % (path))
+    magic, version, meta_length = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("%s is not a compiled topology" % (path))
+    if version != FORMAT_VERSION:
+        raise ValueError("%s is topology format %d, expected %d"
+                         % (path, version, FORMAT_VERSION))
+    start = _HEADER.size + meta_length
+    meta = json.loads(data[_HEADER.size:start].decode('utf-8'))
+    start = _align(start)
+
+    try:
+        view = memoryview(data)
+    except TypeError:
+        # Python 2 mmaps only have the old buffer interface, read them out
+        view = memoryview(data[:])
+    seed = meta['seed']
+    # states are only used as written when the extension that reads them
+    # is present, otherwise rings rebuild or skip them.
+    use_states = (meta['states'] and murmur3._native is not None and
+                  meta['byteorder'] == sys.byteorder)
+    swapped = struct.pack('=d', 1.0) != struct.pack('<d', 1.0)
+
+    cluster = Cluster(replicas=meta['replicas'], seed=seed,
+                      cache_size=cache_size)
+    for zone, nodes, names, offset in zip(meta['zones'], meta['members'],
+                                          meta['names'], meta['offsets']):
+        count = len(nodes)
+        position = start + offset
+        weights = view[position:position + 8 * count]
+        if swapped or not hasattr(weights, 'cast'):
+            weights = array('d', weights.tobytes())
+            if swapped:
+                weights.byteswap()
+        else:
+            weights = weights.cast('d')
+        position += 8 * count
+        states = None
+        if use_states:
+            states = view[position:position + _STATE_SIZE * count]
+        elif murmur3._native is None:
+            states = bytearray()
+        cluster.zones.append(zone)
+        cluster.zone_members[zone] = list(nodes)
+        for node, name in zip(nodes, names):
+            cluster.nodes[node] = name
+        if count:
+            cluster.rings[zone] = RendezvousHash._from_arrays(
+                nodes, seed, weights, states)
+        cluster._ring_versions[zone] = meta['version']
+    cluster.version = meta['version']
+    return cluster
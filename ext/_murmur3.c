@@ -1,6 +1,7 @@
 #define PY_SSIZE_T_CLEAN
 #include <Python.h>
 
+#include <math.h>
 #include <stdint.h>
 #include <string.h>
 
@@ -24,11 +25,13 @@ uint32_t murmur3_32(const char *key, Py_ssize_t len, uint32_t seed) {
  
     uint32_t hash = seed;
  
-    const int nblocks = len / 4;
-    const uint32_t *blocks = (const uint32_t *) key;
-    int i;
+    // blocks are loaded with memcpy, buffers such as memoryview slices
+    // needn't be aligned.
+    const Py_ssize_t nblocks = len / 4;
+    Py_ssize_t i;
     for (i = 0; i < nblocks; i++) {
-        uint32_t k = blocks[i];
+        uint32_t k;
+        memcpy(&k, key + i * 4, 4);
         k *= c1;
         k = (k << r1) | (k >> (32 - r1));
         k *= c2;
@@ -64,22 +67,239 @@ uint32_t murmur3_32(const char *key, Py_ssize_t len, uint32_t seed) {
     return hash;
 }
 
+// murmur3_32 split into init/update/digest so a hash can be resumed, e.g.
+// from the state left after hashing a ring node's "<node>-" prefix. Blocks
+// are loaded in native order like murmur3_32 above, so both agree.
+typedef struct {
+    uint32_t hash;
+    uint32_t len;
+    uint8_t tail[4];
+} murmur3_state;
+
+static inline uint32_t murmur3_block(uint32_t hash, uint32_t k)
+{
+    k *= 0xcc9e2d51;
+    k = (k << 15) | (k >> 17);
+    k *= 0x1b873593;
+    hash ^= k;
+    return ((hash << 13) | (hash >> 19)) * 5 + 0xe6546b64;
+}
+
+static void murmur3_state_init(murmur3_state *state, uint32_t seed)
+{
+    state->hash = seed;
+    state->len = 0;
+    memset(state->tail, 0, sizeof(state->tail));
+}
+
+static void murmur3_state_update(murmur3_state *state, const char *data,
+                                 Py_ssize_t len)
+{
+    const uint8_t *bytes = (const uint8_t *) data;
+    uint32_t used = state->len & 3;
+    uint32_t k;
+
+    state->len += (uint32_t) len;
+    if (used) {
+        while (used < 4 && len > 0) {
+            state->tail[used++] = *bytes++;
+            len--;
+        }
+        if (used < 4) {
+            return;
+        }
+        memcpy(&k, state->tail, 4);
+        state->hash = murmur3_block(state->hash, k);
+    }
+    while (len >= 4) {
+        memcpy(&k, bytes, 4);
+        state->hash = murmur3_block(state->hash, k);
+        bytes += 4;
+        len -= 4;
+    }
+    memcpy(state->tail, bytes, len);
+}
+
+static uint32_t murmur3_state_digest(const murmur3_state *state)
+{
+    uint32_t hash = state->hash;
+    uint32_t k1 = 0;
+
+    switch (state->len & 3) {
+    case 3:
+        k1 ^= state->tail[2] << 16;
+    case 2:
+        k1 ^= state->tail[1] << 8;
+    case 1:
+        k1 ^= state->tail[0];
+
+        k1 *= 0xcc9e2d51;
+        k1 = (k1 << 15) | (k1 >> 17);
+        k1 *= 0x1b873593;
+        hash ^= k1;
+    }
+
+    hash ^= state->len;
+    hash ^= (hash >> 16);
+    hash *= 0x85ebca6b;
+    hash ^= (hash >> 13);
+    hash *= 0xc2b2ae35;
+    hash ^= (hash >> 16);
+
+    return hash;
+}
+
 static char module_docstring[] =
     "This module provides an interface for calculating murmur3_32 hashes with C.";
 static char murmur3_32_docstring[] =
     "Calculate the murmur3_32 hash for a given string.";
+static char murmur3_32_many_docstring[] =
+    "Calculate the murmur3_32 hash for each string in an iterable, returning an array('I').";
+static char prefix_state_docstring[] =
+    "Return the packed murmur3_32 state after hashing a ring node's prefix.";
+static char find_node_docstring[] =
+    "Find the highest scoring prefix state for a key, returning (index, tied).\n"
+    "An optional array('d') of node weights selects logarithmic weighted scoring.\n"
+    "When tied is true the caller must break the tie, index is one of the winners.";
+static char find_node_many_docstring[] =
+    "Find the highest scoring prefix state for each key, returning an array of\n"
+    "indexes in which a tied winner at index i is stored as -1 - i.";
+static char scores_docstring[] =
+    "Score every prefix state for a key, returning an array('I') in node order.";
+static char murmur3_x64_128_docstring[] =
+    "Calculate the murmur3_x64_128 hash for a given string, as an int holding\n"
+    "the first 64-bit half of the digest in its low bits.";
+static char engine_state_docstring[] =
+    "Return the packed state of a ring node's prefix for a hash engine.";
+static char engine_find_node_docstring[] =
+    "find_node for the ENGINE_* hash engine given, with the ring's seed.";
+static char engine_find_node_many_docstring[] =
+    "find_node_many for the ENGINE_* hash engine given, with the ring's seed.";
+static char engine_scores_docstring[] =
+    "Score every node state for a key with a hash engine, returning a list of\n"
+    "ints in node order.";
+static char maglev_table_docstring[] =
+    "Fill a Maglev lookup table of size slots from each node's (offset, skip)\n"
+    "permutation, returning an array('l') of the node index owning each slot.\n"
+    "An optional array('d') of node weights lets node i claim weights[i] /\n"
+    "max(weights) slots per round instead of one.";
+static char murmur3_type_docstring[] =
+    "Murmur3(data=None, seed=0)\n\n"
+    "Incremental murmur3_32 hasher with update(), copy() and digest().";
 
 static PyObject *clandestined_murmur3_32(PyObject *self, PyObject *args);
+static PyObject *clandestined_murmur3_32_many(PyObject *self, PyObject *args);
+static PyObject *clandestined_prefix_state(PyObject *self, PyObject *args);
+static PyObject *clandestined_find_node(PyObject *self, PyObject *args);
+static PyObject *clandestined_find_node_many(PyObject *self, PyObject *args);
+static PyObject *clandestined_scores(PyObject *self, PyObject *args);
+static PyObject *clandestined_murmur3_x64_128(PyObject *self, PyObject *args);
+static PyObject *clandestined_engine_state(PyObject *self, PyObject *args);
+static PyObject *clandestined_engine_find_node(PyObject *self, PyObject *args);
+static PyObject *clandestined_engine_find_node_many(PyObject *self, PyObject *args);
+static PyObject *clandestined_engine_scores(PyObject *self, PyObject *args);
+static PyObject *clandestined_maglev_table(PyObject *self, PyObject *args);
  
 static PyMethodDef module_methods[] = {
     {"murmur3_32", clandestined_murmur3_32, METH_VARARGS, murmur3_32_docstring},
+    {"murmur3_32_many", clandestined_murmur3_32_many, METH_VARARGS, murmur3_32_many_docstring},
+    {"prefix_state", clandestined_prefix_state, METH_VARARGS, prefix_state_docstring},
+    {"find_node", clandestined_find_node, METH_VARARGS, find_node_docstring},
+    {"find_node_many", clandestined_find_node_many, METH_VARARGS, find_node_many_docstring},
+    {"scores", clandestined_scores, METH_VARARGS, scores_docstring},
+    {"murmur3_x64_128", clandestined_murmur3_x64_128, METH_VARARGS, murmur3_x64_128_docstring},
+    {"engine_state", clandestined_engine_state, METH_VARARGS, engine_state_docstring},
+    {"engine_find_node", clandestined_engine_find_node, METH_VARARGS, engine_find_node_docstring},
+    {"engine_find_node_many", clandestined_engine_find_node_many, METH_VARARGS, engine_find_node_many_docstring},
+    {"engine_scores", clandestined_engine_scores, METH_VARARGS, engine_scores_docstring},
+    {"maglev_table", clandestined_maglev_table, METH_VARARGS, maglev_table_docstring},
     {NULL, NULL, 0, NULL}
 };
 
+typedef struct {
+    PyObject_HEAD
+    murmur3_state state;
+} Murmur3Object;
+
+static int Murmur3_init(Murmur3Object *self, PyObject *args, PyObject *kwargs);
+static PyObject *Murmur3_update(Murmur3Object *self, PyObject *args);
+static PyObject *Murmur3_copy(Murmur3Object *self);
+static PyObject *Murmur3_digest(Murmur3Object *self);
+
+static PyMethodDef Murmur3_methods[] = {
+    {"update", (PyCFunction) Murmur3_update, METH_VARARGS,
+     "Feed more str or bytes data into the hash."},
+    {"copy", (PyCFunction) Murmur3_copy, METH_NOARGS,
+     "Return an independent copy of the hasher."},
+    {"digest", (PyCFunction) Murmur3_digest, METH_NOARGS,
+     "Return the murmur3_32 hash of the data fed so far."},
+    {NULL, NULL, 0, NULL}
+};
+
+static PyTypeObject Murmur3Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+};
+
 struct module_state {
     PyObject *error;
 };
 
+// array.array, used to build compact results for the batch entry points
+static PyObject *array_type = NULL;
+static const char *uint32_typecode = sizeof(unsigned int) == 4 ? "I" : "L";
+
+#if PY_MAJOR_VERSION < 3
+// the formats of Python 2 arrays, by typecode
+static const char *array_formats[] = {
+    "c", "b", "B", "u", "h", "H", "i", "I", "l", "L", "f", "d", NULL
+};
+#endif
+
+// PyObject_GetBuffer, except that on Python 2 an array.array, which only
+// has the old buffer interface, is exposed as an equivalent Py_buffer with
+// the array's typecode as its format.
+static int get_buffer(PyObject *obj, Py_buffer *view, int flags)
+{
+#if PY_MAJOR_VERSION < 3
+    if (!PyObject_CheckBuffer(obj) && PyObject_TypeCheck(obj,
+            (PyTypeObject *) array_type)) {
+        void *buf;
+        Py_ssize_t len;
+        int readonly = !(flags & PyBUF_WRITABLE);
+        if (readonly) {
+            const void *data;
+            if (PyObject_AsReadBuffer(obj, &data, &len) < 0) {
+                return -1;
+            }
+            buf = (void *) data;
+        } else if (PyObject_AsWriteBuffer(obj, &buf, &len) < 0) {
+            return -1;
+        }
+        if (PyBuffer_FillInfo(view, obj, buf, len, readonly, flags) < 0) {
+            return -1;
+        }
+        if (flags & PyBUF_FORMAT) {
+            PyObject *typecode = PyObject_GetAttrString(obj, "typecode");
+            const char **format;
+            if (typecode == NULL) {
+                PyBuffer_Release(view);
+                return -1;
+            }
+            view->format = NULL;
+            for (format = array_formats; *format != NULL; format++) {
+                if (PyString_Check(typecode) &&
+                        strcmp(PyString_AS_STRING(typecode), *format) == 0) {
+                    view->format = (char *) *format;
+                }
+            }
+            Py_DECREF(typecode);
+        }
+        return 0;
+    }
+#endif
+    return PyObject_GetBuffer(obj, view, flags);
+}
+
 #if COMPILING_IN_CPYTHON && PY_MAJOR_VERSION >= 3
 #define GETSTATE(m) ((struct module_state*)PyModule_GetState(m))
 #else
@@ -136,23 +356,1288 @@ PyMODINIT_FUNC init_murmur3(void)
         INITERROR;
     }
 
+    Murmur3Type.tp_name = "clandestined._murmur3.Murmur3";
+    Murmur3Type.tp_basicsize = sizeof(Murmur3Object);
+    Murmur3Type.tp_flags = Py_TPFLAGS_DEFAULT;
+    Murmur3Type.tp_doc = murmur3_type_docstring;
+    Murmur3Type.tp_methods = Murmur3_methods;
+    Murmur3Type.tp_init = (initproc) Murmur3_init;
+    Murmur3Type.tp_new = PyType_GenericNew;
+    if (PyType_Ready(&Murmur3Type) < 0) {
+        Py_DECREF(m);
+        INITERROR;
+    }
+    Py_INCREF(&Murmur3Type);
+    if (PyModule_AddObject(m, "Murmur3", (PyObject *) &Murmur3Type) < 0) {
+        Py_DECREF(&Murmur3Type);
+        Py_DECREF(m);
+        INITERROR;
+    }
+
+    if (PyModule_AddIntConstant(m, "ENGINE_MURMUR3_32", 0) < 0 ||
+            PyModule_AddIntConstant(m, "ENGINE_MURMUR3_128", 1) < 0 ||
+            PyModule_AddIntConstant(m, "ENGINE_MIX64", 2) < 0) {
+        Py_DECREF(m);
+        INITERROR;
+    }
+
+    PyObject *array_module = PyImport_ImportModule("array");
+    if (array_module == NULL) {
+        Py_DECREF(m);
+        INITERROR;
+    }
+    array_type = PyObject_GetAttrString(array_module, "array");
+    Py_DECREF(array_module);
+    if (array_type == NULL) {
+        Py_DECREF(m);
+        INITERROR;
+    }
+
 #if PY_MAJOR_VERSION >= 3
     return m;
 #endif
 }
 
+// Inputs at least this long are hashed with the GIL released.
+#define GIL_RELEASE_BYTES 4096
+
+// Point at the bytes of a str (UTF-8 encoded, as "s#" does) or of any object
+// supporting the buffer protocol, without copying. view must be released
+// with PyBuffer_Release once the bytes are no longer needed; it holds the
+// export that stops e.g. a bytearray being resized under us. Python 2
+// unicode is encoded to a new UTF-8 str, which view keeps alive.
+static int get_key(PyObject *obj, Py_buffer *view, const char **key,
+                   Py_ssize_t *len)
+{
+    view->obj = NULL;
+#if PY_MAJOR_VERSION >= 3
+    if (PyUnicode_Check(obj)) {
+        *key = PyUnicode_AsUTF8AndSize(obj, len);
+        return *key == NULL ? -1 : 0;
+    }
+#else
+    if (PyUnicode_Check(obj)) {
+        PyObject *encoded = PyUnicode_AsUTF8String(obj);
+        int result;
+
+        if (encoded == NULL) {
+            return -1;
+        }
+        result = PyObject_GetBuffer(encoded, view, PyBUF_SIMPLE);
+        Py_DECREF(encoded);
+        if (result < 0) {
+            return -1;
+        }
+        *key = (const char *) view->buf;
+        *len = view->len;
+        return 0;
+    }
+#endif
+    if (!PyObject_CheckBuffer(obj)) {
+        PyErr_Format(PyExc_TypeError,
+                     "murmur3_32 keys must be str or bytes-like, not %.200s",
+                     Py_TYPE(obj)->tp_name);
+        return -1;
+    }
+    if (PyObject_GetBuffer(obj, view, PyBUF_SIMPLE) < 0) {
+        return -1;
+    }
+    *key = (const char *) view->buf;
+    *len = view->len;
+    return 0;
+}
+
 static PyObject *clandestined_murmur3_32(PyObject *self, PyObject *args)
 {
+    PyObject *data;
     const char *key;
     Py_ssize_t len;
     uint32_t seed = 0;
+    Py_buffer view;
 
-    if (!PyArg_ParseTuple(args, "s#|i", &key, &len, &seed)) {
+    if (!PyArg_ParseTuple(args, "O|i", &data, &seed)) {
+        return NULL;
+    }
+    if (get_key(data, &view, &key, &len) < 0) {
         return NULL;
     }
 
-    uint32_t value = murmur3_32(key, len, seed);
+    uint32_t value;
+    if (len >= GIL_RELEASE_BYTES) {
+        Py_BEGIN_ALLOW_THREADS
+        value = murmur3_32(key, len, seed);
+        Py_END_ALLOW_THREADS
+    } else {
+        value = murmur3_32(key, len, seed);
+    }
+    PyBuffer_Release(&view);
  
     PyObject *ret = Py_BuildValue("k", value);
     return ret;
 }
+
+// murmur3_32_many pins and hashes keys in chunks of this many.
+#define MANY_CHUNK 128
+
+// Allocate a zero filled array of len items and expose its buffer.
+static PyObject *new_array(const char *typecode, Py_ssize_t itemsize,
+                           Py_ssize_t len, Py_buffer *view)
+{
+    PyObject *zeros = PyBytes_FromStringAndSize(NULL, len * itemsize);
+    if (zeros == NULL) {
+        return NULL;
+    }
+    memset(PyBytes_AS_STRING(zeros), 0, len * itemsize);
+    PyObject *result = PyObject_CallFunction(array_type, "sO", typecode, zeros);
+    Py_DECREF(zeros);
+    if (result == NULL) {
+        return NULL;
+    }
+    if (get_buffer(result, view, PyBUF_WRITABLE) < 0) {
+        Py_DECREF(result);
+        return NULL;
+    }
+    return result;
+}
+
+static PyObject *clandestined_murmur3_32_many(PyObject *self, PyObject *args)
+{
+    PyObject *keys;
+    uint32_t seed = 0;
+
+    if (!PyArg_ParseTuple(args, "O|i", &keys, &seed)) {
+        return NULL;
+    }
+
+    PyObject *seq = PySequence_Fast(keys, "murmur3_32_many expects an iterable");
+    if (seq == NULL) {
+        return NULL;
+    }
+
+    Py_ssize_t n = PySequence_Fast_GET_SIZE(seq);
+    PyObject **items = PySequence_Fast_ITEMS(seq);
+    Py_buffer view;
+    PyObject *result = new_array(uint32_typecode, 4, n, &view);
+    if (result == NULL) {
+        Py_DECREF(seq);
+        return NULL;
+    }
+
+    // keys are pinned a chunk at a time so the hashing itself can run
+    // without the GIL. A list is its own fast sequence and str keys leave
+    // no buffer export behind, so each key is also held for the chunk in
+    // case another thread drops it from the list meanwhile.
+    uint32_t *out = (uint32_t *) view.buf;
+    PyObject *key_objs[MANY_CHUNK];
+    Py_buffer views[MANY_CHUNK];
+    const char *chunk_keys[MANY_CHUNK];
+    Py_ssize_t chunk_lens[MANY_CHUNK];
+    Py_ssize_t start;
+    for (start = 0; start < n; start += MANY_CHUNK) {
+        Py_ssize_t count = n - start < MANY_CHUNK ? n - start : MANY_CHUNK;
+        Py_ssize_t total = 0;
+        Py_ssize_t i;
+        for (i = 0; i < count; i++) {
+            key_objs[i] = items[start + i];
+            Py_INCREF(key_objs[i]);
+            if (get_key(key_objs[i], &views[i], &chunk_keys[i],
+                        &chunk_lens[i]) < 0) {
+                Py_DECREF(key_objs[i]);
+                while (i--) {
+                    PyBuffer_Release(&views[i]);
+                    Py_DECREF(key_objs[i]);
+                }
+                PyBuffer_Release(&view);
+                Py_DECREF(result);
+                Py_DECREF(seq);
+                return NULL;
+            }
+            total += chunk_lens[i];
+        }
+        if (total >= GIL_RELEASE_BYTES) {
+            Py_BEGIN_ALLOW_THREADS
+            for (i = 0; i < count; i++) {
+                out[start + i] = murmur3_32(chunk_keys[i], chunk_lens[i], seed);
+            }
+            Py_END_ALLOW_THREADS
+        } else {
+            for (i = 0; i < count; i++) {
+                out[start + i] = murmur3_32(chunk_keys[i], chunk_lens[i], seed);
+            }
+        }
+        for (i = 0; i < count; i++) {
+            PyBuffer_Release(&views[i]);
+            Py_DECREF(key_objs[i]);
+        }
+    }
+
+    PyBuffer_Release(&view);
+    Py_DECREF(seq);
+    return result;
+}
+
+static int Murmur3_init(Murmur3Object *self, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"data", "seed", NULL};
+    PyObject *data = NULL;
+    unsigned int seed = 0;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "|OI", kwlist, &data, &seed)) {
+        return -1;
+    }
+
+    murmur3_state_init(&self->state, seed);
+    if (data != NULL && data != Py_None) {
+        const char *key;
+        Py_ssize_t len;
+        Py_buffer view;
+        if (get_key(data, &view, &key, &len) < 0) {
+            return -1;
+        }
+        murmur3_state_update(&self->state, key, len);
+        PyBuffer_Release(&view);
+    }
+    return 0;
+}
+
+static PyObject *Murmur3_update(Murmur3Object *self, PyObject *args)
+{
+    PyObject *data;
+    const char *key;
+    Py_ssize_t len;
+    Py_buffer view;
+
+    if (!PyArg_ParseTuple(args, "O", &data)) {
+        return NULL;
+    }
+    if (get_key(data, &view, &key, &len) < 0) {
+        return NULL;
+    }
+    murmur3_state_update(&self->state, key, len);
+    PyBuffer_Release(&view);
+    Py_RETURN_NONE;
+}
+
+static PyObject *Murmur3_copy(Murmur3Object *self)
+{
+    Murmur3Object *copy = PyObject_New(Murmur3Object, Py_TYPE(self));
+    if (copy == NULL) {
+        return NULL;
+    }
+    copy->state = self->state;
+    return (PyObject *) copy;
+}
+
+static PyObject *Murmur3_digest(Murmur3Object *self)
+{
+    return Py_BuildValue("k", (unsigned long) murmur3_state_digest(&self->state));
+}
+
+static PyObject *clandestined_prefix_state(PyObject *self, PyObject *args)
+{
+    const char *prefix;
+    Py_ssize_t len;
+    unsigned int seed = 0;
+
+    if (!PyArg_ParseTuple(args, "s#|I", &prefix, &len, &seed)) {
+        return NULL;
+    }
+
+    murmur3_state state;
+    murmur3_state_init(&state, seed);
+    murmur3_state_update(&state, prefix, len);
+    return PyBytes_FromStringAndSize((const char *) &state, sizeof(state));
+}
+
+// Expose a buffer of packed prefix states, one per ring node.
+static int get_states(PyObject *obj, Py_buffer *view, Py_ssize_t *n)
+{
+    if (PyObject_GetBuffer(obj, view, PyBUF_SIMPLE) < 0) {
+        return -1;
+    }
+    if (view->len % sizeof(murmur3_state) != 0) {
+        PyBuffer_Release(view);
+        PyErr_SetString(PyExc_TypeError, "prefix states must be packed prefix_state() values");
+        return -1;
+    }
+    *n = view->len / sizeof(murmur3_state);
+    return 0;
+}
+
+// Expose an optional array('d') of node weights running parallel to the
+// prefix states. *weights is left NULL when obj is None.
+static int get_weights(PyObject *obj, Py_ssize_t n, Py_buffer *view,
+                       const double **weights)
+{
+    *weights = NULL;
+    view->obj = NULL;
+    if (obj == NULL || obj == Py_None) {
+        return 0;
+    }
+    if (get_buffer(obj, view, PyBUF_FORMAT | PyBUF_C_CONTIGUOUS) < 0) {
+        return -1;
+    }
+    if (view->format == NULL || strcmp(view->format, "d") != 0 ||
+            view->len != n * (Py_ssize_t) sizeof(double)) {
+        PyBuffer_Release(view);
+        PyErr_SetString(PyExc_TypeError,
+                        "weights must be an array('d') with one weight per node");
+        return -1;
+    }
+    *weights = (const double *) view->buf;
+    return 0;
+}
+
+// Logarithmic weighted rendezvous score. The hash is mapped into (0, 1) so
+// the score is strictly increasing in the hash for a fixed weight.
+static double weighted_score(uint32_t hash, double weight)
+{
+    return weight / -log((hash + 0.5) / 4294967296.0);
+}
+
+static uint32_t score_state(const char *states, Py_ssize_t i,
+                            const char *key, Py_ssize_t key_len)
+{
+    murmur3_state state;
+    memcpy(&state, states + i * sizeof(state), sizeof(state));
+    murmur3_state_update(&state, key, key_len);
+    return murmur3_state_digest(&state);
+}
+
+// Resume every node's prefix state with key and return the winning index.
+// Ties are broken by str(node), which the states know nothing about, so
+// *tied is set and the caller settles it.
+static Py_ssize_t best_state(const char *states, Py_ssize_t n,
+                             const char *key, Py_ssize_t key_len,
+                             const double *weights, int *tied)
+{
+    Py_ssize_t i;
+    Py_ssize_t winner = -1;
+    double high_score = -1;
+    *tied = 0;
+    for (i = 0; i < n; i++) {
+        uint32_t hash = score_state(states, i, key, key_len);
+        double score = weights ? weighted_score(hash, weights[i]) : hash;
+        if (score > high_score) {
+            high_score = score;
+            winner = i;
+            *tied = 0;
+        } else if (score == high_score) {
+            *tied = 1;
+        }
+    }
+    return winner;
+}
+
+static PyObject *clandestined_find_node(PyObject *self, PyObject *args)
+{
+    PyObject *states_obj;
+    const char *key;
+    Py_ssize_t key_len;
+    PyObject *weights_obj = NULL;
+
+    if (!PyArg_ParseTuple(args, "Os#|O", &states_obj, &key, &key_len,
+                          &weights_obj)) {
+        return NULL;
+    }
+
+    Py_buffer states_view;
+    Py_ssize_t n;
+    if (get_states(states_obj, &states_view, &n) < 0) {
+        return NULL;
+    }
+    if (n == 0) {
+        PyBuffer_Release(&states_view);
+        Py_RETURN_NONE;
+    }
+
+    Py_buffer weights_view;
+    const double *weights;
+    if (get_weights(weights_obj, n, &weights_view, &weights) < 0) {
+        PyBuffer_Release(&states_view);
+        return NULL;
+    }
+
+    int tied;
+    Py_ssize_t winner = best_state(states_view.buf, n, key, key_len,
+                                   weights, &tied);
+
+    PyBuffer_Release(&weights_view);
+    PyBuffer_Release(&states_view);
+    return Py_BuildValue("(nO)", winner, tied ? Py_True : Py_False);
+}
+
+// Ring keys are hashed as str(key), matching "%s-%s" % (str(node), str(key)).
+static PyObject *key_str(PyObject *obj)
+{
+#if PY_MAJOR_VERSION >= 3
+    if (PyUnicode_CheckExact(obj)) {
+#else
+    if (PyBytes_CheckExact(obj)) {
+#endif
+        Py_INCREF(obj);
+        return obj;
+    }
+    return PyObject_Str(obj);
+}
+
+static PyObject *clandestined_find_node_many(PyObject *self, PyObject *args)
+{
+    PyObject *states_obj;
+    PyObject *keys;
+    PyObject *weights_obj = NULL;
+
+    if (!PyArg_ParseTuple(args, "OO|O", &states_obj, &keys, &weights_obj)) {
+        return NULL;
+    }
+
+    Py_buffer states_view;
+    Py_ssize_t n;
+    if (get_states(states_obj, &states_view, &n) < 0) {
+        return NULL;
+    }
+    PyObject *key_seq = PySequence_Fast(keys, "find_node_many expects an iterable of keys");
+    if (key_seq == NULL) {
+        PyBuffer_Release(&states_view);
+        return NULL;
+    }
+
+    Py_ssize_t key_count = PySequence_Fast_GET_SIZE(key_seq);
+    PyObject **key_items = PySequence_Fast_ITEMS(key_seq);
+    PyObject *result = NULL;
+    Py_buffer view;
+    Py_buffer weights_view;
+    const double *weights;
+    Py_ssize_t i;
+
+    weights_view.obj = NULL;
+    if (n == 0 && key_count > 0) {
+        PyErr_SetString(PyExc_ValueError, "find_node_many requires at least one node");
+        goto done;
+    }
+    if (get_weights(weights_obj, n, &weights_view, &weights) < 0) {
+        goto done;
+    }
+
+    result = new_array("l", sizeof(long), key_count, &view);
+    if (result == NULL) {
+        goto done;
+    }
+    // keys are pinned a chunk at a time and scored without the GIL, so
+    // batches routed from several threads run in parallel.
+    long *winners = (long *) view.buf;
+    const char *states = states_view.buf;
+    PyObject *key_objs[MANY_CHUNK];
+    Py_buffer key_views[MANY_CHUNK];
+    const char *chunk_keys[MANY_CHUNK];
+    Py_ssize_t chunk_lens[MANY_CHUNK];
+    Py_ssize_t start;
+    for (start = 0; start < key_count; start += MANY_CHUNK) {
+        Py_ssize_t count = key_count - start < MANY_CHUNK ?
+                           key_count - start : MANY_CHUNK;
+        Py_ssize_t total = 0;
+        for (i = 0; i < count; i++) {
+            key_objs[i] = key_str(key_items[start + i]);
+            if (key_objs[i] == NULL ||
+                    get_key(key_objs[i], &key_views[i], &chunk_keys[i],
+                            &chunk_lens[i]) < 0) {
+                Py_XDECREF(key_objs[i]);
+                while (i--) {
+                    PyBuffer_Release(&key_views[i]);
+                    Py_DECREF(key_objs[i]);
+                }
+                goto fail;
+            }
+            total += chunk_lens[i];
+        }
+        // every key is hashed once per node
+        if ((total + count) * n >= GIL_RELEASE_BYTES) {
+            Py_BEGIN_ALLOW_THREADS
+            for (i = 0; i < count; i++) {
+                int tied;
+                Py_ssize_t winner = best_state(states, n, chunk_keys[i],
+                                               chunk_lens[i], weights,
+                                               &tied);
+                winners[start + i] = tied ? -1 - winner : winner;
+            }
+            Py_END_ALLOW_THREADS
+        } else {
+            for (i = 0; i < count; i++) {
+                int tied;
+                Py_ssize_t winner = best_state(states, n, chunk_keys[i],
+                                               chunk_lens[i], weights,
+                                               &tied);
+                winners[start + i] = tied ? -1 - winner : winner;
+            }
+        }
+        for (i = 0; i < count; i++) {
+            PyBuffer_Release(&key_views[i]);
+            Py_DECREF(key_objs[i]);
+        }
+    }
+    PyBuffer_Release(&view);
+    goto done;
+
+fail:
+    PyBuffer_Release(&view);
+    Py_CLEAR(result);
+done:
+    PyBuffer_Release(&weights_view);
+    Py_DECREF(key_seq);
+    PyBuffer_Release(&states_view);
+    return result;
+}
+
+static PyObject *clandestined_scores(PyObject *self, PyObject *args)
+{
+    PyObject *states_obj;
+    const char *key;
+    Py_ssize_t key_len;
+
+    if (!PyArg_ParseTuple(args, "Os#", &states_obj, &key, &key_len)) {
+        return NULL;
+    }
+
+    Py_buffer states_view;
+    Py_ssize_t n;
+    if (get_states(states_obj, &states_view, &n) < 0) {
+        return NULL;
+    }
+
+    Py_buffer view;
+    PyObject *result = new_array(uint32_typecode, 4, n, &view);
+    if (result != NULL) {
+        uint32_t *out = (uint32_t *) view.buf;
+        Py_ssize_t i;
+        for (i = 0; i < n; i++) {
+            out[i] = score_state(states_view.buf, i, key, key_len);
+        }
+        PyBuffer_Release(&view);
+    }
+
+    PyBuffer_Release(&states_view);
+    return result;
+}
+
+// MurmurHash3_x64_128, with the same init/update/digest split as the
+// murmur3_32 state above so ring engines can resume from a node's prefix.
+typedef struct {
+    uint64_t h1;
+    uint64_t h2;
+    uint64_t len;
+    uint8_t tail[16];
+} murmur3_128_state;
+
+#define ROTL64(x, r) (((x) << (r)) | ((x) >> (64 - (r))))
+
+static inline uint64_t fmix64(uint64_t k)
+{
+    k ^= k >> 33;
+    k *= 0xff51afd7ed558ccdULL;
+    k ^= k >> 33;
+    k *= 0xc4ceb9fe1a85ec53ULL;
+    k ^= k >> 33;
+    return k;
+}
+
+static inline void murmur3_128_block(murmur3_128_state *state,
+                                     const uint8_t *block)
+{
+    static const uint64_t c1 = 0x87c37b91114253d5ULL;
+    static const uint64_t c2 = 0x4cf5ad432745937fULL;
+    uint64_t k1, k2;
+
+    memcpy(&k1, block, 8);
+    memcpy(&k2, block + 8, 8);
+
+    k1 *= c1;
+    k1 = ROTL64(k1, 31);
+    k1 *= c2;
+    state->h1 ^= k1;
+    state->h1 = ROTL64(state->h1, 27);
+    state->h1 += state->h2;
+    state->h1 = state->h1 * 5 + 0x52dce729;
+
+    k2 *= c2;
+    k2 = ROTL64(k2, 33);
+    k2 *= c1;
+    state->h2 ^= k2;
+    state->h2 = ROTL64(state->h2, 31);
+    state->h2 += state->h1;
+    state->h2 = state->h2 * 5 + 0x38495ab5;
+}
+
+static void murmur3_128_init(murmur3_128_state *state, uint32_t seed)
+{
+    state->h1 = seed;
+    state->h2 = seed;
+    state->len = 0;
+    memset(state->tail, 0, sizeof(state->tail));
+}
+
+static void murmur3_128_update(murmur3_128_state *state, const char *data,
+                               Py_ssize_t len)
+{
+    const uint8_t *bytes = (const uint8_t *) data;
+    uint64_t used = state->len & 15;
+
+    state->len += (uint64_t) len;
+    if (used) {
+        while (used < 16 && len > 0) {
+            state->tail[used++] = *bytes++;
+            len--;
+        }
+        if (used < 16) {
+            return;
+        }
+        murmur3_128_block(state, state->tail);
+    }
+    while (len >= 16) {
+        murmur3_128_block(state, bytes);
+        bytes += 16;
+        len -= 16;
+    }
+    memcpy(state->tail, bytes, len);
+}
+
+static void murmur3_128_digest(const murmur3_128_state *state, uint64_t *out1,
+                               uint64_t *out2)
+{
+    static const uint64_t c1 = 0x87c37b91114253d5ULL;
+    static const uint64_t c2 = 0x4cf5ad432745937fULL;
+    const uint8_t *tail = state->tail;
+    uint64_t h1 = state->h1;
+    uint64_t h2 = state->h2;
+    uint64_t k1 = 0;
+    uint64_t k2 = 0;
+
+    switch (state->len & 15) {
+    case 15: k2 ^= ((uint64_t) tail[14]) << 48;
+    case 14: k2 ^= ((uint64_t) tail[13]) << 40;
+    case 13: k2 ^= ((uint64_t) tail[12]) << 32;
+    case 12: k2 ^= ((uint64_t) tail[11]) << 24;
+    case 11: k2 ^= ((uint64_t) tail[10]) << 16;
+    case 10: k2 ^= ((uint64_t) tail[9]) << 8;
+    case 9:
+        k2 ^= ((uint64_t) tail[8]);
+        k2 *= c2;
+        k2 = ROTL64(k2, 33);
+        k2 *= c1;
+        h2 ^= k2;
+    case 8: k1 ^= ((uint64_t) tail[7]) << 56;
+    case 7: k1 ^= ((uint64_t) tail[6]) << 48;
+    case 6: k1 ^= ((uint64_t) tail[5]) << 40;
+    case 5: k1 ^= ((uint64_t) tail[4]) << 32;
+    case 4: k1 ^= ((uint64_t) tail[3]) << 24;
+    case 3: k1 ^= ((uint64_t) tail[2]) << 16;
+    case 2: k1 ^= ((uint64_t) tail[1]) << 8;
+    case 1:
+        k1 ^= ((uint64_t) tail[0]);
+        k1 *= c1;
+        k1 = ROTL64(k1, 31);
+        k1 *= c2;
+        h1 ^= k1;
+    }
+
+    h1 ^= state->len;
+    h2 ^= state->len;
+    h1 += h2;
+    h2 += h1;
+    h1 = fmix64(h1);
+    h2 = fmix64(h2);
+    h1 += h2;
+    h2 += h1;
+    *out1 = h1;
+    *out2 = h2;
+}
+
+static uint64_t murmur3_128_first(const char *data, Py_ssize_t len,
+                                  uint32_t seed)
+{
+    murmur3_128_state state;
+    uint64_t h1, h2;
+    murmur3_128_init(&state, seed);
+    murmur3_128_update(&state, data, len);
+    murmur3_128_digest(&state, &h1, &h2);
+    return h1;
+}
+
+// (high << 64) | low as a Python int
+static PyObject *long_from_128(uint64_t high, uint64_t low)
+{
+    PyObject *result = NULL;
+    PyObject *high_obj = PyLong_FromUnsignedLongLong(high);
+    PyObject *low_obj = PyLong_FromUnsignedLongLong(low);
+    PyObject *shift = PyLong_FromLong(64);
+    if (high_obj != NULL && low_obj != NULL && shift != NULL) {
+        PyObject *shifted = PyNumber_Lshift(high_obj, shift);
+        if (shifted != NULL) {
+            result = PyNumber_Or(shifted, low_obj);
+            Py_DECREF(shifted);
+        }
+    }
+    Py_XDECREF(high_obj);
+    Py_XDECREF(low_obj);
+    Py_XDECREF(shift);
+    return result;
+}
+
+static PyObject *clandestined_murmur3_x64_128(PyObject *self, PyObject *args)
+{
+    PyObject *data;
+    const char *key;
+    Py_ssize_t len;
+    unsigned int seed = 0;
+    Py_buffer view;
+
+    if (!PyArg_ParseTuple(args, "O|I", &data, &seed)) {
+        return NULL;
+    }
+    if (get_key(data, &view, &key, &len) < 0) {
+        return NULL;
+    }
+
+    murmur3_128_state state;
+    uint64_t h1, h2;
+    if (len >= GIL_RELEASE_BYTES) {
+        Py_BEGIN_ALLOW_THREADS
+        murmur3_128_init(&state, seed);
+        murmur3_128_update(&state, key, len);
+        murmur3_128_digest(&state, &h1, &h2);
+        Py_END_ALLOW_THREADS
+    } else {
+        murmur3_128_init(&state, seed);
+        murmur3_128_update(&state, key, len);
+        murmur3_128_digest(&state, &h1, &h2);
+    }
+    PyBuffer_Release(&view);
+    return long_from_128(h2, h1);
+}
+
+// Ring hash engines, see clandestined/engines.py. Each node has a packed
+// state of the engine's size, made from its "<node>-" prefix by
+// engine_state, and a key scores (high, low) against it:
+//
+//   ENGINE_MURMUR3_32   the murmur3_32 prefix state, (hash, 0)
+//   ENGINE_MURMUR3_128  the murmur3_x64_128 prefix state, (h1, h2)
+//   ENGINE_MIX64        h1 of the prefix, (fmix64(node ^ h1 of key), 0)
+//
+// Scores compare as 128-bit ints. Weighted scores use the high 64 bits,
+// or the 32-bit hash.
+#define ENGINE_MURMUR3_32 0
+#define ENGINE_MURMUR3_128 1
+#define ENGINE_MIX64 2
+
+static Py_ssize_t engine_state_size(int engine)
+{
+    switch (engine) {
+    case ENGINE_MURMUR3_32:
+        return sizeof(murmur3_state);
+    case ENGINE_MURMUR3_128:
+        return sizeof(murmur3_128_state);
+    case ENGINE_MIX64:
+        return sizeof(uint64_t);
+    }
+    PyErr_Format(PyExc_ValueError, "unknown hash engine %d", engine);
+    return -1;
+}
+
+static int get_engine_states(int engine, PyObject *obj, Py_buffer *view,
+                             Py_ssize_t *n)
+{
+    Py_ssize_t size = engine_state_size(engine);
+    if (size < 0) {
+        return -1;
+    }
+    if (PyObject_GetBuffer(obj, view, PyBUF_SIMPLE) < 0) {
+        return -1;
+    }
+    if (view->len % size != 0) {
+        PyBuffer_Release(view);
+        PyErr_SetString(PyExc_TypeError,
+                        "states must be packed engine_state() values");
+        return -1;
+    }
+    *n = view->len / size;
+    return 0;
+}
+
+// per key work shared by every node, only mix64 has any
+static uint64_t engine_key_hash(int engine, const char *key, Py_ssize_t len,
+                                uint32_t seed)
+{
+    if (engine == ENGINE_MIX64) {
+        return murmur3_128_first(key, len, seed);
+    }
+    return 0;
+}
+
+static void engine_score(int engine, const char *states, Py_ssize_t i,
+                         const char *key, Py_ssize_t key_len,
+                         uint64_t key_hash, uint64_t *high, uint64_t *low)
+{
+    switch (engine) {
+    case ENGINE_MURMUR3_32:
+        *high = score_state(states, i, key, key_len);
+        *low = 0;
+        break;
+    case ENGINE_MURMUR3_128: {
+        murmur3_128_state state;
+        memcpy(&state, states + i * sizeof(state), sizeof(state));
+        murmur3_128_update(&state, key, key_len);
+        murmur3_128_digest(&state, high, low);
+        break;
+    }
+    case ENGINE_MIX64: {
+        uint64_t node;
+        memcpy(&node, states + i * sizeof(node), sizeof(node));
+        *high = fmix64(node ^ key_hash);
+        *low = 0;
+        break;
+    }
+    default:
+        *high = 0;
+        *low = 0;
+    }
+}
+
+// Logarithmic weighted score of a 64-bit hash, from its top 53 bits so the
+// mapping into (0, 1) is exact in a double.
+static double weighted_score64(uint64_t hash, double weight)
+{
+    return weight / -log(((hash >> 11) + 0.5) / 9007199254740992.0);
+}
+
+static Py_ssize_t best_engine(int engine, const char *states, Py_ssize_t n,
+                              const char *key, Py_ssize_t key_len,
+                              uint32_t seed, const double *weights, int *tied)
+{
+    uint64_t key_hash = engine_key_hash(engine, key, key_len, seed);
+    Py_ssize_t i;
+    Py_ssize_t winner = -1;
+    uint64_t high, low;
+    uint64_t best_high = 0, best_low = 0;
+    double high_score = -1;
+    *tied = 0;
+    for (i = 0; i < n; i++) {
+        engine_score(engine, states, i, key, key_len, key_hash, &high, &low);
+        if (weights) {
+            double score = engine == ENGINE_MURMUR3_32 ?
+                weighted_score((uint32_t) high, weights[i]) :
+                weighted_score64(high, weights[i]);
+            if (score > high_score) {
+                high_score = score;
+                winner = i;
+                *tied = 0;
+            } else if (score == high_score) {
+                *tied = 1;
+            }
+        } else if (winner < 0 || high > best_high ||
+                   (high == best_high && low > best_low)) {
+            best_high = high;
+            best_low = low;
+            winner = i;
+            *tied = 0;
+        } else if (high == best_high && low == best_low) {
+            *tied = 1;
+        }
+    }
+    return winner;
+}
+
+static PyObject *clandestined_engine_state(PyObject *self, PyObject *args)
+{
+    int engine;
+    const char *prefix;
+    Py_ssize_t len;
+    unsigned int seed = 0;
+
+    if (!PyArg_ParseTuple(args, "is#|I", &engine, &prefix, &len, &seed)) {
+        return NULL;
+    }
+
+    switch (engine) {
+    case ENGINE_MURMUR3_32: {
+        murmur3_state state;
+        murmur3_state_init(&state, seed);
+        murmur3_state_update(&state, prefix, len);
+        return PyBytes_FromStringAndSize((const char *) &state, sizeof(state));
+    }
+    case ENGINE_MURMUR3_128: {
+        murmur3_128_state state;
+        murmur3_128_init(&state, seed);
+        murmur3_128_update(&state, prefix, len);
+        return PyBytes_FromStringAndSize((const char *) &state, sizeof(state));
+    }
+    case ENGINE_MIX64: {
+        uint64_t node = murmur3_128_first(prefix, len, seed);
+        return PyBytes_FromStringAndSize((const char *) &node, sizeof(node));
+    }
+    }
+    PyErr_Format(PyExc_ValueError, "unknown hash engine %d", engine);
+    return NULL;
+}
+
+static PyObject *clandestined_engine_find_node(PyObject *self, PyObject *args)
+{
+    int engine;
+    PyObject *states_obj;
+    const char *key;
+    Py_ssize_t key_len;
+    unsigned int seed;
+    PyObject *weights_obj = NULL;
+
+    if (!PyArg_ParseTuple(args, "iOs#I|O", &engine, &states_obj, &key,
+                          &key_len, &seed, &weights_obj)) {
+        return NULL;
+    }
+
+    Py_buffer states_view;
+    Py_ssize_t n;
+    if (get_engine_states(engine, states_obj, &states_view, &n) < 0) {
+        return NULL;
+    }
+    if (n == 0) {
+        PyBuffer_Release(&states_view);
+        Py_RETURN_NONE;
+    }
+
+    Py_buffer weights_view;
+    const double *weights;
+    if (get_weights(weights_obj, n, &weights_view, &weights) < 0) {
+        PyBuffer_Release(&states_view);
+        return NULL;
+    }
+
+    int tied;
+    Py_ssize_t winner = best_engine(engine, states_view.buf, n, key, key_len,
+                                    seed, weights, &tied);
+
+    PyBuffer_Release(&weights_view);
+    PyBuffer_Release(&states_view);
+    return Py_BuildValue("(nO)", winner, tied ? Py_True : Py_False);
+}
+
+static PyObject *clandestined_engine_find_node_many(PyObject *self,
+                                                    PyObject *args)
+{
+    int engine;
+    PyObject *states_obj;
+    PyObject *keys;
+    unsigned int seed;
+    PyObject *weights_obj = NULL;
+
+    if (!PyArg_ParseTuple(args, "iOOI|O", &engine, &states_obj, &keys, &seed,
+                          &weights_obj)) {
+        return NULL;
+    }
+
+    Py_buffer states_view;
+    Py_ssize_t n;
+    if (get_engine_states(engine, states_obj, &states_view, &n) < 0) {
+        return NULL;
+    }
+    PyObject *key_seq = PySequence_Fast(keys, "engine_find_node_many expects an iterable of keys");
+    if (key_seq == NULL) {
+        PyBuffer_Release(&states_view);
+        return NULL;
+    }
+
+    Py_ssize_t key_count = PySequence_Fast_GET_SIZE(key_seq);
+    PyObject **key_items = PySequence_Fast_ITEMS(key_seq);
+    PyObject *result = NULL;
+    Py_buffer view;
+    Py_buffer weights_view;
+    const double *weights;
+    Py_ssize_t i;
+
+    weights_view.obj = NULL;
+    if (n == 0 && key_count > 0) {
+        PyErr_SetString(PyExc_ValueError, "engine_find_node_many requires at least one node");
+        goto done;
+    }
+    if (get_weights(weights_obj, n, &weights_view, &weights) < 0) {
+        goto done;
+    }
+
+    result = new_array("l", sizeof(long), key_count, &view);
+    if (result == NULL) {
+        goto done;
+    }
+    // pinned and scored a chunk at a time without the GIL, as in
+    // find_node_many
+    long *winners = (long *) view.buf;
+    const char *states = states_view.buf;
+    PyObject *key_objs[MANY_CHUNK];
+    Py_buffer key_views[MANY_CHUNK];
+    const char *chunk_keys[MANY_CHUNK];
+    Py_ssize_t chunk_lens[MANY_CHUNK];
+    Py_ssize_t start;
+    for (start = 0; start < key_count; start += MANY_CHUNK) {
+        Py_ssize_t count = key_count - start < MANY_CHUNK ?
+                           key_count - start : MANY_CHUNK;
+        Py_ssize_t total = 0;
+        for (i = 0; i < count; i++) {
+            key_objs[i] = key_str(key_items[start + i]);
+            if (key_objs[i] == NULL ||
+                    get_key(key_objs[i], &key_views[i], &chunk_keys[i],
+                            &chunk_lens[i]) < 0) {
+                Py_XDECREF(key_objs[i]);
+                while (i--) {
+                    PyBuffer_Release(&key_views[i]);
+                    Py_DECREF(key_objs[i]);
+                }
+                goto fail;
+            }
+            total += chunk_lens[i];
+        }
+        if ((total + count) * n >= GIL_RELEASE_BYTES) {
+            Py_BEGIN_ALLOW_THREADS
+            for (i = 0; i < count; i++) {
+                int tied;
+                Py_ssize_t winner = best_engine(engine, states, n,
+                                                chunk_keys[i], chunk_lens[i],
+                                                seed, weights, &tied);
+                winners[start + i] = tied ? -1 - winner : winner;
+            }
+            Py_END_ALLOW_THREADS
+        } else {
+            for (i = 0; i < count; i++) {
+                int tied;
+                Py_ssize_t winner = best_engine(engine, states, n,
+                                                chunk_keys[i], chunk_lens[i],
+                                                seed, weights, &tied);
+                winners[start + i] = tied ? -1 - winner : winner;
+            }
+        }
+        for (i = 0; i < count; i++) {
+            PyBuffer_Release(&key_views[i]);
+            Py_DECREF(key_objs[i]);
+        }
+    }
+    PyBuffer_Release(&view);
+    goto done;
+
+fail:
+    PyBuffer_Release(&view);
+    Py_CLEAR(result);
+done:
+    PyBuffer_Release(&weights_view);
+    Py_DECREF(key_seq);
+    PyBuffer_Release(&states_view);
+    return result;
+}
+
+static PyObject *clandestined_engine_scores(PyObject *self, PyObject *args)
+{
+    int engine;
+    PyObject *states_obj;
+    const char *key;
+    Py_ssize_t key_len;
+    unsigned int seed;
+
+    if (!PyArg_ParseTuple(args, "iOs#I", &engine, &states_obj, &key,
+                          &key_len, &seed)) {
+        return NULL;
+    }
+
+    Py_buffer states_view;
+    Py_ssize_t n;
+    if (get_engine_states(engine, states_obj, &states_view, &n) < 0) {
+        return NULL;
+    }
+
+    uint64_t key_hash = engine_key_hash(engine, key, key_len, seed);
+    PyObject *result = PyList_New(n);
+    Py_ssize_t i;
+    for (i = 0; result != NULL && i < n; i++) {
+        uint64_t high, low;
+        PyObject *score;
+        engine_score(engine, states_view.buf, i, key, key_len, key_hash,
+                     &high, &low);
+        if (engine == ENGINE_MURMUR3_128) {
+            score = long_from_128(high, low);
+        } else {
+            score = PyLong_FromUnsignedLongLong(high);
+        }
+        if (score == NULL) {
+            Py_CLEAR(result);
+        } else {
+            PyList_SET_ITEM(result, i, score);
+        }
+    }
+
+    PyBuffer_Release(&states_view);
+    return result;
+}
+
+// Take turns claiming each node's next free slot in its permutation until
+// the table is full. positions holds each node's next permutation entry,
+// size is prime so every permutation visits every slot.
+static void maglev_fill(long *table, Py_ssize_t size, Py_ssize_t n,
+                        Py_ssize_t *positions, const Py_ssize_t *skips,
+                        const double *weights, double max_weight,
+                        double *credits)
+{
+    Py_ssize_t filled = 0;
+    Py_ssize_t i;
+    for (i = 0; i < size; i++) {
+        table[i] = -1;
+    }
+    for (i = 0; i < n; i++) {
+        credits[i] = 0.0;
+    }
+    while (filled < size) {
+        for (i = 0; i < n && filled < size; i++) {
+            credits[i] += weights != NULL ? weights[i] / max_weight : 1.0;
+            while (credits[i] >= 1.0 && filled < size) {
+                Py_ssize_t slot = positions[i];
+                credits[i] -= 1.0;
+                while (table[slot] >= 0) {
+                    slot += skips[i];
+                    if (slot >= size) {
+                        slot -= size;
+                    }
+                }
+                table[slot] = i;
+                slot += skips[i];
+                positions[i] = slot >= size ? slot - size : slot;
+                filled++;
+            }
+        }
+    }
+}
+
+// Every skip in [1, size) is coprime to a prime size, so each node's
+// permutation visits every slot and maglev_fill always finishes.
+static int is_prime(Py_ssize_t number)
+{
+    Py_ssize_t divisor;
+    if (number < 2 || number % 2 == 0) {
+        return number == 2;
+    }
+    for (divisor = 3; divisor <= number / divisor; divisor += 2) {
+        if (number % divisor == 0) {
+            return 0;
+        }
+    }
+    return 1;
+}
+
+// Copy a sequence of ints in [low, size) into out.
+static int get_slots(PyObject *seq, Py_ssize_t *out, Py_ssize_t low,
+                     Py_ssize_t size, const char *name)
+{
+    Py_ssize_t n = PySequence_Fast_GET_SIZE(seq);
+    PyObject **items = PySequence_Fast_ITEMS(seq);
+    Py_ssize_t i;
+    for (i = 0; i < n; i++) {
+        Py_ssize_t value = PyNumber_AsSsize_t(items[i], PyExc_OverflowError);
+        if (value == -1 && PyErr_Occurred()) {
+            return -1;
+        }
+        if (value < low || value >= size) {
+            PyErr_Format(PyExc_ValueError, "maglev_table %s must be in [%zd, %zd)",
+                         name, low, size);
+            return -1;
+        }
+        out[i] = value;
+    }
+    return 0;
+}
+
+static PyObject *clandestined_maglev_table(PyObject *self, PyObject *args)
+{
+    PyObject *offsets_obj;
+    PyObject *skips_obj;
+    PyObject *weights_obj = NULL;
+    Py_ssize_t size;
+
+    if (!PyArg_ParseTuple(args, "OOn|O", &offsets_obj, &skips_obj, &size,
+                          &weights_obj)) {
+        return NULL;
+    }
+    if (!is_prime(size)) {
+        PyErr_SetString(PyExc_ValueError, "maglev_table size must be a prime");
+        return NULL;
+    }
+
+    PyObject *offsets_seq = NULL;
+    PyObject *skips_seq = NULL;
+    PyObject *result = NULL;
+    Py_ssize_t *positions = NULL;
+    Py_ssize_t *skips = NULL;
+    double *credits = NULL;
+    Py_buffer view;
+    Py_buffer weights_view;
+    const double *weights = NULL;
+    double max_weight = 1.0;
+    Py_ssize_t n;
+    Py_ssize_t i;
+
+    weights_view.obj = NULL;
+    offsets_seq = PySequence_Fast(offsets_obj, "maglev_table expects a sequence of offsets");
+    if (offsets_seq == NULL) {
+        goto done;
+    }
+    skips_seq = PySequence_Fast(skips_obj, "maglev_table expects a sequence of skips");
+    if (skips_seq == NULL) {
+        goto done;
+    }
+    n = PySequence_Fast_GET_SIZE(offsets_seq);
+    if (n == 0 || PySequence_Fast_GET_SIZE(skips_seq) != n) {
+        PyErr_SetString(PyExc_ValueError,
+                        "maglev_table requires one offset and skip per node, "
+                        "and at least one node");
+        goto done;
+    }
+    if (get_weights(weights_obj, n, &weights_view, &weights) < 0) {
+        goto done;
+    }
+    if (weights != NULL) {
+        max_weight = 0.0;
+        for (i = 0; i < n; i++) {
+            if (!(weights[i] > 0.0) || Py_IS_INFINITY(weights[i])) {
+                PyErr_SetString(PyExc_ValueError,
+                                "maglev_table weights must be positive and finite");
+                goto done;
+            }
+            if (weights[i] > max_weight) {
+                max_weight = weights[i];
+            }
+        }
+    }
+
+    positions = PyMem_Malloc(n * sizeof(Py_ssize_t));
+    skips = PyMem_Malloc(n * sizeof(Py_ssize_t));
+    credits = PyMem_Malloc(n * sizeof(double));
+    if (positions == NULL || skips == NULL || credits == NULL) {
+        PyErr_NoMemory();
+        goto done;
+    }
+    if (get_slots(offsets_seq, positions, 0, size, "offsets") < 0 ||
+            get_slots(skips_seq, skips, 1, size, "skips") < 0) {
+        goto done;
+    }
+
+    result = new_array("l", sizeof(long), size, &view);
+    if (result == NULL) {
+        goto done;
+    }
+    Py_BEGIN_ALLOW_THREADS
+    maglev_fill((long *) view.buf, size, n, positions, skips, weights,
+                max_weight, credits);
+    Py_END_ALLOW_THREADS
+    PyBuffer_Release(&view);
+
+done:
+    if (weights_view.obj != NULL) {
+        PyBuffer_Release(&weights_view);
+    }
+    PyMem_Free(positions);
+    PyMem_Free(skips);
+    PyMem_Free(credits);
+    Py_XDECREF(offsets_seq);
+    Py_XDECREF(skips_seq);
+    return result;
+}